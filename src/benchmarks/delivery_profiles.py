@@ -0,0 +1,100 @@
+# Throughput and latency of the delivery profiles against a broker
+#
+# Publishes a mix of commands as sent during a lab session, with the QoS of each
+# delivery profile, and measures how fast and how late they reach a subscriber.
+# Run from the src folder, against a local stand-in broker or the in-process loopback broker:
+#   python3 -m benchmarks.delivery_profiles --host localhost --messages 2000
+#   python3 -m benchmarks.delivery_profiles --loopback
+import argparse
+import itertools
+import statistics
+import threading
+import time
+from mqtt_clients.codec import JSON, decode, encode
+from mqtt_clients.delivery_policy import PROFILES, DeliveryPolicies
+from mqtt_clients.loopback import LoopbackTransport
+from mqtt_clients.transport import PahoTransport
+
+TOPIC = 'ttm4115/project/team10/benchmark/delivery'
+
+# Commands in the proportions of a lab session, most of them superseding
+COMMAND_MIX = ['report_current_task'] * 4 + ['queue_snapshot'] * 3 + \
+    ['ta_heartbeat'] * 2 + ['request_help', 'getting_help', 'received_help']
+
+
+def connect(transport, protocol):
+    client = transport.create_client(protocol=protocol)
+    connected = threading.Event()
+    # MQTT 5 passes the properties as well
+    client.on_connect = lambda client, userdata, flags, rc, *properties: connected.set()
+    transport.connect(client)
+    client.loop_start()
+    connected.wait(5)
+    return client
+
+
+def run(profile, transport, nr_of_messages, timeout):
+    policies = DeliveryPolicies(profile)
+
+    latencies = []
+    done = threading.Event()
+
+    def on_message(client, userdata, msg):
+        sent = decode(msg.payload)['body']['sent']
+        latencies.append(time.perf_counter() - sent)
+        if len(latencies) == nr_of_messages:
+            done.set()
+
+    subscriber = connect(transport, policies.protocol)
+    subscriber.on_message = on_message
+    subscribed = threading.Event()
+    subscriber.on_subscribe = lambda client, userdata, mid, granted_qos, *properties: subscribed.set()
+    subscriber.subscribe(TOPIC, qos=2)
+    subscribed.wait(5)
+
+    publisher = connect(transport, policies.protocol)
+
+    start = time.perf_counter()
+    for number, command in zip(range(nr_of_messages), itertools.cycle(COMMAND_MIX)):
+        message = {"command": command, "header": "benchmark",
+                   "body": {"number": number, "sent": time.perf_counter()}}
+        publisher.publish(TOPIC, encode(message, JSON),
+                          **policies.publish_arguments(command))
+
+    done.wait(timeout)
+    elapsed = time.perf_counter() - start
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    subscriber.loop_stop()
+    subscriber.disconnect()
+
+    return len(latencies), elapsed, latencies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Throughput and latency of the delivery profiles")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30,
+                        help="seconds to wait for the messages of a profile")
+    parser.add_argument("--loopback", action="store_true",
+                        help="use the in-process loopback broker instead of the broker at host and port")
+    args = parser.parse_args()
+
+    transport = LoopbackTransport() if args.loopback else PahoTransport(args.host, args.port)
+
+    print(f"{'profile':<18}{'received':>10}{'msg/s':>10}{'median ms':>12}{'p95 ms':>10}")
+    for profile in PROFILES:
+        received, elapsed, latencies = run(
+            profile, transport, args.messages, args.timeout)
+
+        if not latencies:
+            print(f"{profile:<18}{received:>10}{'-':>10}{'-':>12}{'-':>10}")
+            continue
+
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{profile:<18}{received:>10}{received / elapsed:>10.0f}"
+              f"{statistics.median(latencies) * 1000:>12.1f}{p95 * 1000:>10.1f}")
@@ -0,0 +1,155 @@
+# Throughput of the state machines of many groups on one driver or sharded over a pool
+#
+# A server hosting the status light and group state machines of every group gets
+# a storm of task starts. The machines run on one stmpy driver, on a pool of
+# drivers in threads, or on a pool of drivers in worker processes, with the time
+# the events waited in the queue of every driver.
+# Run from the src folder:
+#   python3 -m benchmarks.driver_pool --groups 500 --rounds 20 --drivers 4
+import argparse
+import logging
+import time
+from benchmarks.process_driver_pool import ProcessDriverPool
+from state_machines.driver_pool import DriverPool
+from state_machines.group_stm import GroupSTM
+from state_machines.status_light_stm import StatusLight
+from state_machines.timer_service import SystemClock, TimedDriver, TimerService
+
+
+def durations(rounds):
+    # Minutes of a task for every task start, the light timers do not expire during the benchmark
+    return ["30"] * (rounds + 1)
+
+
+class HostedGroup:
+    """ Stand-in for the group component called by the machines of a group """
+
+    def set_status_light(self, image_path):
+        pass
+
+    def request_help(self):
+        pass
+
+    def receiving_help(self):
+        pass
+
+    def received_help(self):
+        pass
+
+
+def names(nr_of_groups):
+    return [(f"team_{number}_status_light_stm", f"team_{number}_ta_stm")
+            for number in range(1, nr_of_groups + 1)]
+
+
+def storm(send, groups, rounds):
+    # Every group gets its tasks and starts a task again and again
+    for light, group in groups:
+        send('tasks_received', group)
+    for _ in range(rounds):
+        for light, group in groups:
+            send('task_start', light)
+            send('task_start', group)
+
+
+def run_threads(nr_of_groups, rounds, drivers, logger):
+    timers = TimerService(SystemClock(), logger)
+    if drivers == 0:
+        pool = TimedDriver(timers)
+        shards = [pool]
+    else:
+        pool = DriverPool(timers, logger, size=drivers)
+        shards = pool.drivers
+    pool.start(keep_active=True)
+
+    groups = names(nr_of_groups)
+    for light, group in groups:
+        component = HostedGroup()
+        pool.add_machine(StatusLight.create_machine(
+            team=light, durations=durations(rounds), component=component, logger=logger))
+        pool.add_machine(GroupSTM.create_machine(team=group, component=component, logger=logger))
+
+    while pool.pending:
+        time.sleep(0.001)
+
+    start = time.perf_counter()
+    storm(pool.send, groups, rounds)
+    sent = time.perf_counter() - start
+
+    depth = 0
+    while pool.pending:
+        depth = max(depth, max(driver.pending for driver in shards))
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    stats = [driver.stats() for driver in shards]
+    pool.stop()
+    timers.stop()
+    return sent, elapsed, depth, stats
+
+
+def run_processes(nr_of_groups, rounds, drivers, logger):
+    pool = ProcessDriverPool(logger, size=drivers)
+    pool.start()
+
+    groups = names(nr_of_groups)
+    for light, group in groups:
+        component = HostedGroup()
+        pool.add_machine(light, StatusLight.create_machine, component, team=light,
+                         durations=durations(rounds))
+        pool.add_machine(group, GroupSTM.create_machine, component, team=group)
+
+    # The initial transitions of the machines
+    expected = 2 * nr_of_groups
+    while sum(stats["handled"] for stats in pool.stats()) < expected:
+        time.sleep(0.01)
+
+    start = time.perf_counter()
+    storm(pool.send, groups, rounds)
+    sent = time.perf_counter() - start
+
+    expected += nr_of_groups * (1 + 2 * rounds)
+    depth = 0
+    while True:
+        stats = pool.stats()
+        depth = max(depth, max(shard["depth"] for shard in stats))
+        if sum(shard["handled"] for shard in stats) >= expected:
+            break
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    pool.stop()
+    return sent, elapsed, depth, stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measure the state machines of many groups on one driver or a pool of drivers")
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20, help="task starts of every group")
+    parser.add_argument("--drivers", type=int, default=4, help="drivers of the pools")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+
+    events = args.groups * (1 + 2 * args.rounds)
+    print(f"{args.groups} groups, {events} events")
+    print(f"{'drivers':<20}{'sent s':>8}{'handled s':>11}{'events/s':>10}{'peak depth':>12}")
+
+    runs = [("1 driver", run_threads, 0),
+            (f"{args.drivers} threads", run_threads, args.drivers),
+            (f"{args.drivers} processes", run_processes, args.drivers)]
+    results = []
+    for label, run, drivers in runs:
+        sent, elapsed, depth, stats = run(args.groups, args.rounds, drivers, logger)
+        results.append((label, stats))
+        print(f"{label:<20}{sent:>8.2f}{elapsed:>11.2f}{events / elapsed:>10.0f}{depth:>12}")
+
+    # Seconds in the queue of the driver, and for the workers on the way from the pool to the worker
+    print(f"{'driver':<20}{'machines':>9}{'handled':>9}{'p50 ms':>8}{'p95 ms':>8}{'max ms':>8}{'transit ms':>12}")
+    for label, stats in results:
+        for index, shard in enumerate(stats):
+            transit = f"{shard['transit_p50'] * 1000:>12.1f}" if "transit_p50" in shard else ""
+            print(f"{label + ' #' + str(index):<20}{shard['machines']:>9}{shard['handled']:>9}"
+                  f"{shard['p50'] * 1000:>8.1f}{shard['p95'] * 1000:>8.1f}{shard['max'] * 1000:>8.1f}{transit}")
@@ -0,0 +1,88 @@
+# Throughput of the headless TA engine handling the messages of a lab session
+#
+# Run from the src folder:
+#   python3 -m benchmarks.engine_throughput --groups 500
+import argparse
+import logging
+import time
+from components.ta_engine import TaEngine
+
+
+class NullMqttClient:
+    """ Stand-in for the MQTT client of the engine, counting the published messages """
+
+    def __init__(self):
+        self.ta_name = None
+        self.ta_mqtt_endpoint = None
+        self.published = 0
+        # The engine stops the network loop of the paho client on shutdown
+        self.mqtt_client = self
+
+    def loop_stop(self):
+        pass
+
+    def is_leader(self):
+        # The engine publishes the queue and the tasks for late groups as the leader
+        return True
+
+    def __getattr__(self, name):
+        # Every publishing method of the TaMqttClient is counted
+        def publish(*args, **kwargs):
+            self.published += 1
+        return publish
+
+
+def run(nr_of_groups, nr_of_tasks, logger):
+    mqtt_client = NullMqttClient()
+    engine = TaEngine(logger, mqtt_client=mqtt_client)
+    engine.login("Benchmark")
+
+    groups = [f"Team {number}" for number in range(1, nr_of_groups + 1)]
+    results = {}
+
+    def measure(name, handler, bodies):
+        start = time.perf_counter()
+        for body in bodies:
+            handler(body['group'].lower().replace(" ", "_"), body)
+        elapsed = time.perf_counter() - start
+        results[name] = (len(bodies), elapsed)
+
+    measure("group_present", engine.handle_group_present,
+            [{"group": group} for group in groups])
+
+    for task in range(nr_of_tasks):
+        engine.add_task(f"Task {task + 1}", "10")
+    engine.submit_tasks()
+
+    measure("report_current_task", engine.handle_group_progress,
+            [{"group": group, "current_task": str(task + 1)}
+             for task in range(nr_of_tasks) for group in groups])
+
+    measure("request_help", engine.handle_request_help,
+            [{"group": group, "description": "Help", "time": "12:00:00"}
+             for group in groups])
+
+    measure("tasks_done", engine.handle_group_done,
+            [{"group": group} for group in groups])
+
+    engine.stop()
+
+    return results, mqtt_client.published
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Throughput of the headless TA engine")
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=5)
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+
+    results, published = run(args.groups, args.tasks, logger)
+
+    print(f"{'command':<22}{'messages':>10}{'seconds':>12}{'msg/s':>14}")
+    for command, (count, elapsed) in results.items():
+        print(f"{command:<22}{count:>10}{elapsed:>12.4f}{count / elapsed:>14.0f}")
+    print(f"published {published} messages")
@@ -0,0 +1,98 @@
+# Time for the TA to catch up with a storm of progress reports from the groups
+#
+# Dispatches the messages straight into the command dispatcher of the TA, without
+# a broker, handled directly by the network loop or through the inbound stage.
+# Run from the src folder:
+#   python3 -m benchmarks.inbound_storm --groups 100 --reports 50
+import argparse
+import logging
+import time
+from benchmarks.engine_throughput import NullMqttClient
+from components.ta_engine import TaEngine
+from mqtt_clients.codec import JSON, MessageCodec, encode
+from mqtt_clients.command_dispatcher import CommandDispatcher
+from mqtt_clients.inbound_stage import InboundStage
+
+TOPIC = 'ttm4115/project/team10/api/v1/progress/#'
+
+
+class Message:
+    """ Stand-in for a received paho message """
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+        self.retain = False
+
+
+class NullPahoClient:
+    def message_callback_add(self, topic_filter, callback):
+        self.callback = callback
+
+
+def create_engine(logger, listener_delay):
+    engine = TaEngine(logger, mqtt_client=NullMqttClient())
+    engine.login("Benchmark")
+
+    # Every change of a group is rendered by the GUI, which takes some time
+    engine.add_listener(lambda event, data: time.sleep(listener_delay))
+
+    return engine
+
+
+def run(nr_of_groups, nr_of_reports, listener_delay, inbound, logger):
+    engine = create_engine(logger, listener_delay)
+    paho_client = NullPahoClient()
+    dispatcher = CommandDispatcher(
+        paho_client, MessageCodec(), logger, inbound=inbound)
+    dispatcher.register(TOPIC, "report_current_task",
+                        engine.handle_group_progress, coalesce="group_status")
+
+    groups = [f"Team {number}" for number in range(1, nr_of_groups + 1)]
+    for group in groups:
+        engine.handle_group_present(group, {"group": group})
+
+    messages = [Message(f"ttm4115/project/team10/api/v1/progress/{group}", encode({
+        "command": "report_current_task", "header": group, "body": {"group": group, "current_task": str(report)}}, JSON))
+        for report in range(nr_of_reports) for group in groups]
+
+    start = time.perf_counter()
+    for message in messages:
+        paho_client.callback(None, None, message)
+    received = time.perf_counter() - start
+
+    # Wait until the TA has caught up with the storm
+    if inbound is not None:
+        while inbound.depth() > 0 or inbound.handled + inbound.coalesced + inbound.dropped < inbound.received:
+            time.sleep(0.001)
+    caught_up = time.perf_counter() - start
+
+    handled = len(messages) if inbound is None else inbound.handled
+    latest = all(engine.group_status(group).status == f"Task {nr_of_reports - 1} in progress"
+                 for group in groups)
+
+    if inbound is not None:
+        inbound.stop()
+    engine.stop()
+
+    return len(messages), handled, received, caught_up, latest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time for the TA to catch up with a storm of progress reports")
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--reports", type=int, default=50,
+                        help="progress reports of every group in the storm")
+    parser.add_argument("--listener-delay", type=float, default=0.0002,
+                        help="seconds spent by the GUI on every change")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+
+    print(f"{'handling':<10}{'messages':>10}{'handled':>10}{'network s':>12}{'caught up s':>13}{'latest':>8}")
+    for name, inbound in [("direct", None), ("inbound", InboundStage(logger))]:
+        messages, handled, received, caught_up, latest = run(
+            args.groups, args.reports, args.listener_delay, inbound, logger)
+        print(f"{name:<10}{messages:>10}{handled:>10}{received:>12.3f}{caught_up:>13.3f}{str(latest):>8}")
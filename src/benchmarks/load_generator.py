@@ -0,0 +1,351 @@
+# Load generator simulating a lab session with many groups and TAs, with end-to-end latencies
+#
+# Runs TA engines and simulated groups with the real MQTT clients and message formats.
+# Every group goes through a lab session: present, tasks, progress reports, a help
+# request, getting help and received help. The TAs help the groups in the queue.
+# The groups are spread over a pool of processes against a broker, or run in this
+# process against the in-process loopback broker. Latencies are measured from the
+# wall clock time a message is sent to the time it is handled, so all the processes
+# must run on the same machine.
+# Run from the src folder:
+#   python3 -m benchmarks.load_generator --groups 20 --tas 2 --loopback
+#   python3 -m benchmarks.load_generator --groups 500 --tas 3 --processes 8 --host localhost
+import argparse
+import logging
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from components.ta_engine import TaEngine, TaEngineError
+from mqtt_clients.group_mqtt_client import GroupMqttClient
+from mqtt_clients.loopback import LoopbackTransport
+from mqtt_clients.transport import PahoTransport
+
+# Groups in a lab session, as NR_OF_TEAMS of the group client
+NR_OF_TEAMS = 20
+
+# Events of the messages, matched on the command and key of the message
+SENT = 'sent'
+RECEIVED = 'received'
+
+
+class Recorder:
+    """ Records the wall clock time of every sent and handled message """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = []
+
+    def record(self, command, key, event):
+        with self._lock:
+            self.events.append((command, key, event, time.time()))
+
+
+class SimulatedGroup:
+    """ Component of a group client going through a lab session without a GUI """
+
+    def __init__(self, team, transport, recorder, nr_of_tasks, task_time, logger):
+        self.team = team
+        self.recorder = recorder
+        self.nr_of_tasks = nr_of_tasks
+        self.task_time = task_time
+
+        self.tasks_received = threading.Event()
+        self.getting_help = threading.Event()
+        self.received_help = threading.Event()
+
+        self.client = GroupMqttClient(self, logger, transport=transport)
+        self.client.team_text = team
+        self.client.team_mqtt_endpoint = team.lower().replace(" ", "_")
+        self.client.mqtt_client.loop_start()
+
+    # Called by the MQTT client
+
+    def handle_recieve_tasks(self, payload):
+        if not self.tasks_received.is_set():
+            self.recorder.record("submit_tasks", self.team, RECEIVED)
+            self.tasks_received.set()
+
+    def handle_queue_snapshot(self, body):
+        pass
+
+    def handle_getting_help(self, body):
+        self.recorder.record("getting_help", self.team, RECEIVED)
+        self.getting_help.set()
+
+    def handle_received_help(self, body):
+        self.recorder.record("received_help", self.team, RECEIVED)
+        self.received_help.set()
+
+    def handle_ta_presence(self, body, retained=False):
+        pass
+
+    # The lab session
+
+    def run(self, help_after, deadline):
+        while not self.client.connected and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.recorder.record("group_present", self.team, SENT)
+        self.client.join()
+
+        if not self.tasks_received.wait(max(0, deadline - time.time())):
+            return
+
+        for task in range(1, self.nr_of_tasks + 1):
+            time.sleep(random.uniform(0, 2 * self.task_time))
+
+            if task == help_after:
+                self.recorder.record("request_help", self.team, SENT)
+                self.client.handle_request_help({
+                    "group": self.team, "description": f"Help with task {task}",
+                    "time": time.strftime('%H:%M:%S'), "id": uuid.uuid4().hex})
+
+                if not self.received_help.wait(max(0, deadline - time.time())):
+                    return
+
+            self.recorder.record("report_current_task", (self.team, task), SENT)
+            self.client.handle_task_done(
+                {"group": self.team, "current_task": str(task)})
+
+        self.recorder.record("tasks_done", self.team, SENT)
+        self.client.handle_all_tasks_done({"group": self.team})
+
+    def stop(self):
+        self.client.leave()
+        self.client.mqtt_client.loop_stop()
+
+
+def run_groups(teams, transport, nr_of_tasks, task_time, deadline):
+    """ Run the lab session of the given groups, each in its own thread, and return the events """
+    logger = logging.getLogger(__name__)
+    recorder = Recorder()
+
+    # Spread the help requests over the session
+    groups = [SimulatedGroup(team, transport, recorder, nr_of_tasks, task_time, logger)
+              for team in teams]
+    threads = [threading.Thread(target=group.run, args=(random.randint(1, nr_of_tasks), deadline))
+               for group in groups]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Give the last messages time to reach the TAs
+    time.sleep(0.5)
+
+    for group in groups:
+        group.stop()
+
+    return recorder.events
+
+
+def run_groups_on_broker(teams, host, port, nr_of_tasks, task_time, deadline):
+    # Entry point of the worker processes, every process connects on its own
+    return run_groups(teams, PahoTransport(host, port), nr_of_tasks, task_time, deadline)
+
+
+def instrument_ta(engine, recorder, handled):
+    """ Record the messages sent and handled by a TA, before it logs in and registers its handlers """
+
+    def received(handler, command, key):
+        def wrapper(header, body, **kwargs):
+            handled[engine.ta_name] += 1
+            recorder.record(command, key(body), RECEIVED)
+            return handler(header, body, **kwargs)
+        return wrapper
+
+    engine.handle_group_present = received(
+        engine.handle_group_present, "group_present", lambda body: body['group'])
+    engine.handle_request_help = received(
+        engine.handle_request_help, "request_help", lambda body: body['group'])
+    engine.handle_group_progress = received(
+        engine.handle_group_progress, "report_current_task", lambda body: (body['group'], int(body['current_task'])))
+    engine.handle_group_done = received(
+        engine.handle_group_done, "tasks_done", lambda body: body['group'])
+
+    mqtt_client = engine.ta_mqtt_client
+
+    def sent(method, command):
+        def wrapper(group, *args):
+            recorder.record(command, group, SENT)
+            return method(group, *args)
+        return wrapper
+
+    mqtt_client.send_tasks_to_group = sent(
+        mqtt_client.send_tasks_to_group, "submit_tasks")
+    mqtt_client.report_getting_help = sent(
+        mqtt_client.report_getting_help, "getting_help")
+    mqtt_client.report_received_help = sent(
+        mqtt_client.report_received_help, "received_help")
+
+
+def help_groups(engine, help_time, helped, stopped):
+    """ Help the first group in the queue, one at a time, until stopped """
+    while not stopped.is_set():
+        entries = engine.help_queue_entries()
+        if engine.helping_group or engine.helping_request is not None or not entries:
+            time.sleep(0.005)
+            continue
+
+        request, _ = entries[0]
+        try:
+            engine.assign_getting_help(request)
+        except TaEngineError:
+            continue
+
+        time.sleep(random.uniform(0, 2 * help_time))
+
+        # Another TA may have claimed the request first
+        try:
+            engine.assign_got_help(request)
+            helped[engine.ta_name] += 1
+        except TaEngineError:
+            pass
+
+        # Wait for the state machine to finish helping
+        while engine.helping_group and not stopped.is_set():
+            time.sleep(0.005)
+
+
+def latencies(events):
+    """ Get the latencies of every command, matching the sent and received events on their key """
+    sent = {}
+    received = defaultdict(list)
+
+    for command, key, event, at in events:
+        if event == SENT:
+            # Messages sent again, such as by two TAs helping the same group, count from the first
+            sent.setdefault((command, key), at)
+        else:
+            received[(command, key)].append(at)
+
+    result = defaultdict(list)
+    for (command, key), at in sent.items():
+        # Every TA handles the messages of the groups, only the first handling counts
+        handled = received.get((command, key))
+        if handled:
+            result[command].append(min(handled) - at)
+
+    return result, Counter(command for command, _ in sent)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(args, logger):
+    transport = LoopbackTransport() if args.loopback else PahoTransport(args.host, args.port)
+    recorder = Recorder()
+    handled = defaultdict(int)
+    helped = defaultdict(int)
+
+    # The TAs, one of them submitting the tasks
+    engines = [TaEngine(logger, transport=transport) for _ in range(args.tas)]
+    for number, engine in enumerate(engines, start=1):
+        instrument_ta(engine, recorder, handled)
+        engine.login(f"TA {number}")
+
+    for number in range(1, args.tasks + 1):
+        engines[0].add_task(f"Task {number}", "10")
+
+    # Late groups get their tasks from the leader, elected after the first heartbeats
+    while not any(engine.ta_mqtt_client.is_leader() for engine in engines):
+        time.sleep(0.1)
+
+    stopped = threading.Event()
+    helpers = [threading.Thread(target=help_groups, args=(engine, args.help_time, helped, stopped))
+               for engine in engines]
+    for helper in helpers:
+        helper.start()
+
+    teams = [f"Team {number}" for number in range(1, args.groups + 1)]
+    start = time.time()
+    deadline = start + args.timeout
+
+    if args.loopback:
+        results = []
+        session = threading.Thread(target=lambda: results.append(
+            run_groups(teams, transport, args.tasks, args.task_time, deadline)))
+        session.start()
+    else:
+        chunks = [teams[index::args.processes] for index in range(args.processes)]
+        # Fresh processes, not forked from the threads of the TAs
+        pool = multiprocessing.get_context("spawn").Pool(args.processes)
+        session = pool.starmap_async(run_groups_on_broker, [
+            (chunk, args.host, args.port, args.tasks, args.task_time, deadline) for chunk in chunks if chunk])
+
+    # The tasks are submitted once the groups are present, groups joining later get them from the leader
+    while len(engines[0].group_status_rows()) < args.groups and time.time() < deadline:
+        time.sleep(0.01)
+
+    for group, _ in engines[0].group_status_rows():
+        recorder.record("submit_tasks", group, SENT)
+    engines[0].submit_tasks()
+
+    if args.loopback:
+        session.join()
+    else:
+        results = session.get()
+        pool.close()
+    events = [event for result in results for event in result]
+
+    elapsed = time.time() - start
+
+    stopped.set()
+    for helper in helpers:
+        helper.join()
+    for engine in engines:
+        engine.stop()
+
+    return events + recorder.events, elapsed, engines, handled, helped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Lab session with simulated groups and TAs, reporting end-to-end latencies")
+    parser.add_argument("--groups", type=int, default=NR_OF_TEAMS)
+    parser.add_argument("--tas", type=int, default=2)
+    parser.add_argument("--tasks", type=int, default=3, help="tasks of every group")
+    parser.add_argument("--task-time", type=float, default=0.5,
+                        help="mean seconds a group works on a task")
+    parser.add_argument("--help-time", type=float, default=0.05,
+                        help="mean seconds a TA helps a group")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="processes running the groups, against a broker")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--loopback", action="store_true",
+                        help="run the groups in this process against the in-process loopback broker")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="seconds the groups have to finish the lab session")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+
+    events, elapsed, engines, handled, helped = run(args, logger)
+    result, counts = latencies(events)
+
+    print(f"{args.groups} groups, {args.tas} TAs, {args.tasks} tasks in {elapsed:.1f} s")
+    print(f"{'command':<22}{'sent':>7}{'handled':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for command in ["group_present", "submit_tasks", "report_current_task", "request_help",
+                    "getting_help", "received_help", "tasks_done"]:
+        values = result.get(command, [])
+        if not values:
+            print(f"{command:<22}{counts.get(command, 0):>7}{0:>9}")
+            continue
+
+        print(f"{command:<22}{counts.get(command, 0):>7}{len(values):>9}"
+              f"{statistics.median(values) * 1000:>9.1f}{percentile(values, 0.95) * 1000:>9.1f}"
+              f"{percentile(values, 0.99) * 1000:>9.1f}{max(values) * 1000:>9.1f}")
+
+    print(f"{'TA':<10}{'handled':>9}{'msg/s':>9}{'helped':>8}{'helps/s':>9}")
+    for engine in engines:
+        print(f"{engine.ta_name:<10}{handled[engine.ta_name]:>9}{handled[engine.ta_name] / elapsed:>9.1f}"
+              f"{helped[engine.ta_name]:>8}{helped[engine.ta_name] / elapsed:>9.2f}")
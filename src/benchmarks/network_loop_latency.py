@@ -0,0 +1,112 @@
+# Round trip latency of the MQTT network loop running in its own thread or in the Tk event loop
+#
+# Needs a running MQTT broker, run from the src folder:
+#   python3 -m benchmarks.network_loop_latency --host localhost --messages 1000
+import argparse
+import logging
+import statistics
+import struct
+import threading
+import time
+import tkinter
+import paho.mqtt.client as mqtt
+from mqtt_clients.tk_network_loop import NETWORK_LOOP_THREAD, NETWORK_LOOP_TK, TkNetworkLoop
+
+BENCHMARK_TOPIC = 'ttm4115/project/team10/benchmark/network_loop'
+
+
+def run_thread(host, port, messages, interval):
+    """ Publish to ourselves with the network loop in its own thread """
+    latencies = []
+    done = threading.Event()
+
+    def on_message(client, userdata, msg):
+        latencies.append(time.perf_counter() -
+                         struct.unpack('d', msg.payload)[0])
+        if len(latencies) == messages:
+            done.set()
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(host, port)
+    client.subscribe(BENCHMARK_TOPIC, qos=0)
+    client.loop_start()
+    # Let the subscription settle
+    time.sleep(0.5)
+
+    for _ in range(messages):
+        client.publish(BENCHMARK_TOPIC, struct.pack(
+            'd', time.perf_counter()), qos=0)
+        time.sleep(interval)
+
+    done.wait(timeout=10)
+    client.loop_stop()
+    client.disconnect()
+
+    return latencies
+
+
+def run_tk(host, port, messages, interval, logger):
+    """ Publish to ourselves with the network loop in the Tk event loop """
+    latencies = []
+    # A Tcl interpreter without any window, the event loop is the same as for the GUI
+    root = tkinter.Tcl()
+
+    def on_message(client, userdata, msg):
+        latencies.append(time.perf_counter() -
+                         struct.unpack('d', msg.payload)[0])
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(host, port)
+    client.subscribe(BENCHMARK_TOPIC, qos=0)
+
+    network_loop = TkNetworkLoop(client, logger)
+    network_loop.start(root)
+
+    published = [0]
+
+    def publish():
+        client.publish(BENCHMARK_TOPIC, struct.pack(
+            'd', time.perf_counter()), qos=0)
+        published[0] += 1
+        if published[0] < messages:
+            root.after(int(interval * 1000), publish)
+
+    # Let the subscription settle
+    root.after(500, publish)
+
+    deadline = time.monotonic() + 10 + messages * interval
+    while len(latencies) < messages and time.monotonic() < deadline:
+        root.tk.dooneevent()
+
+    network_loop.stop()
+    client.disconnect()
+
+    return latencies
+
+
+def report(mode, latencies):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{mode:<8}{len(latencies):>10}{statistics.mean(latencies):>10.3f}"
+          f"{quantiles[49]:>10.3f}{quantiles[94]:>10.3f}{quantiles[98]:>10.3f}{latencies[-1]:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Round trip latency of the MQTT network loop modes")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=0.005,
+                        help="seconds between the published messages")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+
+    print(f"{'mode':<8}{'messages':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    report(NETWORK_LOOP_THREAD, run_thread(
+        args.host, args.port, args.messages, args.interval))
+    report(NETWORK_LOOP_TK, run_tk(
+        args.host, args.port, args.messages, args.interval, logger))
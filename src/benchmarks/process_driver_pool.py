@@ -0,0 +1,155 @@
+# Pool of stmpy drivers in worker processes, for measuring the machines of many groups
+#
+# The machines of a shard run on a driver in a worker process of their own, so
+# their transitions run in parallel. Used by benchmarks.driver_pool, next to the
+# DriverPool of the threads.
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from state_machines.driver_pool import shard_of
+from state_machines.timer_service import SystemClock, TimedDriver, TimerService
+
+
+class _ComponentProxy:
+    """ Stand-in for the component of a machine in a worker process, forwarding every call to the pool """
+
+    def __init__(self, stm_id, outbox):
+        self._stm_id = stm_id
+        self._outbox = outbox
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self._outbox.put(('call', self._stm_id, name, args, kwargs))
+        return call
+
+
+def _run_worker(index, inbox, outbox, latency_samples):
+    # Entry point of a worker process, running the machines of one shard on a driver of its own
+    logger = logging.getLogger(__name__)
+    timers = TimerService(SystemClock(), logger)
+    driver = TimedDriver(timers, latency_samples=latency_samples)
+    driver.start(keep_active=True)
+
+    # Seconds from sending a message in the pool to its arrival in the worker
+    transit = deque(maxlen=latency_samples)
+
+    while True:
+        message = inbox.get()
+        kind = message[0]
+
+        if kind == 'send':
+            _, stm_id, message_id, args, kwargs, sent = message
+            transit.append(time.monotonic() - sent)
+            driver.send(message_id, stm_id, args=args, kwargs=kwargs)
+        elif kind == 'add':
+            _, stm_id, factory, arguments = message
+            driver.add_machine(factory(component=_ComponentProxy(stm_id, outbox), logger=logger, **arguments))
+        elif kind == 'stats':
+            stats = driver.stats()
+            ordered = sorted(transit)
+            stats["transit_p50"] = ordered[len(ordered) // 2] if ordered else 0.0
+            stats["transit_max"] = ordered[-1] if ordered else 0.0
+            outbox.put(('stats', index, stats))
+        elif kind == 'stop':
+            driver.stop()
+            timers.stop()
+            outbox.put(('stopped', index, None))
+            return
+
+
+class ProcessDriverPool:
+    """ Drivers in worker processes, each running the machines whose name hashes to it
+
+    A machine is created in its worker by a factory, such as StatusLight.create_machine,
+    called with the given arguments, a logger and a stand-in for its component.
+    The calls of the machine to its component come back to the pool, where a thread
+    calls the component, so the component stays in this process. Return values of
+    these calls are lost, the machines of the groups and TAs do not use them.
+
+    Every worker runs the timers of its machines on the real clock. Latencies are
+    measured on the monotonic clock, shared by the processes of one machine.
+
+    Only for measuring: the pool is no stand-in for a driver, the machines are
+    created from factories, and the injected clock and timer service of the
+    components are not used. The TaEngine and GroupComponent take a DriverPool.
+    """
+
+    def __init__(self, logger, size=4, latency_samples=4096):
+        self._logger: logging.Logger = logger
+        context = multiprocessing.get_context('spawn')
+
+        self._inboxes = [context.Queue() for _ in range(size)]
+        self._outbox = context.Queue()
+        self._workers = [context.Process(target=_run_worker, args=(index, inbox, self._outbox, latency_samples),
+                                         daemon=True)
+                         for index, inbox in enumerate(self._inboxes)]
+
+        # Components of the machines, called on the thread of the pool
+        self._components = {}
+        # Answers of the workers to requests for their stats
+        self._answers = {}
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        self._thread.start()
+
+    def _inbox(self, stm_id):
+        return self._inboxes[shard_of(stm_id, len(self._inboxes))]
+
+    def add_machine(self, stm_id, factory, component, **arguments):
+        """ Create a machine in the worker of its name with factory(component=..., logger=..., **arguments) """
+        self._components[stm_id] = component
+        self._inbox(stm_id).put(('add', stm_id, factory, arguments))
+
+    def send(self, message_id, stm_id, args=[], kwargs={}):
+        self._inbox(stm_id).put(('send', stm_id, message_id, args, kwargs, time.monotonic()))
+
+    def _receive(self):
+        while True:
+            message = self._outbox.get()
+            kind, key, data = message[0], message[1], message[2:]
+
+            if kind == 'call':
+                name, args, kwargs = data
+                try:
+                    getattr(self._components[key], name)(*args, **kwargs)
+                except Exception:
+                    self._logger.exception(f'Call of {name} by machine {key} failed')
+            else:
+                with self._condition:
+                    self._answers[(kind, key)] = data[0]
+                    self._condition.notify_all()
+
+    def _ask(self, request, answer, timeout):
+        # Send the request to every worker and wait for their answers
+        keys = [(answer, index) for index in range(len(self._inboxes))]
+        with self._condition:
+            for key in keys:
+                self._answers.pop(key, None)
+
+        for inbox in self._inboxes:
+            inbox.put((request,))
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not all(key in self._answers for key in keys):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._answers.get(key) for key in keys]
+
+    def stats(self, timeout=5.0):
+        """ Queue depth, handled events and seconds waited in the queue of every worker, None for a worker not answering """
+        return self._ask('stats', 'stats', timeout)
+
+    def stop(self, timeout=5.0):
+        self._ask('stop', 'stopped', timeout)
+        for worker in self._workers:
+            worker.join(timeout)
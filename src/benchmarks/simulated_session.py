@@ -0,0 +1,199 @@
+# Lab session of the state machines of many groups and TAs in simulated time
+#
+# Every group has its status light and group state machine, every TA its TA state
+# machine, on drivers sharing a timer service with a simulated clock. The groups
+# work through tasks of real minutes, request help once and wait in a queue for a
+# free TA. The work and the help are timers of the service too, so the clock
+# jumps from deadline to deadline and hours of a session pass in seconds.
+# Run from the src folder:
+#   python3 -m benchmarks.simulated_session --groups 200 --tas 4
+import argparse
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from state_machines.group_stm import GroupSTM
+from state_machines.status_light_stm import StatusLight
+from state_machines.ta_stm import TaSTM
+from state_machines.timer_service import HeapScheduler, SimulatedClock, TimedDriver, TimerService
+from state_machines.timing_wheel import TimingWheel
+
+
+class Session:
+    """ The help queue and the free TAs, scheduling the work of the groups on the timer service """
+
+    def __init__(self, timers, driver, durations, help_time, nr_of_groups):
+        self.timers = timers
+        self.driver = driver
+        self.durations = durations
+        self.help_time = help_time
+        self.nr_of_groups = nr_of_groups
+
+        self._lock = threading.Lock()
+        self.queue = deque()
+        self.free_tas = deque()
+        self.lights = Counter()
+        self.waits = []
+        self.finished = 0
+        self.done = threading.Event()
+
+    def work(self, group, task):
+        """ Work on the task for a random share of its duration, then move on """
+        minutes = int(self.durations[task]) * random.uniform(0.5, 1.6)
+        self.timers.call_later(minutes * 60, lambda: self.task_finished(group, task))
+
+    def task_finished(self, group, task):
+        if task == group.help_task and not group.helped:
+            self.driver.send('request_help', group.name)
+            return
+
+        if task + 1 < len(self.durations):
+            self.driver.send('task_start', group.light)
+            self.driver.send('task_start', group.name)
+            self.work(group, task + 1)
+            return
+
+        self.driver.send('tasks_done', group.light)
+        self.driver.send('tasks_done', group.name)
+        with self._lock:
+            self.finished += 1
+            if self.finished == self.nr_of_groups:
+                self.done.set()
+
+    def request_help(self, group):
+        with self._lock:
+            group.requested = self.timers.now()
+            self.queue.append(group)
+        self.assign()
+
+    def assign(self):
+        with self._lock:
+            if not self.queue or not self.free_tas:
+                return
+            group = self.queue.popleft()
+            ta = self.free_tas.popleft()
+            self.waits.append(self.timers.now() - group.requested)
+
+        self.driver.send('help_group', ta)
+        self.driver.send('receive_help', group.name)
+        minutes = random.uniform(0.5, 1.5) * self.help_time
+        self.timers.call_later(minutes * 60, lambda: self.help_finished(ta, group))
+
+    def help_finished(self, ta, group):
+        group.helped = True
+        self.driver.send('help_recieved', ta)
+        self.driver.send('received_help', group.name)
+        with self._lock:
+            self.free_tas.append(ta)
+        self.assign()
+        # Carry on with the next task once helped
+        self.task_finished(group, group.help_task)
+
+
+class SimulatedGroup:
+    """ Stand-in for the group component called by the status light and group state machines """
+
+    def __init__(self, number, session):
+        self.session = session
+        self.name = f"team_{number}"
+        self.light = f"team_{number}_light"
+        self.help_task = random.randrange(len(session.durations))
+        self.helped = False
+        self.requested = None
+
+    def set_status_light(self, image_path):
+        self.session.lights[image_path] += 1
+
+    def request_help(self):
+        self.session.request_help(self)
+
+    def receiving_help(self):
+        pass
+
+    def received_help(self):
+        pass
+
+
+class SimulatedTa:
+    """ Stand-in for the TA engine called by the TA state machine """
+
+    def __init__(self):
+        self.reminders = 0
+
+    def set_helping_group(self, helping):
+        pass
+
+    def notify_ta_to_finish_helping(self):
+        self.reminders += 1
+
+
+SCHEDULERS = {
+    "wheel": TimingWheel,
+    "heap": HeapScheduler,
+}
+
+
+def run(nr_of_groups, nr_of_tas, durations, help_time, scheduler, logger):
+    timers = TimerService(SimulatedClock(), logger, scheduler=SCHEDULERS[scheduler]())
+    driver = TimedDriver(timers)
+    driver.start(keep_active=True)
+    session = Session(timers, driver, durations, help_time, nr_of_groups)
+
+    start = time.perf_counter()
+
+    tas = [SimulatedTa() for _ in range(nr_of_tas)]
+    for number, ta in enumerate(tas, start=1):
+        driver.add_machine(TaSTM.create_machine(ta=f"ta_{number}", component=ta, logger=logger))
+        driver.send('publish_tasks', f"ta_{number}")
+        session.free_tas.append(f"ta_{number}")
+
+    groups = [SimulatedGroup(number, session) for number in range(1, nr_of_groups + 1)]
+    for group in groups:
+        driver.add_machine(StatusLight.create_machine(
+            team=group.light, durations=durations, component=group, logger=logger))
+        driver.add_machine(GroupSTM.create_machine(team=group.name, component=group, logger=logger))
+        driver.send('tasks_received', group.name)
+        session.work(group, 0)
+
+    session.done.wait()
+    # Let the driver handle the last tasks_done events
+    while driver.pending:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    simulated = timers.now()
+
+    driver.stop()
+    timers.stop()
+
+    return session, tas, timers, driver, elapsed, simulated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run a lab session of the state machines in simulated time")
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--tas", type=int, default=4)
+    parser.add_argument("--durations", nargs="+", default=["30", "45", "60", "20"],
+                        help="minutes of the tasks, as entered by the TA")
+    parser.add_argument("--help-time", type=float, default=8,
+                        help="mean minutes a TA helps a group")
+    parser.add_argument("--scheduler", choices=SCHEDULERS, default="wheel",
+                        help="keeping the timers of the timer service")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+
+    session, tas, timers, driver, elapsed, simulated = run(
+        args.groups, args.tas, args.durations, args.help_time, args.scheduler, logger)
+
+    print(f"{args.groups} groups, {args.tas} TAs, tasks of {' '.join(args.durations)} minutes, "
+          f"timers in a {args.scheduler}")
+    print(f"simulated {simulated / 3600:.2f} h in {elapsed:.2f} s, {simulated / elapsed:.0f}x real time")
+    print(f"{timers.fired} timers fired, {timers.jumps} clock jumps, {driver.received} events handled")
+    print(f"lights: " + ", ".join(f"{path.rsplit('/', 1)[-1]} {count}"
+                                  for path, count in sorted(session.lights.items())))
+    print(f"waited for help: mean {sum(session.waits) / len(session.waits) / 60:.1f} min, "
+          f"max {max(session.waits) / 60:.1f} min, "
+          f"{sum(ta.reminders for ta in tas)} reminders to the TAs")
@@ -0,0 +1,81 @@
+# Time from start until the GUI of the TA and group clients can be built
+#
+# Measures what the clients do before building the window: creating the MQTT
+# client, connecting and starting the network loop. Compared with a blocking
+# connect as done before, against a reachable and an unreachable broker.
+# Run from the src folder:
+#   python3 -m benchmarks.startup_time --host localhost --unreachable-host 10.255.255.1
+import argparse
+import logging
+import statistics
+import time
+import paho.mqtt.client as mqtt
+import mqtt_clients.group_mqtt_client as group_mqtt_client
+import mqtt_clients.ta_mqtt_client as ta_mqtt_client
+from components.ta_engine import TaEngine
+
+
+class NullComponent:
+    """ Stand-in for the group component, the GUI is not part of the measurement """
+
+
+def blocking_connect(host, port):
+    client = mqtt.Client()
+    try:
+        client.connect(host, port)
+    except OSError:
+        pass
+    client.loop_start()
+    return client
+
+
+def start_group_client(logger):
+    client = group_mqtt_client.GroupMqttClient(NullComponent(), logger)
+    client.mqtt_client.loop_start()
+    return client.mqtt_client
+
+
+def start_ta_client(logger):
+    engine = TaEngine(logger)
+    engine.stm_driver.stop()
+    return engine.ta_mqtt_client.mqtt_client
+
+
+def measure(start, repeat):
+    timings = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        client = start()
+        timings.append(time.perf_counter() - begin)
+        client.loop_stop()
+        client.disconnect()
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Startup time of the TA and group clients")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--unreachable-host", default="10.255.255.1",
+                        help="address where connecting hangs until the TCP timeout")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+
+    print(f"{'client':<10}{'broker':<14}{'blocking ms':>14}{'async ms':>12}")
+    for broker, host in [("reachable", args.host), ("unreachable", args.unreachable_host)]:
+        # The clients read the broker address when connecting
+        group_mqtt_client.MQTT_BROKER = ta_mqtt_client.MQTT_BROKER = host
+        group_mqtt_client.MQTT_PORT = ta_mqtt_client.MQTT_PORT = args.port
+
+        # Blocking connects to an unreachable broker take long, measure them once
+        repeat = args.repeat if broker == "reachable" else 1
+        blocking = measure(lambda: blocking_connect(
+            host, args.port), repeat)
+
+        for name, start in [("group", start_group_client), ("ta", start_ta_client)]:
+            asynchronous = measure(lambda: start(logger), args.repeat)
+            print(f"{name:<10}{broker:<14}{statistics.median(blocking) * 1000:>14.1f}"
+                  f"{statistics.median(asynchronous) * 1000:>12.1f}")
@@ -0,0 +1,98 @@
+# Cost of starting, stopping and expiring the timers of many state machines
+#
+# Every group has a status light timer, restarted on every change of the light,
+# and a timer of the group restarted while waiting for help. The timers are kept
+# by the timing wheel or the heap of the timer service, driven by a simulated
+# clock ticking every 10 ms through a lab session.
+# Run from the src folder:
+#   python3 -m benchmarks.timer_scheduling --groups 500
+import argparse
+import random
+import time
+from state_machines.timer_service import HeapScheduler
+from state_machines.timing_wheel import TimingWheel
+
+SCHEDULERS = {
+    "wheel": TimingWheel,
+    "heap": HeapScheduler,
+}
+
+
+def run(scheduler, nr_of_groups, hours, tick, seed):
+    random.seed(seed)
+    now = 0.0
+    scheduler.start(now)
+    fired = []
+
+    def light(group):
+        # A light changes after half the duration of a task of 10 to 60 minutes
+        return now + random.uniform(5, 30) * 60, (group, 'light')
+
+    def waiting(group):
+        return now + 10, (group, 'waiting')
+
+    starts = stops = 0
+    start_time = stop_time = expire_time = 0.0
+    largest = 0
+
+    for group in range(nr_of_groups):
+        scheduler.add((group, 'light'), *light(group))
+
+    end = hours * 3600
+    while now < end:
+        now += tick
+
+        begin = time.perf_counter()
+        expired = scheduler.expire(now)
+        expire_time += time.perf_counter() - begin
+        fired.extend(expired)
+
+        for group, timer in expired:
+            # Restart the timer that expired, as the state machines do on entering a state
+            deadline, callback = light(group) if timer == 'light' else waiting(group)
+
+            begin = time.perf_counter()
+            scheduler.cancel((group, timer))
+            stop_time += time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            scheduler.add((group, timer), deadline, callback)
+            start_time += time.perf_counter() - begin
+            starts += 1
+            stops += 1
+
+        # Groups start and stop waiting for help at random
+        for _ in range(max(1, nr_of_groups // 1000)):
+            group = random.randrange(nr_of_groups)
+            begin = time.perf_counter()
+            if random.random() < 0.5:
+                scheduler.add((group, 'waiting'), *waiting(group))
+                start_time += time.perf_counter() - begin
+                starts += 1
+            else:
+                scheduler.cancel((group, 'waiting'))
+                stop_time += time.perf_counter() - begin
+                stops += 1
+
+        largest = max(largest, len(getattr(scheduler, '_heap', scheduler)))
+
+    return len(fired), starts, stops, start_time, stop_time, expire_time, largest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measure starting, stopping and expiring the timers of many state machines")
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--tick", type=float, default=0.01, help="seconds between two expiries")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.groups} groups, {args.hours} h in ticks of {args.tick * 1000:.0f} ms")
+    print(f"{'scheduler':<10}{'fired':>8}{'starts':>9}{'stops':>9}{'start us':>10}{'stop us':>9}"
+          f"{'expiry s':>10}{'entries':>9}")
+    for name, scheduler in SCHEDULERS.items():
+        fired, starts, stops, start_time, stop_time, expire_time, largest = run(
+            scheduler(), args.groups, args.hours, args.tick, args.seed)
+        print(f"{name:<10}{fired:>8}{starts:>9}{stops:>9}{start_time / starts * 1e6:>10.2f}"
+              f"{stop_time / stops * 1e6:>9.2f}{expire_time:>10.2f}{largest:>9}")
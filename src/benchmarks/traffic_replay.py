@@ -0,0 +1,126 @@
+# Replay of recorded MQTT traffic into a TA engine, with the time spent handling every command
+#
+# A client started with --record FILE logs the messages it receives and publishes.
+# The messages received by a TA, or published by groups with --outbound, are fed
+# to a fresh TA engine through the in-process loopback broker, at the recorded
+# pace, faster, or as fast as possible. Logs of several clients are merged in time.
+# Run from the src folder:
+#   python3 ta_server.py --name Alice --record alice.mqtl
+#   python3 -m benchmarks.traffic_replay alice.mqtl --speed 10
+#   python3 -m benchmarks.traffic_replay team_1.mqtl team_2.mqtl --outbound --speed max
+import argparse
+import heapq
+import logging
+import statistics
+import time
+from components.ta_engine import TaEngine
+from mqtt_clients.loopback import LoopbackTransport
+from mqtt_clients.ta_mqtt_client import MQTT_TOPIC_TA
+from mqtt_clients.traffic_log import INBOUND, OUTBOUND, read_traffic
+
+
+def load(paths, direction):
+    """ Merge the records of the given direction from the logs, in the order they were recorded """
+    logs = [(record for record in read_traffic(path) if record[1] == direction)
+            for path in paths]
+    return list(heapq.merge(*logs, key=lambda record: record[0]))
+
+
+def retarget(records, client_id):
+    """ Send the messages to the personal topics of recorded TAs to the TA of the given client id instead """
+    prefix = MQTT_TOPIC_TA + "/"
+    topic = prefix + client_id
+    return [(at, direction, topic if record_topic.startswith(prefix) else record_topic, payload, qos, retain)
+            for at, direction, record_topic, payload, qos, retain in records]
+
+
+def wait_until_idle(engine, quiet=0.2):
+    # The messages are handled once the inbound stage has been empty for a while
+    inbound = engine.ta_mqtt_client.inbound
+    last = None
+    while True:
+        counters = (inbound.received, inbound.handled)
+        if inbound.depth() == 0 and counters == last:
+            return
+        last = counters
+        time.sleep(quiet)
+
+
+def replay(records, speed, name, logger):
+    """ Feed the records to a new TA engine, speed None replays as fast as possible """
+    transport = LoopbackTransport(logger=logger)
+    engine = TaEngine(logger, transport=transport)
+    engine.ta_mqtt_client.dispatcher.enable_profiling()
+    engine.login(name)
+
+    # The replaying TA gets the messages sent to the recorded TA, such as the synchronized state
+    records = retarget(records, engine.ta_mqtt_client.client_id)
+
+    # The recorded messages are published by a client of their own
+    publisher = transport.create_client()
+    transport.connect(publisher)
+    publisher.loop_start()
+
+    while not (engine.ta_mqtt_client.connected and publisher.is_connected()):
+        time.sleep(0.01)
+    # Let the engine subscribe before the first message
+    time.sleep(0.1)
+
+    first = records[0][0] if records else 0
+    start = time.perf_counter()
+    lag = 0.0
+
+    for at, direction, topic, payload, qos, retain in records:
+        if speed is not None:
+            delay = start + (at - first) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+
+        publisher.publish(topic, payload, qos=qos, retain=retain)
+
+    published = time.perf_counter() - start
+    wait_until_idle(engine)
+    handled = time.perf_counter() - start
+
+    handler_times = dict(engine.ta_mqtt_client.dispatcher.handler_times)
+    inbound = engine.ta_mqtt_client.inbound.stats()
+
+    publisher.loop_stop()
+    engine.stop()
+
+    return handler_times, inbound, published, handled, lag
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Replay recorded MQTT traffic into a TA engine, reporting the handler time per command")
+    parser.add_argument("logs", nargs="+", help="traffic logs recorded with --record")
+    parser.add_argument("--speed", default="1",
+                        help="factor of the recorded pace, or max for as fast as possible")
+    parser.add_argument("--outbound", action="store_true",
+                        help="replay the messages published by the recorded clients, e.g. groups, "
+                             "instead of the messages received")
+    parser.add_argument("--name", default="Replay", help="name of the replaying TA")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.WARNING)
+
+    speed = None if args.speed == "max" else float(args.speed)
+    records = load(args.logs, OUTBOUND if args.outbound else INBOUND)
+    recorded = records[-1][0] - records[0][0] if records else 0
+
+    handler_times, inbound, published, handled, lag = replay(
+        records, speed, args.name, logger)
+
+    pace = "as fast as possible" if speed is None else f"at {args.speed}x"
+    print(f"{len(records)} messages recorded over {recorded:.1f} s, replayed {pace} "
+          f"in {published:.2f} s, all handled after {handled:.2f} s, max lag {lag * 1000:.1f} ms")
+    print(f"inbound stage: {inbound}")
+    print(f"{'command':<28}{'handled':>9}{'total ms':>10}{'mean us':>10}{'p95 us':>10}{'max us':>10}")
+    for command, times in sorted(handler_times.items(), key=lambda item: -sum(item[1])):
+        p95 = statistics.quantiles(times, n=20, method='inclusive')[-1] if len(times) > 1 else times[0]
+        print(f"{command:<28}{len(times):>9}{sum(times) * 1000:>10.2f}{statistics.mean(times) * 1e6:>10.1f}"
+              f"{p95 * 1e6:>10.1f}{max(times) * 1e6:>10.1f}")
@@ -0,0 +1,82 @@
+# Encode and decode time and bytes on the wire of every command, for each available wire format
+#
+# Run from the src folder:
+#   python3 -m benchmarks.wire_format --groups 100
+import argparse
+import time
+from mqtt_clients.codec import available_codecs, decode, encode
+
+
+def create_payload(command, header, body):
+    return {"command": command, "header": header, "body": body}
+
+
+def sample_messages(nr_of_groups, nr_of_tasks):
+    """ Representative messages of every command, as created by the MQTT clients """
+    tasks = [{"task": str(task + 1), "description": f"Implement part {task + 1} of the state machine", "duration": "15"}
+             for task in range(nr_of_tasks)]
+    groups = [f"Team {number}" for number in range(1, nr_of_groups + 1)]
+    codecs = available_codecs()
+
+    return [
+        create_payload("group_present", "team_1", {
+                       "group": "Team 1", "codecs": codecs}),
+        create_payload("request_help", "team_1", {"group": "Team 1", "description": "The timer does not fire",
+                                                  "time": "12:34:56",
+                                                  "id": "0123456789abcdef0123456789abcdef"}),
+        create_payload("report_current_task", "team_1", {
+                       "group": "Team 1", "current_task": "2"}),
+        create_payload("tasks_done", "team_1", {"group": "Team 1"}),
+        create_payload("submit_tasks", "Alice", tasks),
+        create_payload("submit_tasks_late", "Alice", tasks),
+        create_payload("queue_snapshot", "Alice", {
+                       "version": 42, "queue": groups}),
+        create_payload("getting_help", "Alice", {"group": "Team 1"}),
+        create_payload("received_help", "Alice", {"group": "Team 1"}),
+        create_payload("ta_presence", "Alice", {
+                       "id": "ta_0123456789abcdef", "ta": "Alice", "online": True, "codecs": codecs}),
+        create_payload("ta_update_tasks", "Alice", tasks),
+        create_payload("request_sync", "Bob", {"id": "ta_fedcba9876543210", "versions": {"ta_0123456789abcdef": 0}}),
+        create_payload("sync_claim", "Alice", {"id": "ta_0123456789abcdef", "requester": "ta_fedcba9876543210"}),
+        create_payload("sync_state", "Alice", {
+            "origin": "ta_0123456789abcdef",
+            "version": 3 * nr_of_groups,
+            "snapshot_version": 0,
+            "snapshot": None,
+            "changes": [[version + 1, "request_help", {"id": f"{group}@12:34:56", "group": group,
+                                                       "description": "The timer does not fire",
+                                                       "time": "12:34:56", "timestamp": time.time()}]
+                        for version, group in enumerate(groups)],
+        }),
+    ]
+
+
+def measure(message, codec, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        payload = encode(message, codec)
+    encode_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(payload)
+    decode_time = (time.perf_counter() - start) / repeat
+
+    return len(payload), encode_time, decode_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Encode and decode time and size of every command per wire format")
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'command':<26}{'codec':<10}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for message in sample_messages(args.groups, args.tasks):
+        for codec in available_codecs():
+            size, encode_time, decode_time = measure(
+                message, codec, args.repeat)
+            print(f"{message['command']:<26}{codec:<10}{size:>8}"
+                  f"{encode_time * 1e6:>12.2f}{decode_time * 1e6:>12.2f}")
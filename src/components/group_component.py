@@ -1,13 +1,17 @@
 # Group client component
 from appJar import gui
 from datetime import datetime
-import stmpy
-from threading import Thread
 from state_machines.status_light_stm import StatusLight
 from state_machines.group_stm import GroupSTM
+from state_machines.timer_service import SystemClock, TimedDriver, TimerService
 import logging
 import time
+import uuid
 from mqtt_clients.group_mqtt_client import GroupMqttClient
+from components.ui_dispatcher import UiDispatcher
+from mqtt_clients.tk_network_loop import NETWORK_LOOP_THREAD, NETWORK_LOOP_TK, TkNetworkLoop
+from mqtt_clients.codec import JSON
+from models.task_set import TaskSet
 
 # Number of teams able to connect to the system
 NR_OF_TEAMS = 20
@@ -32,28 +36,50 @@ class GroupComponent:
         # Add the state machine to the driver
         self.stm_driver.add_machine(group_stm)
 
-    def __init__(self, logger):
+    def __init__(self, logger, network_loop=NETWORK_LOOP_THREAD, codec=JSON, retained_state=False,
+                 delivery_policies=None, spool_path=None, transport=None, recorder=None, timers=None,
+                 stm_driver=None):
+        # The driver runs the timers of the machines, such as a TimedDriver or a DriverPool
+        if stm_driver is not None and not hasattr(stm_driver, 'timers'):
+            raise TypeError(
+                f'The driver of the component must be a TimedDriver or a DriverPool, not {type(stm_driver).__name__}')
+
         # get the logger object for the component
         self._logger: logging.Logger = logger
         print('logging under name {}.'.format(__name__))
         self._logger.info('Starting Component')
 
-        # Create the MQTT handler
-        self.group_mqtt_client = GroupMqttClient(self, logger)
+        # GUI updates from the MQTT and state machine threads are run by the Tk main loop
+        self.ui = UiDispatcher(logger)
 
-        # Start the MQTT client in a separate thread to avoid blocking
-        try:
-            thread = Thread(
-                target=self.group_mqtt_client.mqtt_client.loop_start())
-            thread.start()
-        except KeyboardInterrupt:
-            print("Interrupted")
-            self.group_mqtt_client.mqtt_client.disconnect()
+        # Create the MQTT handler
+        self.group_mqtt_client = GroupMqttClient(
+            self, logger, codec=codec, retained_state=retained_state, delivery_policies=delivery_policies,
+            spool_path=spool_path, transport=transport, recorder=recorder)
+
+        # Start the network loop of the MQTT client in its own thread, or run it
+        # in the Tk event loop with all I/O and GUI work on one thread
+        self.network_loop = None
+        if network_loop == NETWORK_LOOP_TK:
+            self.network_loop = TkNetworkLoop(
+                self.group_mqtt_client.mqtt_client, logger, backoff=self.group_mqtt_client.backoff)
+        else:
+            self.group_mqtt_client.mqtt_client.loop_start()
 
         # Setting up the drivers for the state machines
-        # Start the stmpy driver for the group component, without any state machines for now
-        self.stm_driver = stmpy.Driver()
-        self.stm_driver.start(keep_active=True)
+        # The timers of the status light and the group follow the clock of the timer service
+        if timers is None and stm_driver is not None:
+            timers = stm_driver.timers
+        self._owns_timers = timers is None
+        self.timers = TimerService(SystemClock(), logger) if timers is None else timers
+
+        # Start the stmpy driver for the group component, without any state machines for now,
+        # unless the machines run on a driver pool shared with other components
+        self._owns_driver = stm_driver is None
+        if stm_driver is None:
+            stm_driver = TimedDriver(self.timers)
+            stm_driver.start(keep_active=True)
+        self.stm_driver = stm_driver
 
         self._logger.debug('Component initialization finished')
 
@@ -66,6 +92,9 @@ class GroupComponent:
         # Set the initial queue number
         self.queue_number = 0
 
+        # Version of the last queue snapshot received, older snapshots are ignored
+        self.queue_version = -1
+
         # Can only update tasks once
         self.update_tasks = False
 
@@ -75,6 +104,9 @@ class GroupComponent:
         # Know if a TA is connected
         self.ta_connected = False
 
+        # The TAs online, keyed on the client id of the TA
+        self.online_tas = {}
+
         # The names of the state machine for the present group and status light
         self.group_stm_name = None
         self.status_light_stm_name = None
@@ -158,6 +190,12 @@ class GroupComponent:
 
         self.app.setStopFunction(self.stop)
 
+        # Start running the queued GUI updates
+        self.ui.start(self.app)
+
+        if self.network_loop is not None:
+            self.network_loop.start(self.app.topLevel)
+
         # Start the GUI
         self.app.go()
 
@@ -206,23 +244,16 @@ class GroupComponent:
         # Logging the team number
         self._logger.info(f'Team number: {self.team_text}')
 
-        # Create the topics for the group
-        self.group_mqtt_client.set_topics()
-
-        # Subscribe to the topic for the group
-        self.group_mqtt_client.subscribe_topics()
-
-        self.group_mqtt_client.handle_group_present()
+        # Subscribe to the topics and notify the TAs as soon as connected
+        self.group_mqtt_client.join()
 
         # Start the group state machine
         self.create_group_stm()
 
-        # Wait for the TAs to respond on connect
-        time.sleep(0.2)
-
+        # Cleared as soon as the presence of a TA is received
         if self.ta_connected == False:
-            self.app.setLabel("TA_status_label",
-                              "Waiting for TAs to connect...")
+            self.ui.post("TA_status_label", self.app.setLabel,
+                         "TA_status_label", "Waiting for TAs to connect...")
 
     def sub_window_closed(self):
         """ Close the application if the popup window is closed """
@@ -263,10 +294,6 @@ class GroupComponent:
         # Change state to "waiting_for_help"
         self.stm_driver.send("request_help", self.group_stm_name)
 
-    def update_queue_number(self):
-        """ Update the queue number """
-        self.app.setLabel("Help Queue", f"Queue Number: {self.queue_number}")
-
     def mark_task_done(self):
         """ Mark the first tast with status 'not done' as 'done' and the next task as 'in progress' """
         duration = None
@@ -328,12 +355,20 @@ class GroupComponent:
         self.stm_driver.send('received_help', self.group_stm_name)
 
     def handle_recieve_tasks(self, payload):
+        # The tasks are added to the table by the Tk main loop
+        self.ui.post(None, self.receive_tasks, payload)
+
+    def receive_tasks(self, payload):
         # Only update the tasks once
         if self.update_tasks:
             return
 
         self.update_tasks = True
 
+        # The TAs are told the hash of the tasks when the group rejoins
+        self.group_mqtt_client.tasks_hash = TaskSet.from_tasks(payload).hash
+        self.group_mqtt_client.publish_state()
+
         # Check if the group already is assigned tasks
         if self.app.getTableRowCount("table_tasks") > 0:
             self._logger.debug(
@@ -357,40 +392,82 @@ class GroupComponent:
 
         self.stm_driver.send('tasks_received', self.group_stm_name)
 
-    def handle_update_queue_number(self, body):
-        self.queue_number = body['queue_number']
-        self.app.setLabel("queue_number_label",
-                          f"Number in queue: {self.queue_number}")
+    def handle_queue_snapshot(self, body):
+        # Ignore snapshots older than the one already received
+        if body['version'] < self.queue_version:
+            return
+
+        self.queue_version = body['version']
 
-    def handle_ta_present(self, all=False):
-        # Handle that the TA is ready
-        if self.ta_connected == False:
-            self._logger.info("TA is ready")
-            self.ta_connected = True
-            self.app.setLabel("TA_status_label", "")
+        # Clear the queue number once the group has left the queue, e.g. when the
+        # request was cancelled, unless the label already shows the help given
+        if self.team_text not in body['queue']:
+            if self.queue_number:
+                self.queue_number = 0
+                self.ui.post("queue_number_label", self.app.setLabel,
+                             "queue_number_label", "")
+            return
+
+        self.queue_number = body['queue'].index(self.team_text) + 1
+        self.ui.post("queue_number_label", self.app.setLabel,
+                     "queue_number_label", f"Number in queue: {self.queue_number}")
 
-            if all:
+    def handle_ta_presence(self, body, retained=False):
+        # Keep track of the TAs online
+        if body['online']:
+            joined = body['id'] not in self.online_tas
+            self.online_tas[body['id']] = body['ta']
+
+            # A TA joining after the group must learn that the group is present,
+            # unless the state of the group is retained by the broker
+            if joined and not retained and not self.group_mqtt_client.retained_state:
+                self._logger.info(f"TA {body['ta']} joined")
                 self.group_mqtt_client.handle_group_present()
+        else:
+            left = self.online_tas.pop(body['id'], None)
+
+            if left is not None:
+                self._logger.info(f"TA {left} left")
+
+        # Update the status of the TAs
+        if self.online_tas and self.ta_connected == False:
+            self._logger.info("TA is ready")
+            self.ta_connected = True
+            self.ui.post("TA_status_label", self.app.setLabel,
+                         "TA_status_label", "")
+        elif not self.online_tas and self.ta_connected == True:
+            self._logger.info("No TAs connected")
+            self.ta_connected = False
+            self.ui.post("TA_status_label", self.app.setLabel,
+                         "TA_status_label", "Waiting for TAs to connect...")
 
     # Methods called by the state machines to change the GUI state
     def set_status_light(self, light):
         """ Set the status light """
-        self.app.setImage("light", light)
+        self.ui.post("light", self.app.setImage, "light", light)
 
     def receiving_help(self):
         # Update the queue number label to inform the user that they are getting help
-        self.app.setLabel("queue_number_label", "Getting help!")
+        self.queue_number = 0
+        self.ui.post("queue_number_label", self.app.setLabel,
+                     "queue_number_label", "Getting help!")
 
-        self.app.setLabel("Request feedback", "")
+        self.ui.post("Request feedback", self.app.setLabel,
+                     "Request feedback", "")
 
     def received_help(self):
         # Update the queue number label to inform the user that they have received help
-        self.app.setLabel("queue_number_label", "Received help!")
+        self.ui.post("queue_number_label", self.app.setLabel,
+                     "queue_number_label", "Received help!")
         # Set the requesting help flag to false
         self.requesting_help = False
 
     def request_help(self):
         """ Send a help request to the TAs """
+        # Called by the state machine, the description is read by the Tk main loop
+        self.ui.post(None, self.send_help_request)
+
+    def send_help_request(self):
         help_request = self.app.getEntry("Description:")
         # Test if the help request is empty
         if help_request == "":
@@ -406,7 +483,9 @@ class GroupComponent:
             task_dict = {
                 "group": help_request[0],
                 "description": help_request[1],
-                "time": help_request[2]
+                "time": help_request[2],
+                # Unique id of the request, shared by all the TAs
+                "id": uuid.uuid4().hex
             }
 
             self.group_mqtt_client.handle_request_help(task_dict)
@@ -427,11 +506,23 @@ class GroupComponent:
         """
         Stop the component.
         """
-        # stop the MQTT client
+        # stop the GUI updates first, releasing threads waiting to post one
+        self.ui.stop()
+
+        # stop the MQTT client, publishing the pending messages and clearing the retained state first
+        self.group_mqtt_client.leave()
+        if self.network_loop is not None:
+            self.network_loop.stop()
         self.group_mqtt_client.mqtt_client.loop_stop()
 
+        if self.group_mqtt_client.recorder is not None:
+            self.group_mqtt_client.recorder.close()
+
         # stop the stmpy drivers
-        self.stm_driver.stop()
+        if self._owns_driver:
+            self.stm_driver.stop()
+        if self._owns_timers:
+            self.timers.stop()
 
         # Log the shutdown
         self._logger.info('Shutting down Component')
@@ -1,58 +1,45 @@
-from threading import Thread
-import stmpy
 from appJar import gui
 from datetime import datetime
 import logging
-from state_machines.ta_stm import TaSTM
-from mqtt_clients.ta_mqtt_client import TaMqttClient
+from components.ta_engine import TaEngine, TaEngineError
+from components.ui_dispatcher import UiDispatcher
+from mqtt_clients.tk_network_loop import NETWORK_LOOP_THREAD, NETWORK_LOOP_TK, TkNetworkLoop
+from mqtt_clients.codec import JSON
 
-# TA client component
+# TA client component, the GUI of the TA rendering the state of the TA engine
 
 
 class TaClientComponent:
 
-    # State machine methods
-    def create_ta_stm(self):
-        """ Create a new ta state machine """
-        # Create a new group state machine
-        ta_stm = TaSTM.create_machine(
-            ta=self.ta_stm_name, component=self, logger=self._logger)
-        # Add the state machine to the driver
-        self.stm_driver.add_machine(ta_stm)
-
-    def __init__(self, logger):
+    def __init__(self, logger, network_loop=NETWORK_LOOP_THREAD, codec=JSON, retained_state=False,
+                 delivery_policies=None, spool_path=None, transport=None, recorder=None):
         # get the logger object for the component
         self._logger: logging.Logger = logger
         print(f'logging under name {__name__}.')
         self._logger.info('Starting Component')
 
-        # Create the MQTT handler
-        self.ta_mqtt_client = TaMqttClient(self, logger)
-
-        # Start the MQTT client in a separate thread to avoid blocking
-        try:
-            thread = Thread(
-                target=self.ta_mqtt_client.mqtt_client.loop_start())
-            thread.start()
-        except KeyboardInterrupt:
-            print("Interrupted")
-            self.ta_mqtt_client.mqtt_client.disconnect()
-
-        # Start the stmpy driver, without any state machines for now
-        self.stm_driver = stmpy.Driver()
-        self.stm_driver.start(keep_active=True)
+        # GUI updates from the MQTT and state machine threads are run by the Tk main loop
+        self.ui = UiDispatcher(logger)
 
-        self._logger.debug('Component initialization finished')
+        # Request id of every row of the request tables, as last rendered
+        self.table_ids = {"groups_request_help": [], "groups_getting_help": []}
 
-        # Tracking if the tasks have been submitted (to avoid multiple submissions)
-        self.tasks_submitted = False
+        # Create the engine owning the state, the MQTT client and the state machine driver
+        self.engine = TaEngine(
+            logger, network_loop=network_loop, codec=codec, retained_state=retained_state,
+            delivery_policies=delivery_policies, spool_path=spool_path, transport=transport,
+            recorder=recorder)
 
-        # Can only update tables once
-        self.update_tabels = False
+        # Run the network loop in the Tk event loop, all I/O and GUI work on one thread
+        self.network_loop = None
+        if network_loop == NETWORK_LOOP_TK:
+            self.network_loop = TkNetworkLoop(
+                self.engine.ta_mqtt_client.mqtt_client, logger, backoff=self.engine.ta_mqtt_client.backoff)
 
-        self.helping_group = False
+        # Render the tables whenever the state of the engine changes
+        self.engine.add_listener(self.on_engine_event)
 
-        self.ta_stm_name = None
+        self._logger.debug('Component initialization finished')
 
         # Settup the GUI
         self.setup_gui()
@@ -137,6 +124,12 @@ class TaClientComponent:
 
         self.app.setStopFunction(self.stop)
 
+        # Start running the queued GUI updates
+        self.ui.start(self.app)
+
+        if self.network_loop is not None:
+            self.network_loop.start(self.app.topLevel)
+
         # Start the GUI
         self.app.go()
 
@@ -163,37 +156,13 @@ class TaClientComponent:
             self.app.errorBox("Error", "Please enter a name with only letters")
             return
 
-        # Set the name of the TA
-        self.ta_name = name
-
-        ta_name_lower = self.ta_name.lower().replace(" ", "_")
-
-        # Set the endpont for the TA
-        self.ta_mqtt_client.ta_mqtt_endpoint = ta_name_lower
-
-        self.ta_stm_name = f"{ta_name_lower}_stm"
-
-        self.ta_mqtt_client.ta_name = self.ta_name
-
         self.app.hideSubWindow("Enter TA name")
 
         # Set the label in the upper right corner
         self.app.setLabel("upper_right_label", f"TA name: {name}")
 
-        # Set the topics specific for the TA
-        self.ta_mqtt_client.set_topics()
-
-        # Subscribe to the topics
-        self.ta_mqtt_client.subscribe_topics()
-
-        # Request the tables to be updated for a late joiner
-        self.ta_mqtt_client.request_update_of_tables()
-
-        # Notify the student groups of the TA joining
-        self.ta_mqtt_client.notify_student_groups_of_ta()
-
-        # Create the ta state machine
-        self.create_ta_stm()
+        # Join the lab session
+        self.engine.login(name)
 
     def sub_window_closed(self):
         """ Close the application if the popup window is closed """
@@ -210,402 +179,96 @@ class TaClientComponent:
                                 When you are done, press the submit button to publish the tasks to the MQTT broker. \
                                     The tasks will be enumberated from 1 to n, where n is the number of tasks.")
 
-    def handle_request_help(self, header, body):
-        # If group already in table, remove it
-        for row in range(self.app.getTableRowCount("groups_request_help")):
-            if self.app.getTableRow("groups_request_help", row)[0] == body['group']:
-                self.app.deleteTableRow("groups_request_help", row)
-                break
-
-        # Get the data from the payload
-        group = body['group']
-        description = body['description']
-        time = body['time']
-
-        # Add the data to the table of groups requesting help
-        self.app.addTableRow("groups_request_help", [
-                             group, description, time])
-
-        # Sort the table by time
-        self.app.sortTable("groups_request_help", 2)
-
-        # Log the action
-        self._logger.info(
-            f"Group {group} requested help with {description} at {time}")
-
-        queue_number = self.app.getTableRowCount("groups_request_help")
-
-        # Report the queue number to the group
-        self.ta_mqtt_client.report_queue_number(header, queue_number + 1)
-
-    def assign_getting_help(self, row):
-        # Check if the TA is already helping a group (can only help one group at a time)
-        if self.helping_group:
-            self.app.errorBox("Error", "You are already helping a group")
-            return
-        
-        # Get the row of the table
-        data = self.app.getTableRow("groups_request_help", row)
-
-        # Add the TA name to the data
-        data.append(self.ta_name)
-
-        # Add the row to the table of groups getting help
-        self.app.addTableRow("groups_getting_help", data)
-        # Remove the row from the table of groups requesting help
-        self.app.deleteTableRow("groups_request_help", row)
-
-        # Log the action
-        self._logger.info(f"Group {data[0]} is getting help")
-
-        # Report to group that it is getting help
-        self.ta_mqtt_client.report_getting_help(data[0])
-
-        self.notify_other_tas_getting_help(data, row)
-
-        # Change state to "helping_group"
-        self.stm_driver.send('help_group', self.ta_stm_name)
-    
-    def set_helping_group(self, helping):
-        self.helping_group = helping
-
-    def send_new_queue_number_to_groups(self):
-        for row in range(self.app.getTableRowCount("groups_request_help")):
-            # Get the group name
-            group = self.app.getTableRow("groups_request_help", row)[0]
-
-            # Send the new queue number to the group
-            self.ta_mqtt_client.report_queue_number(group, row + 1)
-
-    def notify_other_tas_getting_help(self, data, row):
-        # Create the body of the payload
-        body = {
-            "group": data[0],
-            "description": data[1],
-            "time": data[2],
-            "ta": data[3],
-            "row": row
-        }
-
-        self.ta_mqtt_client.notify_other_tas_getting_help(body)
-
-    def assign_got_help(self, row):
-        # Get the row of the table
-        data = self.app.getTableRow("groups_getting_help", row)
-
-        # Test if the ta is helping the group
-        if data[3] != self.ta_name:
-            self.app.errorBox("Error", "You are not helping this group")
-            return
-
-        # Remove the row from the table of groups getting help
-        self.app.deleteTableRow("groups_getting_help", row)
-
-        # Log the action
-        self._logger.info(f"Group {data[0]} got help")
-
-        # Report to group that it got help
-        self.ta_mqtt_client.report_received_help(data[0])
-
-        # Notify other TAs that the group got help
-        self.ta_mqtt_client.notify_other_tas_got_help(row)
-
-        # Change state to "not_helping_group"
-        self.stm_driver.send('help_recieved', self.ta_stm_name)
-
-    def update_group_with_tasks(self, group):
-        data_list = []
-
-        for row in range(self.app.getTableRowCount("assigned_tasks")):
-            data_list.append(self.app.getTableRow("assigned_tasks", row))
-
-        # Convert into a json list of dictionaries
-        output_list = []
-
-        for index, sublist in enumerate(data_list):
-            task_dict = {
-                "task": str(index+1),
-                "description": sublist[0],
-                "duration": sublist[1]
-            }
-            output_list.append(task_dict)
-
-        # Send the list of tasks to the group
-        self.ta_mqtt_client.send_tasks_to_group(group, output_list)
+    # Actions of the TA, performed by the engine
 
     def add_task(self):
         data_list = self.app.getTableEntries("assigned_tasks")
 
-        # Test if the description or duration is empty
-        if data_list[0] == "" or data_list[1] == "":
-            self.app.popUp(
-                "Error", "Description and duration must be filled", kind="error")
-            return
-
-        # Test if the duration is a number
         try:
-            int(data_list[1])
-        except ValueError:
-            self.app.popUp("Error", "Duration must be a number", kind="error")
-            return
-
-        self.app.addTableRow("assigned_tasks", data_list)
+            self.engine.add_task(data_list[0], data_list[1])
+        except TaEngineError as e:
+            self.app.popUp("Error", str(e), kind="error")
 
     def submit_tasks(self):
-        # Test if there are any groups present
-        if self.app.getTableRowCount("group_status") == 0:
-            self.app.popUp(
-                "Error", "There are no groups to assign tasks to", kind="error")
-            return
-
-        # Test if the tasks have already been submitted
-        if self.tasks_submitted:
-            self.app.popUp(
-                "Error", "The tasks have already been submitted. Can only submitt tasks once", kind="error")
-            return
-
-        # Test if there are any tasks
-        if self.app.getTableRowCount("assigned_tasks") == 0:
-            self.app.popUp(
-                "Error", "There are no tasks to submit", kind="error")
-            return
-
-        data_list = []
-
-        for row in range(self.app.getTableRowCount("assigned_tasks")):
-            data_list.append(self.app.getTableRow("assigned_tasks", row))
-
-        # Convert into a json list of dictionaries
-        output_list = []
-
-        for index, sublist in enumerate(data_list):
-            task_dict = {
-                "task": str(index+1),
-                "description": sublist[0],
-                "duration": sublist[1]
-            }
-            output_list.append(task_dict)
-
-        # Change the status of the groups to "Task 1 in progress"
-        for row in range(self.app.getTableRowCount("group_status")):
-            data = self.app.getTableRow("group_status", row)
-            data[1] = "Task 1 in progress"
-            self.app.replaceTableRow("group_status", row, data)
-
-        # Send the list of tasks to the groups
-        self.ta_mqtt_client.submit_tasks_to_groups(output_list)
-        # Send the list of tasks to the TAs
-        self.ta_mqtt_client.submit_tasks_to_tas(output_list)
-
-        # Change the status of the tasks to submitted
-        self.tasks_submitted = True
-
-        self.stm_driver.send('publish_tasks', self.ta_stm_name)
-
-    def handle_group_present(self, header, body):
-        # Notify the group that the TA is present
-        self.ta_mqtt_client.report_ta_present(header)
-
-        # Get the data from the payload
-        group = body['group']
-
-        if self.app.getTableRowCount("assigned_tasks") == 0 and not self.tasks_submitted:
-            self.app.addTableRow(
-                "group_status", [group, "Waiting for TAs to assign tasks..."])
-            return
-
-        status = "Task 1 in progress"
-
-        # Add the data to the table of groups and their status
-        self.app.addTableRow("group_status", [group, status])
-
-        # Send the list of tasks to the group
-        if self.tasks_submitted:
-            self.update_group_with_tasks(group)
-
-    def handle_group_done(self, header, body):
-        # Get the data from the payload
-        group = body['group']
-        delete_row = None
-
-        # Find the row of the group in the table
-        for row in range(self.app.getTableRowCount("group_status")):
-            if self.app.getTableRow("group_status", row)[0] == group:
-                delete_row = row
-                break
-
-        if delete_row is None:
-            self._logger.error(f"Group {group} not found in table")
-            return
-
-        # Remove the row from the table of groups and their status
-        self.app.replaceTableRow("group_status", delete_row, [group, "Done"])
-
-    # Handle request methods
-
-    def handle_group_progress(self, header, body):
-        # Get the data from the payload
-        group = body['group']
-        task = body['current_task']
-        task = f"Task {task} in progress"
-        update_row = None
-
-        # Find the row of the group in the table
-        for row in range(self.app.getTableRowCount("group_status")):
-            if self.app.getTableRow("group_status", row)[0] == group:
-                update_row = row
-                break
-
-        if update_row is None:
-            self._logger.error(f"Group {group} not found in table")
-            return
-
-        # Update the row from the table of groups and their status
-        self.app.replaceTableRow("group_status", update_row, [group, task])
-
-    def handle_ta_update_tasks(self, header, body):
-        # Testing if the message is from the same TA then do nothing
-        if header == self.ta_name:
-            return
-
-        # Test if there are any tasks
-        if self.app.getTableRowCount("assigned_tasks") != 0:
-            self._logger.info(
-                "The tasks have already been submitted. Can only submitt tasks once")
-            return
-
-        # Add the tasks to the table
-        for task in body:
-            self.app.addTableRow("assigned_tasks", [
-                                 task['description'], task['duration']])
-
-        # Change the status of the groups to "Task 1 in progress"
-        for row in range(self.app.getTableRowCount("group_status")):
-            data = self.app.getTableRow("group_status", row)
-            data[1] = "Task 1 in progress"
-            self.app.replaceTableRow("group_status", row, data)
-
-        self.tasks_submitted = True
-
-        self.stm_driver.send('publish_tasks', self.ta_stm_name)
-
-    def handle_ta_update_receiving_help(self, header, body):
-        # Testing if the message is from the same TA then do nothing
-        if header == self.ta_name:
-            return
-
-        # Remove the row from the table of groups requesting help
-        self.app.deleteTableRow("groups_request_help", body['row'])
-
-        # Add the groups to the table
-        self.app.addTableRow("groups_getting_help", [
-                             body['group'], body['description'], body['time'], body['ta']])
-
-    def handle_ta_update_received_help(self, header, body):
-        # Testing if the message is from the same TA then do nothing
-        if header == self.ta_name:
-            return
-
-        # Remove the row from the table of groups requesting help
-        self.app.deleteTableRow("groups_getting_help", body['row'])
-
-    def handle_request_update_of_tables(self, header, body):
-        # Test if the message is from the same TA then do nothing
-        if header == self.ta_name:
-            return
-
-        # Get the data from the tables
-        assigned_tasks, groups_request_help, groups_getting_help, group_status = [], [], [], []
-
-        if self.app.getTableRowCount("assigned_tasks") != 0 and self.tasks_submitted:
-            for row in range(self.app.getTableRowCount("assigned_tasks")):
-                assigned_tasks.append(
-                    self.app.getTableRow("assigned_tasks", row))
-
-        if self.app.getTableRowCount("groups_request_help") != 0:
-            for row in range(self.app.getTableRowCount("groups_request_help")):
-                groups_request_help.append(
-                    self.app.getTableRow("groups_request_help", row))
-
-        if self.app.getTableRowCount("groups_getting_help") != 0:
-            for row in range(self.app.getTableRowCount("groups_getting_help")):
-                groups_getting_help.append(
-                    self.app.getTableRow("groups_getting_help", row))
-
-        if self.app.getTableRowCount("group_status") != 0:
-            for row in range(self.app.getTableRowCount("group_status")):
-                group_status.append(self.app.getTableRow("group_status", row))
-
-        # Test if all the tables are empty, if so then do nothing
-        if len(assigned_tasks) == 0 and len(groups_request_help) == 0 \
-                and len(groups_getting_help) == 0 and len(group_status) == 0:
-            return
+        try:
+            self.engine.submit_tasks()
+        except TaEngineError as e:
+            self.app.popUp("Error", str(e), kind="error")
 
-        # Create the body of the payload
-        body = {
-            "assigned_tasks": assigned_tasks,
-            "groups_request_help": groups_request_help,
-            "groups_getting_help": groups_getting_help,
-            "group_status": group_status
-        }
+    def assign_getting_help(self, row):
+        try:
+            self.engine.assign_getting_help(self.table_ids["groups_request_help"][row])
+        except TaEngineError as e:
+            self.app.errorBox("Error", str(e))
 
-        # Send the tables to the TA requesting the update
-        self.ta_mqtt_client.send_tables_to_ta(header, body)
+    def assign_got_help(self, row):
+        try:
+            self.engine.assign_got_help(self.table_ids["groups_getting_help"][row])
+        except TaEngineError as e:
+            self.app.errorBox("Error", str(e))
 
-    def handle_ta_update_tables(self, header, body):
-        # Only update the tables once
-        if self.update_tabels:
-            return
+    # Rendering of the engine state
 
-        self.update_tabels = True
+    def on_engine_event(self, event, data):
+        """ Queue rendering of the part of the GUI affected by a change in the engine
 
-        # Test if there are any tasks
-        if self.app.getTableRowCount("assigned_tasks") != 0:
-            self._logger.info(
-                "The tasks have already been submitted. Can only submitt tasks once")
-            return
+        Called from the MQTT and state machine threads, the tables are copied so the
+        engine can keep changing them until the update is rendered.
+        """
+        if event == "tasks":
+            self.ui.post("assigned_tasks", self.render_table,
+                         "assigned_tasks", list(data))
+        elif event == "help_queue":
+            self.ui.post("groups_request_help", self.render_entries,
+                         "groups_request_help", list(data))
+        elif event == "getting_help":
+            self.ui.post("groups_getting_help", self.render_entries,
+                         "groups_getting_help", list(data))
+        elif event == "group_status":
+            self.ui.post(("group_status", data.row),
+                         self.render_group_status, data)
+        elif event == "group_status_all":
+            self.ui.post("group_status", self.render_table,
+                         "group_status", list(data))
+        elif event == "helping_timer_expired":
+            self.ui.post(None, self.notify_ta_to_finish_helping)
+        elif event == "help_claim_lost":
+            self.ui.post(None, self.notify_ta_help_claim_lost, data)
+
+    def render_table(self, table, rows):
+        """ Replace all the rows of a table """
+        self.app.replaceAllTableRows(table, rows, deleteHeader=False)
+
+    def render_entries(self, table, entries):
+        """ Replace all the rows of a table of requests, keeping the request id of every row """
+        self.table_ids[table] = [request_id for request_id, _ in entries]
+        self.render_table(table, [row for _, row in entries])
+
+    def render_group_status(self, record):
+        """ Render a single group of the registry in the "group_status" table """
+        # New groups are appended to the registry, so they are appended to the table as well
+        if record.row >= self.app.getTableRowCount("group_status"):
+            self.app.addTableRow("group_status", record.as_row())
+        else:
+            self.app.replaceTableRow("group_status", record.row, record.as_row())
 
-        # Update the table of assigned tasks
-        if self.app.getTableRowCount("assigned_tasks") == 0:
-            if len(body['assigned_tasks']) != 0:
-                for item in body['assigned_tasks']:
-                    self.app.addTableRow("assigned_tasks", [
-                        item[0], item[1]])
-
-                self.tasks_submitted = True
-
-                self.stm_driver.send('publish_tasks', self.ta_stm_name)
-
-        # Update the groups requesting help
-        if self.app.getTableRowCount("groups_request_help") == 0:
-            for item in body['groups_request_help']:
-                self.app.addTableRow("groups_request_help", [
-                    item[0], item[1], item[2]])
-
-        # Update the table of groups getting help
-        if self.app.getTableRowCount("groups_getting_help") == 0:
-            for item in body['groups_getting_help']:
-                self.app.addTableRow("groups_getting_help", [
-                    item[0], item[1], item[2], item[3]])
-
-        # Update the status of the groups
-        if self.app.getTableRowCount("group_status") == 0:
-            for item in body['group_status']:
-                self.app.addTableRow("group_status", [
-                    item[0], item[1]])
-                
     def notify_ta_to_finish_helping(self):
         self.app.popUp("Timer for giving group help has expired. Please finish helping the group and click the button to notify the TA that you are done.")
 
+    def notify_ta_help_claim_lost(self, group):
+        self.app.popUp(f"Another TA started helping {group} first.")
+
     def stop(self):
         """
         Stop the component.
         """
-        # stop the MQTT client
-        self.ta_mqtt_client.mqtt_client.loop_stop()
+        # stop the GUI updates first, releasing threads waiting to post one
+        self.ui.stop()
 
-        # stop the stmpy drivers
-        self.stm_driver.stop()
+        # stop the engine, the network loop flushes the last messages of the engine
+        self.engine.stop()
+        if self.network_loop is not None:
+            self.network_loop.stop()
 
         # Log the shutdown
         self._logger.info('Shutting down TA client component')
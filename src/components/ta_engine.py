@@ -0,0 +1,692 @@
+import logging
+import random
+import threading
+import time
+from functools import partial
+from state_machines.ta_stm import TaSTM
+from state_machines.timer_service import SystemClock, TimedDriver, TimerService
+from mqtt_clients.ta_mqtt_client import TaMqttClient
+from mqtt_clients.inbound_stage import OVERFLOW_BLOCK, OVERFLOW_GROW
+from mqtt_clients.tk_network_loop import NETWORK_LOOP_THREAD, NETWORK_LOOP_TK
+from mqtt_clients.codec import JSON
+from mqtt_clients.leader_election import HEARTBEAT_TIMEOUT
+from models.task_set import TaskSet
+from models.group_registry import GroupStatus
+from models.shared_state import SharedState, CHANGE_TASKS, CHANGE_GROUP_STATUS, \
+    CHANGE_REQUEST_HELP, CHANGE_GETTING_HELP, CHANGE_RECEIVED_HELP
+
+# Headless TA engine, owns the state of the lab session independent of any GUI
+
+# Longest random delay in seconds before answering a TA requesting the state,
+# so the other TAs hear the first answer and stay silent
+SYNC_REPLY_DELAY = 0.2
+
+
+class TaEngineError(Exception):
+    """ Raised when an action requested by the TA can not be performed """
+
+
+class TaEngine:
+
+    # State machine methods
+    def create_ta_stm(self):
+        """ Create a new ta state machine """
+        # Create a new group state machine
+        ta_stm = TaSTM.create_machine(
+            ta=self.ta_stm_name, component=self, logger=self._logger)
+        # Add the state machine to the driver
+        self.stm_driver.add_machine(ta_stm)
+
+    def __init__(self, logger, mqtt_client=None, network_loop=NETWORK_LOOP_THREAD, codec=JSON, retained_state=False,
+                 delivery_policies=None, spool_path=None, transport=None, recorder=None, timers=None,
+                 stm_driver=None):
+        # The driver runs the timers of the machines, such as a TimedDriver or a DriverPool
+        if stm_driver is not None and not hasattr(stm_driver, 'timers'):
+            raise TypeError(
+                f'The driver of the engine must be a TimedDriver or a DriverPool, not {type(stm_driver).__name__}')
+
+        # get the logger object for the engine
+        self._logger: logging.Logger = logger
+        self._logger.info('Starting TA engine')
+
+        # Listeners notified with (event, data) whenever the state changes
+        self._listeners = []
+
+        self.helping_group = False
+
+        # Id of the request the TA is helping with
+        self.helping_request = None
+
+        self.ta_name = None
+        self.ta_stm_name = None
+
+        # The tasks of the lab session as rows of description and duration,
+        # only shared with the other TAs once submitted
+        self.tasks = []
+
+        # The state shared with the other TAs, guarded by the lock as the
+        # answers to the other TAs are sent from the thread of the timer service
+        self.state = SharedState()
+        self._state_lock = threading.Lock()
+
+        # Version of the state received from the other TAs, by the client id of the TA
+        self.synced_versions = {}
+
+        # Groups waiting for the tasks from the leader, sent by this TA if it takes over, as
+        # {group: (time, leaderless)}. Groups present while there was a leader are forgotten
+        # after the heartbeat timeout, by then the leader sent the tasks or was dropped
+        self._awaiting_tasks = {}
+
+        # Keys of the timers of the answers to TAs requesting the state, waiting for their random delay
+        self._sync_replies = {}
+
+        # Tasks and the state of the groups are retained by the broker for late joiners
+        self.retained_state = retained_state
+
+        # Tasks retained by the broker, only taken once a group holds the same tasks as they
+        # may be left over from an earlier lab session, and the hashes of the tasks of the groups
+        self._retained_tasks = None
+        self._group_task_hashes = set()
+
+        # Version of the queue snapshot broadcast to the groups
+        self.queue_version = 0
+
+        # Create the MQTT handler, a client can be injected for running without a broker
+        if mqtt_client is None:
+            self.ta_mqtt_client = TaMqttClient(
+                self, logger, codec=codec, retained_state=retained_state, delivery_policies=delivery_policies,
+                spool_path=spool_path, transport=transport, recorder=recorder,
+                # The Tk main loop must not block on a full inbound queue, the handlers may wait for it
+                inbound_overflow=OVERFLOW_GROW if network_loop == NETWORK_LOOP_TK else OVERFLOW_BLOCK)
+
+            # Start the network loop of the MQTT client in its own thread, unless
+            # the GUI drives the network loop from the Tk event loop
+            if network_loop == NETWORK_LOOP_THREAD:
+                self.ta_mqtt_client.mqtt_client.loop_start()
+        else:
+            self.ta_mqtt_client = mqtt_client
+
+        # The timers of the state machine and of the answers to other TAs follow the
+        # clock of the timer service, a service with a simulated clock can be shared by many engines
+        if timers is None and stm_driver is not None:
+            timers = stm_driver.timers
+        self._owns_timers = timers is None
+        self.timers = TimerService(SystemClock(), logger) if timers is None else timers
+
+        # Start the stmpy driver, without any state machines for now, unless the
+        # machine runs on a driver pool shared with other engines
+        self._owns_driver = stm_driver is None
+        if stm_driver is None:
+            stm_driver = TimedDriver(self.timers)
+            stm_driver.start(keep_active=True)
+        self.stm_driver = stm_driver
+
+        self._logger.debug('TA engine initialization finished')
+
+    # The shared state
+
+    @property
+    def tasks_submitted(self):
+        return self.state.tasks_submitted
+
+    @property
+    def group_registry(self):
+        return self.state.group_registry
+
+    @property
+    def help_queue(self):
+        return self.state.help_queue
+
+    @property
+    def getting_help(self):
+        with self._state_lock:
+            return self.state.getting_help_rows()
+
+    def group_status(self, group):
+        """ Get a copy of the status record of a group, or None if the group is not present """
+        with self._state_lock:
+            record = self.group_registry.get(group)
+            return None if record is None else GroupStatus(record.group, record.status, record.row)
+
+    def group_status_rows(self):
+        """ Get the rows of all the groups and their status, ordered as in the view """
+        with self._state_lock:
+            return self.group_registry.rows()
+
+    def help_queue_entries(self):
+        """ Get the requests in the queue as (request id, row) pairs, in queue order """
+        with self._state_lock:
+            return [(request.request_id, request.as_row()) for request in self.help_queue.ordered()]
+
+    def getting_help_entries(self):
+        """ Get the groups getting help as (request id, row) pairs """
+        with self._state_lock:
+            return [(entry["id"], row) for entry, row
+                    in zip(self.state.getting_help.values(), self.state.getting_help_rows())]
+
+    def apply_change(self, change, data):
+        """ Apply a change to the shared state and notify the listeners """
+        with self._state_lock:
+            self.state.apply(change, data)
+
+        if change == CHANGE_TASKS:
+            self.tasks = [list(task) for task in self.state.tasks]
+            self.notify("tasks", self.tasks)
+            self.notify("group_status_all", self.group_status_rows())
+            self.stm_driver.send('publish_tasks', self.ta_stm_name)
+        elif change == CHANGE_GROUP_STATUS:
+            self.notify("group_status", self.group_status(data["group"]))
+        elif change == CHANGE_REQUEST_HELP:
+            self.notify("help_queue", self.help_queue_entries())
+            self.publish_queue_snapshot()
+        elif change == CHANGE_GETTING_HELP:
+            self.notify("help_queue", self.help_queue_entries())
+            self.notify("getting_help", self.getting_help_entries())
+            self.publish_queue_snapshot()
+        elif change == CHANGE_RECEIVED_HELP:
+            self.notify("getting_help", self.getting_help_entries())
+            self.publish_queue_snapshot()
+
+    # Change events
+
+    def add_listener(self, listener):
+        """ Register a callable receiving (event, data) on every change of the state
+
+        Events:
+            tasks: the rows of the assigned tasks
+            help_queue: the (request id, row) of the groups requesting help, in queue order
+            getting_help: the (request id, row) of the groups getting help
+            group_status: a single GroupStatus record that changed
+            group_status_all: the rows of all the groups and their status
+            helping_timer_expired: the TA has been helping a group for too long
+            help_claim_lost: another TA started helping the same group first, with the group
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def notify(self, event, data=None):
+        for listener in self._listeners:
+            listener(event, data)
+
+    # Actions of the TA
+
+    def login(self, name):
+        """ Log in the TA and join the lab session """
+        # Set the name of the TA
+        self.ta_name = name
+
+        ta_name_lower = self.ta_name.lower().replace(" ", "_")
+
+        # Set the endpont for the TA
+        self.ta_mqtt_client.ta_mqtt_endpoint = ta_name_lower
+
+        self.ta_stm_name = f"{ta_name_lower}_stm"
+
+        self.ta_mqtt_client.ta_name = self.ta_name
+
+        # Subscribe, request the state and notify the groups as soon as connected
+        self.ta_mqtt_client.join()
+
+        # Create the ta state machine
+        self.create_ta_stm()
+
+    def add_task(self, description, duration):
+        # Test if the description or duration is empty
+        if description == "" or duration == "":
+            raise TaEngineError("Description and duration must be filled")
+
+        # Test if the duration is a number
+        try:
+            int(duration)
+        except ValueError:
+            raise TaEngineError("Duration must be a number")
+
+        self.tasks.append([description, duration])
+        self.notify("tasks", self.tasks)
+
+    def submit_tasks(self):
+        # Test if there are any groups present
+        if len(self.group_registry) == 0:
+            raise TaEngineError("There are no groups to assign tasks to")
+
+        # Test if the tasks have already been submitted
+        if self.tasks_submitted:
+            raise TaEngineError(
+                "The tasks have already been submitted. Can only submitt tasks once")
+
+        # Test if there are any tasks
+        if len(self.tasks) == 0:
+            raise TaEngineError("There are no tasks to submit")
+
+        # Submit the tasks, changing the status of the groups to "Task 1 in progress"
+        self.apply_change(CHANGE_TASKS, {"tasks": self.tasks})
+
+        # Send the list of tasks to the groups
+        self.ta_mqtt_client.submit_tasks_to_groups(self.state.task_set)
+        # Send the list of tasks to the TAs
+        self.ta_mqtt_client.submit_tasks_to_tas(self.state.task_set)
+
+    def assign_getting_help(self, request_id):
+        """ Start helping the group of the given request in the help queue """
+        # Check if the TA is already helping a group (can only help one group at a time)
+        if self.helping_group:
+            raise TaEngineError("You are already helping a group")
+
+        # The queue may have changed since the view was rendered, the id still finds the request
+        with self._state_lock:
+            request = self.help_queue.get_request(request_id)
+            if request is None:
+                raise TaEngineError("The group is no longer waiting for help")
+
+            # The time of the claim settles which TA helps if several start at once
+            data = {
+                "id": request.request_id,
+                "group": request.group,
+                "description": request.description,
+                "time": request.time,
+                "ta": self.ta_name,
+                "at": time.time()
+            }
+
+        # Move the request from the queue to the groups getting help
+        self.helping_request = data["id"]
+        self.apply_change(CHANGE_GETTING_HELP, data)
+
+        # Log the action
+        self._logger.info(f"Group {data['group']} is getting help")
+
+        # Report to group that it is getting help
+        self.ta_mqtt_client.report_getting_help(data["group"])
+
+        self.ta_mqtt_client.notify_other_tas_getting_help(data)
+
+        # Change state to "helping_group"
+        self.stm_driver.send('help_group', self.ta_stm_name)
+
+    def assign_got_help(self, request_id):
+        """ Finish helping the group of the given request among the groups getting help """
+        with self._state_lock:
+            data = self.state.getting_help.get(request_id)
+            if data is None:
+                raise TaEngineError("The group is no longer getting help")
+            data = dict(data)
+
+        # Test if the ta is helping the group
+        if data["ta"] != self.ta_name:
+            raise TaEngineError("You are not helping this group")
+
+        # Remove the row from the groups getting help
+        self.helping_request = None
+        self.apply_change(CHANGE_RECEIVED_HELP, {"id": data["id"], "group": data["group"]})
+
+        # Log the action
+        self._logger.info(f"Group {data['group']} got help")
+
+        # Report to group that it got help
+        self.ta_mqtt_client.report_received_help(data["group"])
+
+        # Notify other TAs that the group got help
+        self.ta_mqtt_client.notify_other_tas_got_help(data["id"], data["group"])
+
+        # Change state to "not_helping_group"
+        self.stm_driver.send('help_recieved', self.ta_stm_name)
+
+    def update_group_with_tasks(self, group):
+        # Send the list of tasks to the group
+        self.ta_mqtt_client.send_tasks_to_group(group, self.state.task_set)
+
+    def await_tasks(self, group):
+        """ Remember a group waiting for the tasks from the leader, in case this TA takes over """
+        now = time.monotonic()
+        leaderless = not self.ta_mqtt_client.has_leader()
+
+        with self._state_lock:
+            for waiting, (since, without_leader) in list(self._awaiting_tasks.items()):
+                if not without_leader and now - since > HEARTBEAT_TIMEOUT:
+                    del self._awaiting_tasks[waiting]
+
+            self._awaiting_tasks[group] = (now, leaderless)
+
+    # Methods called by the state machine
+
+    def set_helping_group(self, helping):
+        self.helping_group = helping
+
+    def publish_queue_snapshot(self):
+        """ Broadcast the queue to the groups, each group finds its own queue number
+
+        Only the leader publishes, so the groups get a single queue number.
+        """
+        if not self.ta_mqtt_client.is_leader():
+            if not self.ta_mqtt_client.has_leader():
+                self._logger.debug('No leader, the queue is published by the next leader when taking over')
+            return
+
+        with self._state_lock:
+            self.queue_version += 1
+            groups = [request.group for request in self.help_queue.ordered()]
+
+        self.ta_mqtt_client.publish_queue_snapshot(self.queue_version, groups)
+
+    def notify_ta_to_finish_helping(self):
+        self.notify("helping_timer_expired")
+
+    # Handle request methods
+
+    def handle_request_help(self, header, body):
+        # Get the data from the payload
+        group = body['group']
+        description = body['description']
+        request_time = body['time']
+        # The queue is ordered by the time the request arrived, the clocks of the groups may be off
+        timestamp = time.time()
+        # Groups not sending an id get one derived from the request, the same on every TA
+        request_id = body.get('id', f"{group}@{request_time}")
+
+        # Add the request to the queue, a group already in the queue is repositioned
+        self.apply_change(CHANGE_REQUEST_HELP, {
+            "id": request_id, "group": group, "description": description, "time": request_time, "timestamp": timestamp})
+
+        # Log the action
+        self._logger.info(
+            f"Group {group} requested help with {description} at {request_time}")
+
+    def handle_queue_snapshot(self, header, body):
+        # Continue from the latest version published by any TA
+        self.queue_version = max(self.queue_version, body['version'])
+
+    def handle_group_present(self, header, body):
+        # Get the data from the payload
+        group = body['group']
+
+        # The tasks held by the group tell if the retained tasks are those of this lab session
+        self.match_retained_tasks(body.get('tasks_hash'))
+
+        # A group reconnecting keeps its status, such as its current task
+        record = self.group_status(group)
+
+        if len(self.tasks) == 0 and not self.tasks_submitted:
+            if record is None:
+                self.apply_change(CHANGE_GROUP_STATUS, {
+                    "group": group, "status": "Waiting for TAs to assign tasks..."})
+            return
+
+        # Add the group to the registry of groups and their status, unless it is already working on the tasks
+        if record is None or record.status == "Waiting for TAs to assign tasks...":
+            self.apply_change(CHANGE_GROUP_STATUS, {"group": group, "status": "Task 1 in progress"})
+
+        # A group rejoining tells the hash of the tasks it holds, they are only sent if changed
+        if self.tasks_submitted and body.get('tasks_hash') == self.state.task_set.hash:
+            return
+
+        # Send the list of tasks to the group, once for all the TAs,
+        # unless the group gets the retained tasks when subscribing
+        if self.tasks_submitted and not self.retained_state:
+            if self.ta_mqtt_client.is_leader():
+                self.update_group_with_tasks(group)
+            else:
+                self.await_tasks(group)
+
+    def handle_group_done(self, header, body):
+        # Get the data from the payload
+        group = body['group']
+
+        if group not in self.group_registry:
+            self._logger.error(f"Group {group} not found in registry")
+            return
+
+        with self._state_lock:
+            self._awaiting_tasks.pop(group, None)
+
+        # Mark the group as done in the registry
+        self.apply_change(CHANGE_GROUP_STATUS, {"group": group, "status": "Done"})
+
+    def handle_group_progress(self, header, body):
+        # Get the data from the payload
+        group = body['group']
+        task = body['current_task']
+        task = f"Task {task} in progress"
+
+        if group not in self.group_registry:
+            self._logger.error(f"Group {group} not found in registry")
+            return
+
+        # The group working on its tasks got them
+        with self._state_lock:
+            self._awaiting_tasks.pop(group, None)
+
+        # Update the status of the group in the registry
+        self.apply_change(CHANGE_GROUP_STATUS, {"group": group, "status": task})
+
+    def handle_group_state(self, header, body):
+        """ Register a group from its retained state, present before this TA joined """
+        group = body['group']
+
+        self.match_retained_tasks(body.get('tasks_hash'))
+
+        # The live messages of the group and the state of the other TAs are at least as fresh
+        if group in self.group_registry:
+            return
+
+        if body['done']:
+            status = "Done"
+        elif body['current_task'] is not None:
+            status = f"Task {body['current_task']} in progress"
+        elif self.tasks_submitted:
+            status = "Task 1 in progress"
+        else:
+            status = "Waiting for TAs to assign tasks..."
+
+        self.apply_change(CHANGE_GROUP_STATUS, {"group": group, "status": status})
+
+    def handle_retained_tasks(self, header, body):
+        """ Take the tasks retained by the broker, once a group holds the same tasks """
+        task_set = TaskSet.from_tasks(body)
+
+        with self._state_lock:
+            if task_set.hash not in self._group_task_hashes:
+                self._retained_tasks = task_set
+                return
+
+        self.handle_submitted_tasks(header, body)
+
+    def match_retained_tasks(self, tasks_hash):
+        # Take the retained tasks held back if a group holds the same tasks
+        if tasks_hash is None:
+            return
+
+        with self._state_lock:
+            self._group_task_hashes.add(tasks_hash)
+
+            retained = self._retained_tasks
+            if retained is None or retained.hash != tasks_hash:
+                return
+
+            self._retained_tasks = None
+
+        self._logger.info("The retained tasks are held by a group, taking them")
+        self.handle_submitted_tasks(None, retained.tasks())
+
+    def handle_ta_update_tasks(self, header, body):
+        # Testing if the message is from the same TA then do nothing
+        if header == self.ta_name:
+            return
+
+        self.handle_submitted_tasks(header, body)
+
+    def handle_submitted_tasks(self, header, body):
+        # The tasks can only be submitted once
+        if self.tasks_submitted:
+            self._logger.info(
+                "The tasks have already been submitted. Can only submitt tasks once")
+            return
+
+        # Submit the tasks, changing the status of the groups to "Task 1 in progress"
+        self.apply_change(CHANGE_TASKS, {"tasks": [
+            [task['description'], task['duration']] for task in body]})
+
+    def handle_ta_update_receiving_help(self, header, body):
+        # Testing if the message is from the same TA then do nothing
+        if header == self.ta_name:
+            return
+
+        # Move the request from the queue to the groups getting help
+        self.apply_change(CHANGE_GETTING_HELP, body)
+
+        # Stop helping if the other TA claimed the request first
+        with self._state_lock:
+            entry = self.state.getting_help.get(body['id'])
+
+        if self.helping_request == body['id'] and entry is not None and entry['ta'] != self.ta_name:
+            self._logger.warning(
+                f"{entry['ta']} started helping group {entry['group']} first")
+            self.helping_request = None
+            self.stm_driver.send('help_recieved', self.ta_stm_name)
+            self.notify("help_claim_lost", entry['group'])
+
+    def handle_ta_update_received_help(self, header, body):
+        # Testing if the message is from the same TA then do nothing
+        if header == self.ta_name:
+            return
+
+        # Remove the request from the groups getting help
+        self.apply_change(CHANGE_RECEIVED_HELP, {"id": body['id'], "group": body.get('group')})
+
+    def handle_leader_changed(self, leader):
+        if not self.ta_mqtt_client.is_leader():
+            # The groups waiting while there was no leader are sent their tasks by the new leader
+            if leader is not None:
+                now = time.monotonic()
+                with self._state_lock:
+                    for group, (since, leaderless) in self._awaiting_tasks.items():
+                        if leaderless:
+                            self._awaiting_tasks[group] = (now, False)
+            return
+
+        self._logger.info("This TA is now the leader")
+
+        # Taking over, send the tasks to the groups joining while there was no leader or
+        # right before the previous leader was dropped
+        with self._state_lock:
+            groups = list(self._awaiting_tasks)
+            self._awaiting_tasks.clear()
+
+        if self.tasks_submitted:
+            for group in groups:
+                self.update_group_with_tasks(group)
+
+        # The groups may have missed the last queue of the previous leader, or none was published
+        self.publish_queue_snapshot()
+
+    # Synchronization of the shared state with the other TAs
+
+    def handle_request_sync(self, header, body):
+        # The TAs are told apart by their client ids, as they may share a name
+        requester = body['id']
+
+        # Test if the message is from the same TA then do nothing
+        if requester == self.ta_mqtt_client.client_id:
+            return
+
+        # Nothing to tell before anything happened in the lab session
+        if self.state.version == 0:
+            return
+
+        # Answer after a random delay, unless a TA at least as fresh answers first,
+        # replacing an answer to the same TA still waiting
+        key = (self.ta_name, 'reply_sync', requester)
+        with self._state_lock:
+            self._sync_replies[requester] = key
+
+        # The version of this TA the requester received last, if any
+        version = body['versions'].get(self.ta_mqtt_client.client_id)
+        self.timers.call_later(random.uniform(0, SYNC_REPLY_DELAY),
+                               partial(self.reply_sync, requester, version), key=key)
+
+    def handle_sync_claim(self, header, body):
+        # Test if the message is from the same TA then do nothing
+        if body['id'] == self.ta_mqtt_client.client_id:
+            return
+
+        # Stay silent, the versions of the TA answering can not be compared with ours
+        # and the requester keeps what it already has when merging the answer
+        with self._state_lock:
+            key = self._sync_replies.pop(body['requester'], None)
+
+        if key is not None:
+            self.timers.cancel(key)
+
+    def reply_sync(self, requester, version):
+        """ Send the TA requesting the state a snapshot and the changes since """
+        with self._state_lock:
+            # Cancelled by a TA answering first
+            if self._sync_replies.pop(requester, None) is None:
+                return
+
+            current_version = self.state.version
+            snapshot_version, snapshot, changes = self.state.changes_since(version)
+
+        # Tell the other TAs to stay silent
+        self.ta_mqtt_client.claim_sync(requester)
+
+        self.ta_mqtt_client.send_sync_state(requester, {
+            # The versions are those of this TA, told apart by its client id
+            "origin": self.ta_mqtt_client.client_id,
+            "version": current_version,
+            "snapshot_version": snapshot_version,
+            "snapshot": snapshot,
+            "changes": changes,
+        })
+
+    def handle_sync_state(self, header, body):
+        received = SharedState.replay(
+            body['snapshot_version'], body['snapshot'], body['changes'])
+
+        with self._state_lock:
+            # Skip an answer not newer than the one already received from the same TA
+            if body['version'] <= self.synced_versions.get(body['origin'], 0):
+                return
+
+            self.synced_versions[body['origin']] = body['version']
+            submitted = self.tasks_submitted
+            # Changes already received from the groups are kept
+            self.state.merge(received)
+
+        self._logger.info(
+            f"Synchronized the state with {header} at version {body['version']}")
+
+        if self.tasks_submitted and not submitted:
+            self.tasks = [list(task) for task in self.state.tasks]
+            self.stm_driver.send('publish_tasks', self.ta_stm_name)
+
+        self.notify("tasks", self.tasks)
+        self.notify("help_queue", self.help_queue_entries())
+        self.notify("getting_help", self.getting_help_entries())
+        self.notify("group_status_all", self.group_status_rows())
+
+    def stop(self):
+        """
+        Stop the engine.
+        """
+        # Cancel the answers to other TAs not sent yet
+        with self._state_lock:
+            keys = list(self._sync_replies.values())
+            self._sync_replies.clear()
+
+        for key in keys:
+            self.timers.cancel(key)
+
+        # stop the MQTT client, marking the TA as offline
+        self.ta_mqtt_client.leave()
+        self.ta_mqtt_client.mqtt_client.loop_stop()
+
+        # stop the stmpy drivers
+        if self._owns_driver:
+            self.stm_driver.stop()
+        if self._owns_timers:
+            self.timers.stop()
+
+        # Log the shutdown
+        self._logger.info('Shutting down TA engine')
@@ -0,0 +1,103 @@
+# Dispatcher of GUI updates from other threads to the Tk main loop
+from collections import OrderedDict
+import itertools
+import logging
+import threading
+
+
+class UiDispatcher:
+    """ Bounded queue of GUI updates, drained by the Tk main loop at a fixed frame rate
+
+    Tk is not thread safe, so the MQTT network thread and the stmpy driver thread
+    post their updates here instead of calling appJar directly. Updates posted with
+    the same key within one frame are collapsed, only the latest one is run, in the
+    place of the first post, so updates depending on their order, such as rows
+    appended to a table, keep it. No update is dropped: when the queue is full, other
+    threads wait for the next frame, while the Tk main loop, which can not wait for
+    itself, lets the queue grow past the bound.
+    """
+
+    def __init__(self, logger, frame_rate=30, max_updates=1000):
+        self._logger: logging.Logger = logger
+        self._interval = int(1000 / frame_rate)
+        self._max_updates = max_updates
+
+        # Pending updates, keyed on the widget they update
+        self._updates = OrderedDict()
+        self._condition = threading.Condition()
+        # Unique keys for updates that must never be collapsed
+        self._counter = itertools.count()
+
+        self._app = None
+        self._main_thread = None
+        self._stopped = False
+        # Updates queued past the bound by the Tk main loop
+        self.overflowed = 0
+
+    def start(self, app):
+        """ Start draining the updates in the main loop of the given appJar gui
+
+        Called on the Tk main thread.
+        """
+        self._app = app
+        self._main_thread = threading.get_ident()
+        self._app.after(self._interval, self._drain)
+
+    def stop(self):
+        """ Stop draining, releasing the threads waiting for room and ignoring later updates """
+        with self._condition:
+            self._stopped = True
+            self._updates.clear()
+            self._condition.notify_all()
+
+    def post(self, key, function, *args):
+        """ Queue a GUI update, replacing any pending update with the same key
+
+        Args:
+            key: The widget updated, or None if the update must not be collapsed.
+            function: The function run in the Tk main loop.
+            args: The arguments of the function.
+        """
+        with self._condition:
+            if self._stopped:
+                return
+
+            if key is not None and key in self._updates:
+                # Keep only the latest update of the widget, in the place of the first one
+                self._updates[key] = (function, args)
+                return
+
+            if key is None:
+                key = next(self._counter)
+
+            while len(self._updates) >= self._max_updates and not self._stopped:
+                if self._app is None or threading.get_ident() == self._main_thread:
+                    # Nothing drains the queue before start, and the main loop can not wait for itself
+                    self.overflowed += 1
+                    if self.overflowed == 1 or self.overflowed % self._max_updates == 0:
+                        self._logger.warning(
+                            f'GUI update queue full, queued {self.overflowed} updates past the bound')
+                    break
+                self._condition.wait()
+
+            if self._stopped:
+                return
+
+            self._updates[key] = (function, args)
+
+    def _drain(self):
+        # Take all the updates of the frame, new updates are queued for the next frame
+        with self._condition:
+            if self._stopped:
+                return
+            updates = self._updates
+            self._updates = OrderedDict()
+            self._condition.notify_all()
+
+        for function, args in updates.values():
+            try:
+                function(*args)
+            except Exception:
+                self._logger.exception('GUI update failed')
+
+        self._app.after(self._interval, self._drain)
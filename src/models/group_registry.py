@@ -0,0 +1,68 @@
+# Registry of the groups present in the lab
+
+class GroupStatus:
+    """ Status record for a single group present in the lab """
+
+    def __init__(self, group, status, row):
+        self.group = group
+        self.status = status
+        # The row of the group in the view rendering the registry
+        self.row = row
+
+    def as_row(self):
+        """ Get the record as a table row """
+        return [self.group, self.status]
+
+
+class GroupRegistry:
+    """ Registry of the groups and their status, indexed on the group name """
+
+    def __init__(self):
+        # Dicts keep the insertion order, which is also the order of the rows in the view
+        self._groups: dict[str, GroupStatus] = {}
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, group):
+        return group in self._groups
+
+    def __iter__(self):
+        return iter(self._groups.values())
+
+    def get(self, group):
+        """ Get the status record of a group, or None if the group is not present """
+        return self._groups.get(group)
+
+    def add(self, group, status):
+        """ Add a group to the registry, updating the status if the group is already present """
+        record = self._groups.get(group)
+
+        if record is not None:
+            record.status = status
+            return record
+
+        record = GroupStatus(group, status, row=len(self._groups))
+        self._groups[group] = record
+
+        return record
+
+    def update(self, group, status):
+        """ Update the status of a group, returns None if the group is not present """
+        record = self._groups.get(group)
+
+        if record is None:
+            return None
+
+        record.status = status
+
+        return record
+
+    def set_all(self, status):
+        """ Set the same status for all the groups """
+        for record in self._groups.values():
+            record.status = status
+
+    def rows(self):
+        """ Get all the records as table rows, ordered as in the view """
+        return [record.as_row() for record in self._groups.values()]
@@ -0,0 +1,156 @@
+# Queue of the groups requesting help, ordered by the time of the request
+import heapq
+import itertools
+
+
+class HelpRequest:
+    """ A help request from a group waiting in the queue """
+
+    def __init__(self, group, description, time, timestamp, order, request_id=None):
+        # Unique id of the request, the same on every TA
+        self.request_id = request_id
+        self.group = group
+        self.description = description
+        # The time of the request as shown in the GUI (HH:MM:SS)
+        self.time = time
+        # The epoch time the request arrived at a TA, used for ordering the queue
+        self.timestamp = timestamp
+        # Tie breaker for requests with the same timestamp
+        self.order = order
+
+    def key(self):
+        return (self.timestamp, self.order)
+
+    def as_row(self):
+        """ Get the request as a table row """
+        return [self.group, self.description, self.time]
+
+
+class HelpQueue:
+    """ Binary heap of help requests with lazy deletion, keyed on the epoch timestamp of the request
+
+    The index maps every group to its entry in the heap. A request is inserted
+    in O(log n), and removed or repositioned by marking its entry as removed,
+    in O(1), plus O(log n) for pushing the new entry. Removed entries are
+    dropped once they reach the top of the heap, or all at once when they
+    outnumber the requests. Requests can also be looked up by their id, each
+    group has at most one request in the queue.
+
+    The queue order and the queue numbers are sorted from the heap when read,
+    and cached until the next change.
+    """
+
+    def __init__(self):
+        # Entries as [timestamp, order, request], the request is None once removed
+        self._heap: list[list] = []
+        # The entry of every group in the queue
+        self._index: dict[str, list] = {}
+        # The group of every request id in the queue
+        self._ids: dict[str, str] = {}
+        self._counter = itertools.count()
+
+        # Cached ordering of the queue, invalidated on every change
+        self._ordered = None
+        self._positions = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, group):
+        return group in self._index
+
+    def get(self, group):
+        """ Get the request of a group, or None if the group is not in the queue """
+        entry = self._index.get(group)
+        return None if entry is None else entry[2]
+
+    def get_request(self, request_id):
+        """ Get a request by its id, or None if it is not in the queue """
+        group = self._ids.get(request_id)
+        return None if group is None else self.get(group)
+
+    def push(self, group, description, time, timestamp, request_id=None):
+        """ Add a request to the queue, repositioning it if the group is already queued """
+        request = self.get(group)
+
+        if request is not None:
+            self._unlink(group)
+            self._ids.pop(request.request_id, None)
+            request.request_id = request_id
+            request.description = description
+            request.time = time
+            request.timestamp = timestamp
+            request.order = next(self._counter)
+        else:
+            request = HelpRequest(group, description, time,
+                                  timestamp, next(self._counter), request_id)
+
+        if request_id is not None:
+            self._ids[request_id] = group
+
+        entry = [request.timestamp, request.order, request]
+        self._index[group] = entry
+        heapq.heappush(self._heap, entry)
+        self._invalidate()
+
+        return request
+
+    def remove(self, group):
+        """ Remove the request of a group, returns None if the group is not in the queue """
+        request = self.get(group)
+
+        if request is None:
+            return None
+
+        self._ids.pop(request.request_id, None)
+        self._unlink(group)
+        self._invalidate()
+
+        return request
+
+    def remove_request(self, request_id):
+        """ Remove a request by its id, returns None if it is not in the queue """
+        group = self._ids.get(request_id)
+        return None if group is None else self.remove(group)
+
+    def peek(self):
+        """ Get the first request in the queue without removing it """
+        heap = self._heap
+
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+
+        return heap[0][2] if heap else None
+
+    def ordered(self):
+        """ Get the requests in queue order """
+        if self._ordered is None:
+            self._ordered = [entry[2] for entry in sorted(self._index.values(), key=lambda entry: entry[:2])]
+
+        return list(self._ordered)
+
+    def position(self, group):
+        """ Get the queue number of a group (starting at 1), or None if it is not queued """
+        if self._positions is None:
+            self._positions = {request.group: number for number,
+                               request in enumerate(self.ordered(), start=1)}
+
+        return self._positions.get(group)
+
+    def rows(self):
+        """ Get all the requests as table rows, in queue order """
+        return [request.as_row() for request in self.ordered()]
+
+    def _unlink(self, group):
+        # Mark the entry as removed, it is dropped from the heap later
+        entry = self._index.pop(group)
+        entry[2] = None
+
+        # Drop the removed entries once they outnumber the requests
+        if len(self._heap) > 2 * len(self._index) + 16:
+            self._heap = [entry for entry in self._heap if entry[2] is not None]
+            heapq.heapify(self._heap)
+
+    def _invalidate(self):
+        self._ordered = None
+        self._positions = None
@@ -0,0 +1,241 @@
+# State of the lab session shared between the TAs
+from collections import deque
+from models.group_registry import GroupRegistry
+from models.help_queue import HelpQueue
+from models.task_set import TaskSet
+
+# The changes of the shared state
+CHANGE_TASKS = 'tasks'
+CHANGE_GROUP_STATUS = 'group_status'
+CHANGE_REQUEST_HELP = 'request_help'
+CHANGE_GETTING_HELP = 'getting_help'
+CHANGE_RECEIVED_HELP = 'received_help'
+
+
+class SharedState:
+    """ State of the lab session, changed only through versioned changes
+
+    Every change increments the version and is kept in a change log, so a TA
+    joining late can be sent one snapshot plus the changes made since the
+    snapshot was taken. The log is compacted into a new snapshot when it grows
+    beyond max_changes.
+
+    The version counts the changes applied by this TA, in the order it received
+    them, so the versions of different TAs can not be compared. A TA asking for
+    the state again gives the version it last received from the same TA.
+    """
+
+    def __init__(self, max_changes=500):
+        # The submitted tasks, as a task set and as rows of description and duration
+        self.task_set = None
+        self.tasks = []
+        self.tasks_submitted = False
+
+        # The groups present and their status
+        self.group_registry = GroupRegistry()
+
+        # The groups requesting help
+        self.help_queue = HelpQueue()
+
+        # The requests being helped with by id, as the data of the getting_help change
+        self.getting_help: dict[str, dict] = {}
+
+        # Ids of the requests the groups got help with and their groups, so late or repeated
+        # changes are ignored. Only the last finished request of a group is kept, until the
+        # group sends a newer request
+        self.finished: dict[str, str] = {}
+        self._finished_of_group: dict[str, str] = {}
+
+        # Number of changes applied to the state by this TA
+        self.version = 0
+
+        # Log of [version, change, data] since the last snapshot
+        self._max_changes = max_changes
+        self._changes = deque()
+        self._snapshot_version = 0
+        self._snapshot = self.create_snapshot()
+
+        self._appliers = {
+            CHANGE_TASKS: self._apply_tasks,
+            CHANGE_GROUP_STATUS: self._apply_group_status,
+            CHANGE_REQUEST_HELP: self._apply_request_help,
+            CHANGE_GETTING_HELP: self._apply_getting_help,
+            CHANGE_RECEIVED_HELP: self._apply_received_help,
+        }
+
+    def apply(self, change, data):
+        """ Apply a change to the state and record it in the change log """
+        self._appliers[change](data)
+
+        self.version += 1
+        self._changes.append([self.version, change, data])
+
+        # Compact the log into a new snapshot
+        if len(self._changes) > self._max_changes:
+            self._compact()
+
+    def changes_since(self, version):
+        """ Get the snapshot and the changes needed to bring a state at the given version up to date
+
+        The version must be one of this state, None for a TA that never received
+        it. Returns the version of the snapshot, the snapshot (None if the changes
+        are enough on their own) and the list of [version, change, data].
+        """
+        if version is not None and self._snapshot_version <= version <= self.version:
+            return version, None, [entry for entry in self._changes if entry[0] > version]
+
+        return self._snapshot_version, self._snapshot, list(self._changes)
+
+    def create_snapshot(self):
+        """ Get the whole state as plain lists """
+        return {
+            "tasks": [list(task) for task in self.tasks],
+            "tasks_submitted": self.tasks_submitted,
+            # The epoch time and id of the request are appended to the row
+            "help_queue": [request.as_row() + [request.timestamp, request.request_id]
+                           for request in self.help_queue.ordered()],
+            "getting_help": list(self.getting_help.values()),
+            "finished": [[request_id, group] for request_id, group in self.finished.items()],
+            "group_status": self.group_registry.rows(),
+        }
+
+    def getting_help_rows(self):
+        """ Get the groups getting help as rows of group, description, time and TA """
+        return [[entry["group"], entry["description"], entry["time"], entry["ta"]]
+                for entry in self.getting_help.values()]
+
+    @staticmethod
+    def replay(version, snapshot, changes):
+        """ Create a state from a snapshot at the given version and the changes made since """
+        state = SharedState()
+
+        if snapshot is not None:
+            state._load(snapshot)
+
+        state.version = version
+
+        for _, change, data in changes:
+            state.apply(change, data)
+
+        return state
+
+    def merge(self, other):
+        """ Add what is only known by the other state, entries already known here are kept """
+        if not self.tasks_submitted and other.tasks_submitted:
+            self._apply_tasks({"tasks": other.tasks})
+
+        for record in other.group_registry:
+            if record.group not in self.group_registry:
+                self.group_registry.add(record.group, record.status)
+
+        for request_id, group in other.finished.items():
+            # A finished request of the group known here may be newer, keep it unless the request is still open
+            if group not in self._finished_of_group or request_id in self.getting_help \
+                    or self.help_queue.get_request(request_id) is not None:
+                self._apply_received_help({"id": request_id, "group": group})
+
+        for entry in other.getting_help.values():
+            self._apply_getting_help(entry)
+
+        for request in other.help_queue.ordered():
+            if request.group not in self.help_queue:
+                self._apply_request_help({
+                    "id": request.request_id, "group": request.group, "description": request.description,
+                    "time": request.time, "timestamp": request.timestamp})
+
+        # Merging is a change of its own, the versions of the other state mean nothing here
+        self.version += 1
+
+        # The merged entries are not in the change log, start over from a new snapshot
+        self._compact()
+
+    def _compact(self):
+        self._snapshot = self.create_snapshot()
+        self._snapshot_version = self.version
+        self._changes.clear()
+
+    def _load(self, snapshot):
+        if snapshot["tasks_submitted"]:
+            self._apply_tasks({"tasks": snapshot["tasks"]})
+
+        for group, status in snapshot["group_status"]:
+            self.group_registry.add(group, status)
+
+        for group, description, time, timestamp, request_id in snapshot["help_queue"]:
+            self.help_queue.push(group, description, time,
+                                 timestamp, request_id)
+
+        self.getting_help = {entry["id"]: entry for entry in snapshot["getting_help"]}
+
+        for request_id, group in snapshot["finished"]:
+            self._finish(request_id, group)
+
+    def _apply_tasks(self, data):
+        # Tasks can only be submitted once
+        if self.tasks_submitted:
+            return
+
+        self.task_set = TaskSet(data["tasks"])
+        self.tasks = self.task_set.rows()
+        self.tasks_submitted = True
+
+        # All the groups start on the first task
+        self.group_registry.set_all("Task 1 in progress")
+
+    def _apply_group_status(self, data):
+        self.group_registry.add(data["group"], data["status"])
+
+    # The help changes are keyed on the id of the request, applying them again changes nothing
+
+    def _apply_request_help(self, data):
+        request_id = data["id"]
+
+        if request_id in self.finished or request_id in self.getting_help \
+                or self.help_queue.get_request(request_id) is not None:
+            return
+
+        # Late changes of the finished request of the group are no longer expected
+        self._forget_finished(data["group"])
+
+        # A group already in the queue is repositioned
+        self.help_queue.push(data["group"], data["description"],
+                             data["time"], data["timestamp"], request_id)
+
+    def _apply_getting_help(self, data):
+        request_id = data["id"]
+
+        if request_id in self.finished:
+            return
+
+        # TAs starting to help with the same request at once: the earliest claim wins on every TA
+        current = self.getting_help.get(request_id)
+        if current is not None and (current["at"], current["ta"]) <= (data["at"], data["ta"]):
+            return
+
+        self.help_queue.remove_request(request_id)
+        self.getting_help[request_id] = data
+
+    def _apply_received_help(self, data):
+        request_id = data["id"]
+
+        request = self.help_queue.remove_request(request_id)
+        entry = self.getting_help.pop(request_id, None)
+
+        if request_id in self.finished:
+            return
+
+        # Changes from TAs not sending the group take it from the request
+        group = data.get("group") or (entry["group"] if entry is not None else None) \
+            or (request.group if request is not None else request_id)
+        self._finish(request_id, group)
+
+    def _finish(self, request_id, group):
+        self._forget_finished(group)
+        self.finished[request_id] = group
+        self._finished_of_group[group] = request_id
+
+    def _forget_finished(self, group):
+        request_id = self._finished_of_group.pop(group, None)
+
+        if request_id is not None:
+            self.finished.pop(request_id, None)
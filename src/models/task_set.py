@@ -0,0 +1,54 @@
+# The tasks of a lab session once submitted
+import hashlib
+import json
+
+
+class TaskSet:
+    """ Immutable list of tasks, with a content hash
+
+    The task list is built once when the tasks are submitted. Groups holding a
+    task set tell the TAs its hash, so the tasks are not sent again.
+    """
+
+    __slots__ = ('_rows', '_tasks', 'hash')
+
+    def __init__(self, rows):
+        # The tasks as rows of description and duration
+        self._rows = tuple((str(description), str(duration))
+                           for description, duration in rows)
+
+        # The tasks as sent to the groups, numbered from 1
+        self._tasks = tuple({"task": str(number), "description": description, "duration": duration}
+                            for number, (description, duration) in enumerate(self._rows, start=1))
+
+        self.hash = task_set_hash(self._rows)
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """ Create a task set from the task dictionaries sent to the groups """
+        return cls([(task['description'], task['duration']) for task in tasks])
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __eq__(self, other):
+        return isinstance(other, TaskSet) and self.hash == other.hash
+
+    def __hash__(self):
+        return hash(self.hash)
+
+    def rows(self):
+        """ Get the tasks as rows of description and duration """
+        return [list(row) for row in self._rows]
+
+    def tasks(self):
+        """ Get copies of the tasks as dictionaries of number, description and duration """
+        return [dict(task) for task in self._tasks]
+
+
+def task_set_hash(rows):
+    """ Content hash of the tasks as rows of description and duration """
+    content = json.dumps([[str(description), str(duration)] for description, duration in rows],
+                         separators=(',', ':'), ensure_ascii=False)
+
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
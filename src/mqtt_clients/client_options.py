@@ -0,0 +1,44 @@
+# Command line options shared by the TA client, the group client and the headless TA server
+from mqtt_clients.codec import JSON, available_codecs
+from mqtt_clients.delivery_policy import PROFILES, RELIABLE, DeliveryPolicies, load_overrides
+from mqtt_clients.tk_network_loop import NETWORK_LOOP_THREAD, NETWORK_LOOP_TK
+from mqtt_clients.traffic_log import TrafficRecorder
+
+
+def add_client_arguments(parser, network_loop=False):
+    """ Add the options of the MQTT client to an argument parser, the network loop only for the GUI clients """
+    if network_loop:
+        parser.add_argument("--network-loop", choices=[NETWORK_LOOP_THREAD, NETWORK_LOOP_TK], default=NETWORK_LOOP_THREAD,
+                            help="run the MQTT network loop in its own thread or in the Tk event loop")
+    parser.add_argument("--codec", choices=available_codecs(), default=JSON,
+                        help="preferred wire format, JSON is used until every known peer supports it")
+    parser.add_argument("--retained-state", action="store_true",
+                        help="publish the tasks and the state of the groups as retained messages, rebuilt by late joiners on subscribe")
+    parser.add_argument("--delivery-profile", choices=list(PROFILES), default=RELIABLE,
+                        help="QoS, retain flag and expiry of every command")
+    parser.add_argument("--delivery-policy", metavar="FILE",
+                        help="JSON file overriding the delivery profile per command, e.g. {\"queue_snapshot\": {\"qos\": 0}}")
+    parser.add_argument("--spool", metavar="FILE",
+                        help="file keeping the messages published while disconnected, replayed once reconnected")
+    parser.add_argument("--record", metavar="FILE",
+                        help="append the received and published messages to a traffic log, replayed by benchmarks.traffic_replay")
+
+
+def client_options(args, logger):
+    """ Get the keyword arguments of the components and the engine from the parsed options """
+    # Delivery policy of every command, from the profile and the overrides
+    delivery_policies = DeliveryPolicies(args.delivery_profile, load_overrides(
+        args.delivery_policy) if args.delivery_policy else None)
+
+    options = {
+        "codec": args.codec,
+        "retained_state": args.retained_state,
+        "delivery_policies": delivery_policies,
+        "spool_path": args.spool,
+        "recorder": TrafficRecorder(args.record, logger) if args.record else None,
+    }
+
+    if hasattr(args, "network_loop"):
+        options["network_loop"] = args.network_loop
+
+    return options
@@ -0,0 +1,131 @@
+# Wire formats of the MQTT message payloads
+import json
+
+# Compact binary formats are optional, JSON is always available
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# Errors raised by the decoders of the available wire formats
+DECODE_ERRORS = (ValueError, TypeError)
+if msgpack is not None:
+    DECODE_ERRORS += (msgpack.exceptions.UnpackException,)
+if cbor2 is not None:
+    DECODE_ERRORS += (cbor2.CBORDecodeError,)
+
+# Names of the wire formats
+JSON = 'json'
+MSGPACK = 'msgpack'
+CBOR = 'cbor'
+
+# The first byte of a binary payload marks the wire format and its version.
+# JSON payloads have no marker, they always start with '{', so old clients keep working.
+MSGPACK_V1 = 0x01
+CBOR_V1 = 0x02
+
+
+class CodecError(Exception):
+    """ Raised when a payload can not be encoded or decoded """
+
+
+def available_codecs():
+    """ Get the names of the wire formats this client can decode """
+    codecs = [JSON]
+
+    if msgpack is not None:
+        codecs.append(MSGPACK)
+    if cbor2 is not None:
+        codecs.append(CBOR)
+
+    return codecs
+
+
+def encode(message, codec=JSON):
+    """ Encode a message of command, header and body in the given wire format """
+    if codec == JSON:
+        return json.dumps(message).encode('utf-8')
+
+    # The binary formats send the message as a list instead of repeating the keys
+    compact = [message['command'], message['header'], message['body']]
+
+    if codec == MSGPACK and msgpack is not None:
+        return bytes([MSGPACK_V1]) + msgpack.packb(compact)
+    if codec == CBOR and cbor2 is not None:
+        return bytes([CBOR_V1]) + cbor2.dumps(compact)
+
+    raise CodecError(f'Wire format {codec} is not available')
+
+
+def decode(payload):
+    """ Decode a payload in any of the available wire formats into a message dict """
+    if not payload:
+        raise CodecError('Empty payload')
+
+    marker = payload[0]
+
+    try:
+        if marker == MSGPACK_V1 and msgpack is not None:
+            command, header, body = msgpack.unpackb(payload[1:])
+        elif marker == CBOR_V1 and cbor2 is not None:
+            command, header, body = cbor2.loads(payload[1:])
+        else:
+            return json.loads(payload)
+    except DECODE_ERRORS as e:
+        raise CodecError(f'Could not decode payload: {e}')
+
+    return {"command": command, "header": header, "body": body}
+
+
+class MessageCodec:
+    """ Encodes the messages of a client, negotiating the wire format with its peers
+
+    The client sends in its preferred wire format only once it knows of at least
+    one peer and every peer it knows of has announced support for it, otherwise
+    it falls back to JSON. Peers announce the wire formats they can decode in
+    their presence messages. Retained messages are always sent in JSON, they are
+    delivered to clients joining later, which may not decode the preferred format.
+    """
+
+    def __init__(self, preferred=JSON):
+        if preferred not in available_codecs():
+            raise CodecError(f'Wire format {preferred} is not available')
+
+        self.preferred = preferred
+        # Every peer known, and the peers not able to decode the preferred wire format
+        self._peers = set()
+        self._legacy_peers = set()
+
+    def supported(self):
+        return available_codecs()
+
+    def peer_supports(self, peer, codecs):
+        """ Register the wire formats announced by a peer, None for peers announcing nothing """
+        self._peers.add(peer)
+
+        if codecs is None or self.preferred not in codecs:
+            self._legacy_peers.add(peer)
+        else:
+            self._legacy_peers.discard(peer)
+
+    def peer_left(self, peer):
+        self._peers.discard(peer)
+        self._legacy_peers.discard(peer)
+
+    def current(self, retained=False):
+        """ Get the wire format currently used for sending, a retained message or not """
+        if retained or not self._peers or self._legacy_peers:
+            return JSON
+
+        return self.preferred
+
+    def encode(self, message, retained=False):
+        return encode(message, self.current(retained))
+
+    def decode(self, payload):
+        return decode(payload)
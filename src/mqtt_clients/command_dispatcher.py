@@ -0,0 +1,131 @@
+# Dispatching of received MQTT messages to the handlers of the commands
+from collections import Counter, defaultdict
+from functools import partial
+import logging
+import time
+from mqtt_clients.codec import CodecError
+from mqtt_clients.traffic_log import INBOUND
+
+
+class CommandDispatcher:
+    """ Dispatches MQTT messages to handlers registered per topic filter and command
+
+    Every topic filter gets its own paho message callback, so a message is only
+    decoded if a handler is registered for its topic, and the command is looked
+    up in the table of that topic instead of being tested against every command.
+    With an inbound stage, the handlers are run by the stage instead of the
+    network loop. With a recorder, every received message is logged as is.
+    """
+
+    def __init__(self, mqtt_client, codec, logger, inbound=None, recorder=None):
+        self._logger: logging.Logger = logger
+        self.mqtt_client = mqtt_client
+        # Decodes the payloads in any of the supported wire formats
+        self.codec = codec
+        # Queue of the decoded messages, handled by its own thread
+        self.inbound = inbound
+        # Log of the received traffic, for replaying the session
+        self.recorder = recorder
+
+        # Seconds spent in the handlers of every command, once profiling is enabled
+        self.handler_times = None
+
+        # Command table of every topic filter, the values are (handler, pass_message, coalesce, sender)
+        self._routes: dict[str, dict] = {}
+
+        # Counters of the messages that could not be dispatched
+        self.unknown_commands = Counter()
+        self.unknown_topics = Counter()
+
+        # Messages on topics without any handlers end up here, without being decoded
+        self.mqtt_client.on_message = self.on_unknown_topic
+
+    def register(self, topic_filter, command, handler, pass_message=False, coalesce=None, sender=None):
+        """ Register the handler of a command received on a topic filter
+
+        The handler is called with the header and body of the message, and the
+        paho message as the keyword argument msg if pass_message is set.
+        Messages registered with the same coalesce name and sent by the same
+        sender replace each other while waiting in the inbound stage. The sender
+        is given by sender(header, body), by default the header of the message.
+        """
+        commands = self._routes.get(topic_filter)
+
+        if commands is None:
+            commands = self._routes[topic_filter] = {}
+            self.mqtt_client.message_callback_add(
+                topic_filter, partial(self.dispatch, commands))
+
+        commands[command] = (handler, pass_message, coalesce, sender)
+
+    def enable_profiling(self):
+        """ Measure the time spent in the handler of every message, per command """
+        self.handler_times = defaultdict(list)
+
+    def topics(self):
+        """ Get the topic filters with registered handlers """
+        return list(self._routes)
+
+    def dispatch(self, commands, client, userdata, msg):
+        self._logger.debug(
+            f'MQTT received message on topic {msg.topic}, with payload {msg.payload}')
+
+        if self.recorder is not None:
+            self.recorder.record(INBOUND, msg.topic, msg.payload, msg.qos, msg.retain)
+
+        # An empty message clears the retained message of the topic, there is nothing to handle
+        if not msg.payload:
+            return
+
+        # Unwrap the message
+        try:
+            payload = self.codec.decode(msg.payload)
+        except CodecError as e:
+            self._logger.error(
+                f'Could not decode message {msg.payload}: {e}')
+            return
+
+        command = payload.get('command')
+        route = commands.get(command)
+
+        if route is None:
+            self.unknown_commands[command] += 1
+            self._logger.warning(
+                f'Unknown command {command} on topic {msg.topic}')
+            return
+
+        handler, pass_message, coalesce, sender = route
+        header = payload.get('header')
+        body = payload.get('body')
+        kwargs = {"msg": msg} if pass_message else {}
+
+        if self.handler_times is not None:
+            handler = partial(self._timed, command, handler)
+
+        if self.inbound is None:
+            handler(header, body, **kwargs)
+            return
+
+        # The latest message of the sender replaces the pending one
+        key = None
+        if coalesce is not None:
+            try:
+                key = (coalesce, header if sender is None else sender(header, body))
+            except (KeyError, TypeError):
+                # Without a known sender the message is never replaced
+                pass
+        self.inbound.submit(key, handler, header, body, **kwargs)
+
+    def _timed(self, command, handler, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            handler(*args, **kwargs)
+        finally:
+            self.handler_times[command].append(time.perf_counter() - start)
+
+    def on_unknown_topic(self, client, userdata, msg):
+        if self.recorder is not None:
+            self.recorder.record(INBOUND, msg.topic, msg.payload, msg.qos, msg.retain)
+
+        self.unknown_topics[msg.topic] += 1
+        self._logger.warning(f'No handlers for topic {msg.topic}')
@@ -0,0 +1,129 @@
+# Delivery policies of the MQTT messages, per command
+import json
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+# Names of the built-in profiles
+RELIABLE = 'reliable'
+LOW_LATENCY = 'low-latency'
+BANDWIDTH_SAVER = 'bandwidth-saver'
+
+# Commands superseded by the next message of the same kind, losing one costs nothing
+SUPERSEDING_COMMANDS = ('queue_snapshot', 'report_current_task', 'ta_heartbeat', 'sync_claim')
+
+
+class DeliveryPolicy:
+    """ How the messages of a command are delivered
+
+    qos: the MQTT quality of service
+    retain: whether the broker retains the message for clients subscribing later
+    expiry: seconds the broker keeps the message for offline clients, None for
+        no limit. Only sent with MQTT 5, MQTT 3.1.1 has no message expiry, so the
+        clients connect with MQTT 5 when any policy sets an expiry.
+    """
+
+    __slots__ = ('qos', 'retain', 'expiry')
+
+    def __init__(self, qos=2, retain=False, expiry=None):
+        if qos not in (0, 1, 2):
+            raise ValueError(f'Invalid QoS {qos}')
+
+        self.qos = qos
+        self.retain = retain
+        self.expiry = expiry
+
+    def __repr__(self):
+        return f'DeliveryPolicy(qos={self.qos}, retain={self.retain}, expiry={self.expiry})'
+
+
+# The built-in profiles, the policy of the "default" key is used for commands not listed
+PROFILES = {
+    # Every message delivered exactly once, as before the profiles were added
+    RELIABLE: {
+        "default": DeliveryPolicy(qos=2),
+        # Delivered as soon as it reaches the broker, also right before disconnecting
+        "ta_presence": DeliveryPolicy(qos=1),
+        # A lost heartbeat is made up for by the next one
+        "ta_heartbeat": DeliveryPolicy(qos=0),
+    },
+    # Fewest round trips, superseding messages are sent at most once
+    LOW_LATENCY: {
+        "default": DeliveryPolicy(qos=1),
+        **{command: DeliveryPolicy(qos=0) for command in SUPERSEDING_COMMANDS},
+    },
+    # Fewest packets, superseding messages are sent at most once and expire quickly
+    BANDWIDTH_SAVER: {
+        "default": DeliveryPolicy(qos=1),
+        **{command: DeliveryPolicy(qos=0, expiry=30) for command in SUPERSEDING_COMMANDS},
+        # The joining TA asks again if the answer is too late
+        "request_sync": DeliveryPolicy(qos=1, expiry=10),
+        "sync_state": DeliveryPolicy(qos=1, expiry=10),
+    },
+}
+
+
+class DeliveryPolicies:
+    """ Table of the delivery policy of every command, from a profile and overrides
+
+    Overrides map commands to dictionaries with any of qos, retain and expiry,
+    replacing those fields of the policy of the profile for that command. Commands
+    not in the profile take the other fields from the default, which can be
+    overridden itself.
+
+    The protocol is the MQTT version the clients connect with: MQTT 5 if any
+    policy sets an expiry, which MQTT 3.1.1 can not send, or else MQTT 3.1.1.
+    """
+
+    def __init__(self, profile=RELIABLE, overrides=None):
+        if profile not in PROFILES:
+            raise ValueError(f'Unknown delivery profile {profile}')
+
+        self.profile = profile
+
+        self._policies = dict(PROFILES[profile])
+        overrides = dict(overrides or {})
+
+        # The default first, the commands not in the profile are based on it
+        if "default" in overrides:
+            self._policies["default"] = self._merge(self._policies["default"], overrides.pop("default"))
+
+        for command, policy in overrides.items():
+            self._policies[command] = self._merge(
+                self._policies.get(command, self._policies["default"]), policy)
+
+        self._default = self._policies["default"]
+
+        # The message expiry is only sent with MQTT 5
+        expires = any(policy.expiry is not None for policy in self._policies.values())
+        self.protocol = mqtt.MQTTv5 if expires else mqtt.MQTTv311
+
+    @staticmethod
+    def _merge(policy, override):
+        fields = {"qos": policy.qos, "retain": policy.retain, "expiry": policy.expiry}
+        fields.update(override)
+        return DeliveryPolicy(**fields)
+
+    def policy(self, command):
+        return self._policies.get(command, self._default)
+
+    def publish_arguments(self, command, retain=False):
+        """ Get the keyword arguments of the paho publish call for a command
+
+        The message is retained if either the caller or the policy asks for it.
+        """
+        policy = self.policy(command)
+        arguments = {"qos": policy.qos, "retain": retain or policy.retain}
+
+        if policy.expiry is not None and self.protocol == mqtt.MQTTv5:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.MessageExpiryInterval = policy.expiry
+            arguments["properties"] = properties
+
+        return arguments
+
+
+def load_overrides(path):
+    """ Read the overrides of the delivery policies from a JSON file of {command: {qos, retain, expiry}} """
+    with open(path) as file:
+        return json.load(file)
@@ -1,6 +1,14 @@
 import paho.mqtt.client as mqtt
-import json
 import logging
+import uuid
+from mqtt_clients.codec import JSON, MessageCodec
+from mqtt_clients.command_dispatcher import CommandDispatcher
+from mqtt_clients.delivery_policy import DeliveryPolicies
+from mqtt_clients.outbound_publisher import ConflatingPublisher
+from mqtt_clients.outbound_spool import OutboundSpool
+from mqtt_clients.reconnect import ReconnectBackoff
+from mqtt_clients.traffic_log import OUTBOUND
+from mqtt_clients.transport import PahoTransport
 
 # MQTT broker address
 MQTT_BROKER = 'mqtt20.iik.ntnu.no'
@@ -14,19 +22,22 @@ MQTT_TOPIC_REQUEST_HELP = 'ttm4115/project/team10/api/v1/request'
 MQTT_TOPIC_GROUP_PRESENT = 'ttm4115/project/team10/api/v1/present'
 MQTT_TOPIC_GROUP_DONE = 'ttm4115/project/team10/api/v1/done'
 MQTT_TOPIC_PROGRESS = 'ttm4115/project/team10/api/v1/progress'
+# Retained state of every group with retained state, the client id of the group is appended to
+# the topic as it is set before connecting. Cleared when the group leaves or loses its connection
+MQTT_TOPIC_GROUP_STATE = 'ttm4115/project/team10/api/v1/state'
 
-MQTT_TOPIC_QUEUE_NUMBER = 'ttm4115/project/team10/api/v1/queue_number'
+MQTT_TOPIC_QUEUE_SNAPSHOT = 'ttm4115/project/team10/api/v1/queue'
 MQTT_TOPIC_GETTING_HELP = 'ttm4115/project/team10/api/v1/getting_help'
 MQTT_TOPIC_RECEIVED_HELP = 'ttm4115/project/team10/api/v1/received_help'
 
-MQTT_TOPIC_TA_READY = 'ttm4115/project/team10/api/v1/ta_ready/request'
-MQTT_TOPIC_TA_READY_RESPONSE = 'ttm4115/project/team10/api/v1/ta_ready/response'
-MQTT_TOPIC_TA_READY_RESPONSE_ALL = 'ttm4115/project/team10/api/v1/ta_ready/response/all'
+# Retained presence records of the TAs, one topic per TA
+MQTT_TOPIC_TA_PRESENCE = 'ttm4115/project/team10/api/v1/ta_ready/presence/+'
 
 
 class GroupMqttClient:
 
-    def __init__(self, component, logger):
+    def __init__(self, component, logger, codec=JSON, retained_state=False, delivery_policies=None,
+                 spool_path=None, transport=None, recorder=None):
         # Setting the reference to the component
         self.component = component
         # Setting the logger
@@ -34,26 +45,71 @@ class GroupMqttClient:
         # Create a new MQTT client
         self.logger.debug(
             f'Connecting to MQTT broker {MQTT_BROKER} at port {MQTT_PORT}')
-        self.mqtt_client = mqtt.Client()
+        # The broker given by the transport, by default the broker of the course over TCP
+        self.transport = transport or PahoTransport(MQTT_BROKER, MQTT_PORT)
+        # The client id identifies the retained state of the group
+        self.client_id = f"group_{uuid.uuid4().hex}"
+        self.MQTT_TOPIC_GROUP_STATE = MQTT_TOPIC_GROUP_STATE + "/" + self.client_id
+        # QoS, retain flag and expiry of every command, the expiry needs MQTT 5
+        self.delivery_policies = delivery_policies or DeliveryPolicies()
+        self.mqtt_client = self.transport.create_client(self.client_id, protocol=self.delivery_policies.protocol)
         # callback methods
         self.mqtt_client.on_connect = self.on_connect
-        self.mqtt_client.on_message = self.on_message
+        self.mqtt_client.on_disconnect = self.on_disconnect
+        self.mqtt_client.on_connect_fail = self.on_connect_fail
+
+        # Wire format of the messages, negotiated with the TAs
+        self.codec = MessageCodec(preferred=codec)
+
+        # Messages published while disconnected are kept on disk and replayed once connected
+        self.spool = OutboundSpool(spool_path, logger) if spool_path else None
+
+        # Published messages are batched, superseded messages not sent yet are dropped,
+        # and held back until connected
+        self.outbound = ConflatingPublisher(
+            self.mqtt_client, logger, spool=self.spool, online=False)
+
+        # Jittered delays between the attempts to reconnect after losing the connection
+        self.backoff = ReconnectBackoff(logger)
+
+        # Publish the presence and progress of the group as one retained state message,
+        # so TAs joining later learn them from the broker when subscribing
+        self.retained_state = retained_state
+        # The task the group works on (None before the first is done) and whether all are done
+        self.current_task = None
+        self.done = False
+
+        # Log of the received and published traffic, for replaying the session
+        self.recorder = recorder
+
+        # Received messages are dispatched per topic and command
+        self.dispatcher = CommandDispatcher(
+            self.mqtt_client, self.codec, logger, recorder=recorder)
 
         # Setting the name of the team to none (will be set when logging in)
         self.team_mqtt_endpoint = None
         self.team_text = None
 
-        # Connect to the broker (subscribe to topics when logged on)
-        self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT)
+        # Hash of the tasks received, so the TAs do not send them again when rejoining
+        self.tasks_hash = None
+
+        # Tracking the connection, the group joins when both connected and logged in
+        self.connected = False
+        self.joined = False
+
+        # The broker clears the retained state of the group if the connection is lost
+        if self.retained_state:
+            self.mqtt_client.will_set(self.MQTT_TOPIC_GROUP_STATE, b"", qos=1, retain=True)
+
+        # Connect to the broker without blocking, the connection is made by the network loop
+        self.transport.connect(self.mqtt_client)
 
     def set_topics(self):
         """ Set the topics for the group client component """
         self.logger.debug('Setting topics')
         self.MQTT_TOPIC_TASKS = MQTT_TOPIC_TASKS
-        self.MQTT_TOPIC_TA_READY = MQTT_TOPIC_TA_READY
-        self.MQTT_TOPIC_TA_READY_RESPONSE_ALL = MQTT_TOPIC_TA_READY_RESPONSE_ALL
-        self.MQTT_TOPIC_TA_READY_RESPONSE = MQTT_TOPIC_TA_READY_RESPONSE + \
-            "/" + self.team_mqtt_endpoint
+        self.MQTT_TOPIC_QUEUE_SNAPSHOT = MQTT_TOPIC_QUEUE_SNAPSHOT
+        self.MQTT_TOPIC_TA_PRESENCE = MQTT_TOPIC_TA_PRESENCE
 
         self.MQTT_TOPIC_TASKS_LATE = MQTT_TOPIC_TASKS_LATE + \
             "/" + self.team_mqtt_endpoint
@@ -64,84 +120,123 @@ class GroupMqttClient:
         self.MQTT_TOPIC_GROUP_DONE = MQTT_TOPIC_GROUP_DONE + "/" + self.team_mqtt_endpoint
         self.MQTT_TOPIC_PROGRESS = MQTT_TOPIC_PROGRESS + "/" + self.team_mqtt_endpoint
 
-        self.MQTT_TOPIC_QUEUE_NUMBER = MQTT_TOPIC_QUEUE_NUMBER + \
-            "/" + self.team_mqtt_endpoint
         self.MQTT_TOPIC_GETTING_HELP = MQTT_TOPIC_GETTING_HELP + \
             "/" + self.team_mqtt_endpoint
         self.MQTT_TOPIC_RECEIVED_HELP = MQTT_TOPIC_RECEIVED_HELP + \
             "/" + self.team_mqtt_endpoint
 
+        self.register_handlers()
+
+    def register_handlers(self):
+        """ Register the handlers of the commands received on each topic """
+        component = self.component
+        register = self.dispatcher.register
+
+        register(self.MQTT_TOPIC_TASKS, "submit_tasks",
+                 lambda header, body: component.handle_recieve_tasks(body))
+        register(self.MQTT_TOPIC_TASKS_LATE, "submit_tasks_late",
+                 lambda header, body: component.handle_recieve_tasks(body))
+        register(self.MQTT_TOPIC_QUEUE_SNAPSHOT, "queue_snapshot",
+                 lambda header, body: component.handle_queue_snapshot(body))
+        register(self.MQTT_TOPIC_GETTING_HELP, "getting_help",
+                 lambda header, body: component.handle_getting_help(body))
+        register(self.MQTT_TOPIC_RECEIVED_HELP, "received_help",
+                 lambda header, body: component.handle_received_help(body))
+        # Retained records were published before the group subscribed
+        register(self.MQTT_TOPIC_TA_PRESENCE, "ta_presence",
+                 self.handle_ta_presence, pass_message=True)
+
+    def handle_ta_presence(self, header, body, msg):
+        # Only send in the preferred wire format as long as all the TAs can decode it
+        if body['online']:
+            self.codec.peer_supports(body['id'], body.get('codecs'))
+        else:
+            self.codec.peer_left(body['id'])
+
+        self.component.handle_ta_presence(body, retained=msg.retain)
+
+    def join(self):
+        """ Join the lab session once logged in, deferred until the client is connected """
+        self.set_topics()
+        self.joined = True
+
+        if self.connected:
+            self.announce()
+
+    def leave(self):
+        """ Clear the retained state of the group and disconnect cleanly, publishing the pending messages first """
+        if self.joined and self.connected and self.retained_state:
+            self.publish_state(clear=True)
+
+        self.outbound.stop()
+        self.mqtt_client.disconnect()
+
+    def announce(self):
+        """ Subscribe to the topics of the group and notify the TAs that the group is present """
+        self.subscribe_topics()
+        self.handle_group_present()
+
     def subscribe_topics(self):
         """ Subscribe to the topics for the group client component """
         self.logger.debug('Subscribing to topics')
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_TASKS)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_TASKS_LATE)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_QUEUE_NUMBER)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_GETTING_HELP)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_RECEIVED_HELP)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_TA_READY_RESPONSE)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_TA_READY_RESPONSE_ALL)
+        # Every topic with registered handlers
+        for topic in self.dispatcher.topics():
+            self.mqtt_client.subscribe(topic)
 
     # MQTT connection logic
 
-    def on_connect(self, client, userdata, flags, rc):
-        # Only log that we are connected if the connection was successful
-        self.logger.debug(f'MQTT connected to {client}')
-
-    def on_message(self, client, userdata, msg):
-        # Retrieving the topic and payload
-        topic = msg.topic
-
-        self.logger.debug(
-            f'Received message on topic {topic}, with payload {msg.payload}')
-
-        # Unwrap JSON-encoded payload
-        try:
-            payload = json.loads(msg.payload.decode('utf-8'))
-        except json.JSONDecodeError:
-            self.logger.error(
-                f'Could not decode JSON from message {msg.payload}')
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            # A reason code object with MQTT 5
+            reason = mqtt.connack_string(rc) if isinstance(rc, int) else rc
+            self.logger.error(f'MQTT connection refused: {reason}')
             return
 
-        # Get the payload attributes
-        command = payload.get('command')
-        header = payload.get('header')
-        body = payload.get('body')
-
-        # Handle the different commands
-        if command == "submit_tasks":
-            # Update the listbox with the tasks
-            self.component.handle_recieve_tasks(body)
-
-        if command == "submit_tasks_late":
-            # Update the listbox with the late tasks
-            self.component.handle_recieve_tasks(body)
+        # Only log that we are connected if the connection was successful
+        self.logger.debug(f'MQTT connected to {client}')
+        self.connected = True
+        self.backoff.reset()
 
-        if command == "queue_number":
-            self.component.handle_update_queue_number(body)
+        # Subscriptions and presence are deferred until connected, and made again
+        # after reconnecting as the broker does not keep the session
+        if self.joined:
+            self.announce()
 
-        if command == "getting_help":
-            self.component.handle_getting_help(body)
+        # Publish the held back and spooled messages
+        self.outbound.set_online(True)
 
-        if command == "received_help":
-            self.component.handle_received_help(body)
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        self.logger.debug(f'MQTT disconnected from {client}')
+        self.connected = False
+        self.outbound.set_online(False)
 
-        if command == "ta_present":
-            self.component.handle_ta_present()
+        # The network loop reconnects after the delay, unless disconnected on purpose
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            reason = mqtt.error_string(rc) if isinstance(rc, int) else rc
+            self.logger.warning(f'MQTT connection lost: {reason}')
+            self.backoff.schedule(client)
 
-        if command == "ta_present_all":
-            self.component.handle_ta_present(all=True)
+    def on_connect_fail(self, client, userdata):
+        self.backoff.schedule(client)
 
-    def publish_message(self, topic, message):
+    def publish_message(self, topic, message, retain=False):
         """Publish a message to the MQTT broker.
 
+        The QoS, retain flag and expiry are taken from the delivery policy of the command.
+
         Args:
             topic (str): The topic to publish to.
             message (str): The message to publish.
+            retain (bool): Whether the broker should retain the message, regardless of the policy.
         """
-        payload = json.dumps(message)
-        self.logger.info(f'Publishing message: {payload}')
-        self.mqtt_client.publish(topic, payload=payload, qos=2)
+        self.logger.info(f'Publishing message: {message}')
+        arguments = self.delivery_policies.publish_arguments(message['command'], retain)
+        payload = self.codec.encode(message, retained=arguments["retain"])
+
+        if self.recorder is not None:
+            self.recorder.record(OUTBOUND, topic, payload, arguments["qos"], arguments["retain"])
+
+        self.outbound.publish(topic, message['command'], payload, **arguments)
 
     # MQTT message creation logic
     def create_payload(self, command, header, body):
@@ -151,14 +246,20 @@ class GroupMqttClient:
     # Handle the different commands
     def handle_group_present(self):
         body = {
-            "group": self.team_text
+            "group": self.team_text,
+            # The wire formats the group can decode
+            "codecs": self.codec.supported()
         }
 
+        if self.tasks_hash is not None:
+            body["tasks_hash"] = self.tasks_hash
+
         payload = self.create_payload(
             command="group_present", header=self.team_mqtt_endpoint, body=body)
 
         # Notify the TAs that the group is ready
         self.publish_message(self.MQTT_TOPIC_GROUP_PRESENT, payload)
+        self.publish_state()
 
     def handle_request_help(self, task_dict):
         payload = self.create_payload(
@@ -172,8 +273,48 @@ class GroupMqttClient:
 
         self.publish_message(self.MQTT_TOPIC_PROGRESS, payload)
 
+        self.current_task = body["current_task"]
+        self.publish_state()
+
     def handle_all_tasks_done(self, body):
         payload = self.create_payload(
             command="tasks_done", header=self.team_mqtt_endpoint, body=body)
 
         self.publish_message(self.MQTT_TOPIC_GROUP_DONE, payload)
+
+        self.done = True
+        self.publish_state()
+
+    def publish_state(self, clear=False):
+        """ Publish the presence and progress of the group as one retained message, or clear it
+
+        The presence, progress and done messages are sent on topics of their own, so
+        the broker would deliver them to a joining TA in any order. The retained
+        state holds all three, with the hash of the tasks of the group, so a joining
+        TA can tell the retained tasks of this lab session from those of an earlier one.
+        """
+        if not self.retained_state or not self.joined:
+            return
+
+        if clear:
+            arguments = self.delivery_policies.publish_arguments("group_state", retain=True)
+
+            if self.recorder is not None:
+                self.recorder.record(OUTBOUND, self.MQTT_TOPIC_GROUP_STATE, b"",
+                                     arguments["qos"], arguments["retain"])
+
+            self.outbound.publish(self.MQTT_TOPIC_GROUP_STATE, "group_state", b"", **arguments)
+            return
+
+        body = {
+            "group": self.team_text,
+            "current_task": self.current_task,
+            "done": self.done,
+            "tasks_hash": self.tasks_hash,
+            "codecs": self.codec.supported()
+        }
+
+        payload = self.create_payload(
+            command="group_state", header=self.team_mqtt_endpoint, body=body)
+
+        self.publish_message(self.MQTT_TOPIC_GROUP_STATE, payload, retain=True)
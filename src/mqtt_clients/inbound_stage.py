@@ -0,0 +1,138 @@
+# Inbound stage between the MQTT network loop and the handlers of the received messages
+from collections import OrderedDict
+import itertools
+import logging
+import threading
+
+# What to do with a message received while the stage is full
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DROP_NEWEST = 'drop-newest'
+OVERFLOW_GROW = 'grow'
+
+
+class InboundStage:
+    """ Bounded queue of received messages, handled by its own thread
+
+    The network loop only queues the messages, so it keeps reading from the
+    broker while the handlers run. A message queued with a key replaces the
+    pending message with the same key, in the place of the first one, so a storm
+    of progress reports from a group is handled as its latest state. Only such
+    replaced messages are lost without a dropping policy. When the queue is full
+    the overflow policy blocks the network loop until there is room, drops the
+    oldest pending message, drops the new message or grows past the bound.
+
+    Blocking is unsafe with the Tk network loop: the network loop then runs on
+    the main thread, which the handlers may wait on to update the GUI, so the
+    queue grows instead.
+    """
+
+    def __init__(self, logger, max_messages=10000, overflow=OVERFLOW_BLOCK):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_GROW):
+            raise ValueError(f'Unknown overflow policy {overflow}')
+
+        self._logger: logging.Logger = logger
+        self._max_messages = max_messages
+        self.overflow = overflow
+
+        # Pending messages as (handler, args, kwargs), keyed on the key of the message
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        # Unique keys for messages that must never be replaced
+        self._counter = itertools.count()
+
+        # Counters of the messages
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.handled = 0
+        self.max_depth = 0
+
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, handler, *args, **kwargs):
+        """ Queue a message for its handler, replacing the pending message with the same key
+
+        Args:
+            key: The key of the latest state carried by the message, or None if the
+                message must not be replaced.
+            handler: The function handling the message.
+            args: The arguments of the handler.
+        """
+        with self._condition:
+            self.received += 1
+
+            if key is not None and key in self._pending:
+                self._pending[key] = (handler, args, kwargs)
+                self.coalesced += 1
+                return
+
+            if key is None:
+                key = next(self._counter)
+
+            if len(self._pending) >= self._max_messages:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self._drop()
+                    return
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._pending.popitem(last=False)
+                    self._drop()
+                elif self.overflow == OVERFLOW_GROW:
+                    self.overflowed += 1
+                    if self.overflowed == 1 or self.overflowed % self._max_messages == 0:
+                        self._logger.warning(
+                            f'Inbound queue full, queued {self.overflowed} messages past the bound')
+                else:
+                    while len(self._pending) >= self._max_messages and not self._stopped:
+                        self._condition.wait()
+
+            self._pending[key] = (handler, args, kwargs)
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._condition.notify_all()
+
+    def depth(self):
+        """ Number of messages waiting to be handled """
+        return len(self._pending)
+
+    def stats(self):
+        return {"depth": self.depth(), "max_depth": self.max_depth, "received": self.received,
+                "coalesced": self.coalesced, "dropped": self.dropped, "overflowed": self.overflowed,
+                "handled": self.handled}
+
+    def stop(self):
+        """ Stop handling messages, the pending messages are discarded """
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _drop(self):
+        self.dropped += 1
+        self._logger.warning(
+            f'Inbound queue full, dropped {self.dropped} messages')
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                handler, args, kwargs = self._pending.popitem(last=False)[1]
+                # Wake up the network loop blocked on a full queue
+                self._condition.notify_all()
+
+            try:
+                handler(*args, **kwargs)
+            except Exception:
+                self._logger.exception('Handling of received message failed')
+
+            self.handled += 1
@@ -0,0 +1,148 @@
+# Election of the TA publishing on behalf of all the TAs
+import logging
+import threading
+import time
+
+# Seconds between the heartbeats of a TA
+HEARTBEAT_INTERVAL = 1.0
+# Seconds without a heartbeat before a TA is considered gone
+HEARTBEAT_TIMEOUT = 3.0
+
+
+class LeaderElection:
+    """ Elects the leader among the TAs from their heartbeats
+
+    Every TA sends a heartbeat each interval, telling whether it leads, and tracks
+    the heartbeats of the other TAs. A leader keeps leading as long as its
+    heartbeats arrive, so a TA joining later never takes over from it. Without a
+    live leader the live TA with the lowest client id takes over, so all the TAs
+    agree without voting as soon as they have heard from each other. Should two
+    TAs lead at once, e.g. after a split of the network, the lowest id keeps leading.
+
+    A TA missing its heartbeats for the timeout, or going offline, is dropped. A TA
+    steps down while disconnected, and only leads once it has listened for a whole
+    timeout since connecting, so it does not take over from a leader it has not heard yet.
+    """
+
+    def __init__(self, client_id, send_heartbeat, logger, on_change=None,
+                 interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT, clock=time.monotonic):
+        self._logger: logging.Logger = logger
+        self.client_id = client_id
+        # Called with whether this TA leads to publish a heartbeat
+        self._send_heartbeat = send_heartbeat
+        # Called with the id of the new leader whenever the leader changes, None for no leader
+        self._on_change = on_change
+
+        self.interval = interval
+        self.timeout = timeout
+        self._clock = clock
+
+        # Time the heartbeat of every other TA was last seen, and whether it leads
+        self._peers: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+        self._connected = True
+        self._started = None
+        self._leader = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Start sending heartbeats, does nothing if already started """
+        if self._thread is not None:
+            return
+
+        self._started = self._clock()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_connected(self, connected):
+        """ Track the connection to the broker, the TA has no leader while disconnected """
+        with self._lock:
+            if connected == self._connected:
+                return
+
+            self._connected = connected
+
+            # The other TAs may have elected a leader meanwhile, listen again before leading
+            if connected and self._started is not None:
+                self._started = self._clock()
+
+        self._elect()
+
+    def peer_seen(self, peer, leading=None):
+        """ Register a heartbeat or online presence of another TA, None keeps whether it leads """
+        if peer == self.client_id:
+            return
+
+        with self._lock:
+            previous = self._peers.get(peer)
+            if leading is None:
+                leading = previous is not None and previous[1]
+            self._peers[peer] = [self._clock(), leading]
+
+        self._elect()
+
+    def peer_left(self, peer):
+        with self._lock:
+            self._peers.pop(peer, None)
+
+        self._elect()
+
+    def leader(self):
+        """ Get the client id of the leader, None while disconnected or listening """
+        return self._leader
+
+    def is_leader(self):
+        return self._leader == self.client_id
+
+    def beat(self):
+        """ Send a heartbeat, drop the TAs not heard of for the timeout and elect the leader """
+        if self._connected:
+            self._send_heartbeat(self.is_leader())
+
+        now = self._clock()
+        with self._lock:
+            for peer, (seen, _) in list(self._peers.items()):
+                if now - seen > self.timeout:
+                    del self._peers[peer]
+
+        self._elect()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.beat()
+            self._stopped.wait(self.interval)
+
+    def _elect(self):
+        with self._lock:
+            if not self._connected or self._started is None or self._clock() - self._started < self.timeout:
+                leader = None
+            else:
+                # The TAs leading, the lowest one wins if several do
+                claimers = [peer for peer, (_, leading) in self._peers.items() if leading]
+                if self._leader == self.client_id:
+                    claimers.append(self.client_id)
+
+                leader = min(claimers) if claimers else min([self.client_id, *self._peers])
+
+            if leader == self._leader:
+                return
+
+            self._leader = leader
+
+        if leader is None:
+            self._logger.info('No TA is the leader')
+        else:
+            self._logger.info(f'TA {leader} is the leader')
+
+        if self._on_change is not None:
+            self._on_change(leader)
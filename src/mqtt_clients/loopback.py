@@ -0,0 +1,435 @@
+# In-process stand-in for the MQTT broker, for running the clients without a network
+import itertools
+import logging
+import queue
+import threading
+import uuid
+import paho.mqtt.client as mqtt
+
+
+class LoopbackBroker:
+    """ Publish/subscribe hub delivering messages between clients in the same process
+
+    Topic filters match with the MQTT wildcards + and #. A message is delivered
+    once to every client with a matching subscription, with the lower of the
+    published and the granted QoS. Retained messages are kept per topic, an empty
+    retained message clears the topic, and are delivered with the retain flag to
+    clients subscribing later. The Last Will of a client is published when its
+    connection is dropped, but not when it disconnects.
+
+    Nothing is lost in the process, so the QoS only decides what happens to the
+    messages of a client that is not connected: QoS 0 messages are dropped and
+    QoS 1 and 2 messages are held by the client until it is connected again.
+    """
+
+    def __init__(self, logger=None):
+        self._logger: logging.Logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        # Subscriptions of every connected client, as {topic filter: granted QoS}
+        self._clients = {}
+        # Retained messages as {topic: (payload, qos)}
+        self._retained = {}
+        # Brokers can be taken down to test reconnecting
+        self.online = True
+
+        # Counters of the messages
+        self.published = 0
+        self.delivered = 0
+
+    def connect(self, client):
+        with self._lock:
+            if not self.online:
+                raise ConnectionRefusedError('Loopback broker is offline')
+
+            # Clean session, the subscriptions of an earlier connection are gone
+            self._clients[client] = {}
+
+    def disconnect(self, client):
+        with self._lock:
+            self._clients.pop(client, None)
+
+    def drop(self, client=None):
+        """ Drop the connection of a client, or of every client, as if the network was lost """
+        with self._lock:
+            clients = [client] if client is not None else list(self._clients)
+            for dropped in clients:
+                self._clients.pop(dropped, None)
+
+        for dropped in clients:
+            if dropped.will is not None:
+                self.publish(*dropped.will)
+            dropped.connection_lost()
+
+    def set_online(self, online):
+        """ Take the broker down, dropping every client, or bring it up again """
+        self.online = online
+
+        if not online:
+            self.drop()
+
+    def subscribe(self, client, topic_filter, qos):
+        """ Subscribe a client, the retained messages of the matching topics are delivered right away """
+        with self._lock:
+            if client not in self._clients:
+                return None
+
+            self._clients[client][topic_filter] = qos
+
+            for topic, (payload, retained_qos) in self._retained.items():
+                if mqtt.topic_matches_sub(topic_filter, topic):
+                    self._deliver(client, topic, payload,
+                                  min(qos, retained_qos), True)
+
+        return qos
+
+    def unsubscribe(self, client, topic_filter):
+        with self._lock:
+            self._clients.get(client, {}).pop(topic_filter, None)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            self.published += 1
+
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, qos)
+                else:
+                    self._retained.pop(topic, None)
+
+            for client, subscriptions in self._clients.items():
+                # Overlapping subscriptions get the message once, with the highest granted QoS
+                granted = [granted_qos for topic_filter, granted_qos in subscriptions.items()
+                           if mqtt.topic_matches_sub(topic_filter, topic)]
+
+                if granted:
+                    self._deliver(client, topic, payload,
+                                  min(qos, max(granted)), False)
+
+    def retained(self, topic):
+        """ Get the payload retained for a topic, or None """
+        with self._lock:
+            message = self._retained.get(topic)
+            return None if message is None else message[0]
+
+    def _deliver(self, client, topic, payload, qos, retain):
+        message = mqtt.MQTTMessage(topic=topic.encode('utf-8'))
+        message.payload = payload
+        message.qos = qos
+        message.retain = retain
+
+        self.delivered += 1
+        client.deliver(message)
+
+
+class LoopbackMessageInfo:
+    """ Result of a publish, as the message info returned by paho """
+
+    def __init__(self, mid, rc=mqtt.MQTT_ERR_SUCCESS, published=True):
+        self.mid = mid
+        self.rc = rc
+        self._published = published
+
+    def is_published(self):
+        return self._published
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+class LoopbackClient:
+    """ Client of the loopback broker, with the part of the paho client API used by the clients
+
+    The callbacks are run by the network loop of the client, in its own thread
+    after loop_start, or by loop_misc when driven by the Tk network loop. After
+    losing the connection it reconnects by itself after the reconnect delay,
+    doubling between the minimum and maximum delay as paho does.
+    """
+
+    def __init__(self, broker: LoopbackBroker, client_id="", logger=None):
+        self._logger: logging.Logger = logger or logging.getLogger(__name__)
+        self._broker = broker
+        self.client_id = client_id or f"loopback_{uuid.uuid4().hex}"
+        self._userdata = None
+
+        # Callbacks as set on a paho client
+        self.on_connect = None
+        self.on_connect_fail = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        # Set by the Tk network loop, there is no socket to watch
+        self.on_socket_open = None
+        self.on_socket_close = None
+        self.on_socket_register_write = None
+        self.on_socket_unregister_write = None
+
+        # Message callbacks per topic filter
+        self._message_callbacks = {}
+        # Topic, payload, QoS and retain flag published when the connection is lost
+        self.will = None
+
+        # Callbacks and received messages, run in order by the network loop
+        self._events = queue.Queue()
+        self._mids = itertools.count(1)
+
+        self._connect_requested = False
+        self._connected = False
+        # The network loop waits the reconnect delay after losing the connection
+        self._lost = False
+        # QoS 1 and 2 messages published while disconnected, sent once connected
+        self._held = []
+
+        self._reconnect_min_delay = 1
+        self._reconnect_max_delay = 120
+        self._reconnect_delay = None
+
+        self._thread = None
+        self._stopped = threading.Event()
+
+    # Connection
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        self._connect_requested = True
+        self._connect()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def connect_async(self, host=None, port=1883, keepalive=60):
+        self._connect_requested = True
+
+    def reconnect(self):
+        self._connect()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        self._connect_requested = False
+
+        if not self._connected:
+            return mqtt.MQTT_ERR_NO_CONN
+
+        self._connected = False
+        self._broker.disconnect(self)
+        self._event(self.on_disconnect, self, self._userdata, mqtt.MQTT_ERR_SUCCESS)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self):
+        return self._connected
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        self._reconnect_min_delay = min_delay
+        self._reconnect_max_delay = max_delay
+        self._reconnect_delay = None
+
+    def will_set(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.will = (topic, self._encode(payload), qos, retain)
+
+    def user_data_set(self, userdata):
+        self._userdata = userdata
+
+    def connection_lost(self):
+        """ Called by the broker when the connection is dropped """
+        self._connected = False
+        self._lost = True
+        self._event(self.on_disconnect, self, self._userdata, mqtt.MQTT_ERR_CONN_LOST)
+
+    def _connect(self):
+        self._broker.connect(self)
+        self._connected = True
+        self._reconnect_delay = None
+
+        self._event(self.on_connect, self, self._userdata,
+                    {"session present": 0}, mqtt.CONNACK_ACCEPTED)
+        # As paho, held messages are sent after the connect callback
+        self._events.put((self._send_held, ()))
+
+    def _send_held(self):
+        held, self._held = self._held, []
+        for topic, payload, qos, retain, info in held:
+            self._broker.publish(topic, payload, qos, retain)
+            info._published = True
+            self._call(self.on_publish, self, self._userdata, info.mid)
+
+    def _next_reconnect_delay(self):
+        if self._reconnect_delay is None:
+            self._reconnect_delay = self._reconnect_min_delay
+        else:
+            self._reconnect_delay = min(
+                self._reconnect_delay * 2, self._reconnect_max_delay)
+        return self._reconnect_delay
+
+    # Publishing and subscribing
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        payload = self._encode(payload)
+        mid = next(self._mids)
+
+        if not self._connected:
+            if qos == 0:
+                return LoopbackMessageInfo(mid, mqtt.MQTT_ERR_NO_CONN, published=False)
+
+            info = LoopbackMessageInfo(mid, mqtt.MQTT_ERR_NO_CONN, published=False)
+            self._held.append((topic, payload, qos, retain, info))
+            return info
+
+        self._broker.publish(topic, payload, qos, retain)
+        self._event(self.on_publish, self, self._userdata, mid)
+        return LoopbackMessageInfo(mid)
+
+    def subscribe(self, topic, qos=0):
+        # A list of (topic filter, qos) subscribes to all of them at once
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        mid = next(self._mids)
+
+        if not self._connected:
+            return mqtt.MQTT_ERR_NO_CONN, None
+
+        granted = [self._broker.subscribe(self, topic_filter, topic_qos)
+                   for topic_filter, topic_qos in topics]
+        self._event(self.on_subscribe, self, self._userdata, mid, tuple(granted))
+        return mqtt.MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic):
+        topics = topic if isinstance(topic, list) else [topic]
+        for topic_filter in topics:
+            self._broker.unsubscribe(self, topic_filter)
+        return mqtt.MQTT_ERR_SUCCESS, next(self._mids)
+
+    def message_callback_add(self, sub, callback):
+        self._message_callbacks[sub] = callback
+
+    def message_callback_remove(self, sub):
+        self._message_callbacks.pop(sub, None)
+
+    def deliver(self, message):
+        """ Called by the broker with a message for one of the subscriptions """
+        self._events.put((self._dispatch, (message,)))
+
+    def _dispatch(self, message):
+        # As paho, every matching message callback is called, or else on_message
+        matched = False
+        for sub, callback in list(self._message_callbacks.items()):
+            if mqtt.topic_matches_sub(sub, message.topic):
+                matched = True
+                callback(self, self._userdata, message)
+
+        if not matched:
+            self._call(self.on_message, self, self._userdata, message)
+
+    # Network loop
+
+    def loop_start(self):
+        if self._thread is not None:
+            return mqtt.MQTT_ERR_INVAL
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force=False):
+        if self._thread is None:
+            return mqtt.MQTT_ERR_INVAL
+
+        self._stopped.set()
+        self._events.put(None)
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._thread = None
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_misc(self):
+        """ Run the pending callbacks, for network loops driven from outside """
+        self._run_events()
+
+        if self._connect_requested and not self._connected:
+            return mqtt.MQTT_ERR_NO_CONN
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_read(self, max_packets=1):
+        self._run_events()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_write(self, max_packets=1):
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def want_write(self):
+        return False
+
+    def socket(self):
+        return None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self._connect_requested and not self._connected:
+                # Callbacks of the lost connection first, they may set the reconnect delay
+                self._run_events()
+
+                if self._lost:
+                    self._lost = False
+                    self._stopped.wait(self._next_reconnect_delay())
+                    continue
+
+                try:
+                    self._connect()
+                except OSError:
+                    self._call(self.on_connect_fail, self, self._userdata)
+                    self._stopped.wait(self._next_reconnect_delay())
+                    continue
+
+            event = self._events.get()
+            if event is not None:
+                self._run_event(event)
+
+        # Callbacks queued before stopping, such as the one of a clean disconnect
+        self._run_events()
+
+    def _run_events(self):
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return
+
+            if event is not None:
+                self._run_event(event)
+
+    def _run_event(self, event):
+        function, args = event
+        try:
+            function(*args)
+        except Exception:
+            self._logger.exception('Loopback client callback failed')
+
+    def _event(self, callback, *args):
+        self._events.put((self._call, (callback, *args)))
+
+    @staticmethod
+    def _call(callback, *args):
+        if callback is not None:
+            callback(*args)
+
+    @staticmethod
+    def _encode(payload):
+        if payload is None:
+            return b''
+        if isinstance(payload, str):
+            return payload.encode('utf-8')
+        if isinstance(payload, (int, float)):
+            return str(payload).encode('ascii')
+        return bytes(payload)
+
+
+class LoopbackTransport:
+    """ Connects the clients to a loopback broker in the same process """
+
+    def __init__(self, broker=None, logger=None):
+        self._logger: logging.Logger = logger or logging.getLogger(__name__)
+        self.broker = broker or LoopbackBroker(self._logger)
+
+    def create_client(self, client_id="", protocol=mqtt.MQTTv311):
+        # The in-process broker has no message expiry, the protocol makes no difference
+        return LoopbackClient(self.broker, client_id, self._logger)
+
+    def connect(self, client):
+        client.connect_async()
@@ -0,0 +1,229 @@
+# Outbound stage of the published MQTT messages
+from collections import OrderedDict
+import itertools
+import logging
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+# Commands where only the latest message to a topic matters
+CONFLATED_COMMANDS = ('queue_snapshot', 'report_current_task', 'ta_heartbeat', 'group_state')
+
+
+class ConflatingPublisher:
+    """ Queue of outbound messages, published in small batches by its own thread
+
+    A message of a conflated command replaces the message of the same command to
+    the same topic that has not been published yet, in the place of the first one,
+    so a burst of queue snapshots or progress reports reaches the broker as one
+    message. Messages of other commands are never replaced.
+
+    While disconnected from the broker the messages are held back, or written to
+    the spool if there is one. Once connected again the spool is replayed in
+    order before any newer message, and the replayed messages are discarded from
+    the spool when the broker has acknowledged them. A message may be delivered
+    twice if the connection drops again during a replay.
+    """
+
+    def __init__(self, mqtt_client, logger, conflated=CONFLATED_COMMANDS, batch_size=32, linger=0.005,
+                 spool=None, online=True):
+        self._logger: logging.Logger = logger
+        self.mqtt_client = mqtt_client
+        self._conflated = frozenset(conflated)
+        self._batch_size = batch_size
+        # Seconds to wait for newer messages before publishing
+        self._linger = linger
+
+        # Pending messages as (topic, command, payload, publish arguments), keyed on (command, topic)
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        # Unique keys for messages that must never be replaced
+        self._counter = itertools.count()
+
+        # Messages published while disconnected, kept on disk until acknowledged
+        self._spool = spool
+        self._online = online
+        # The spool is replayed before publishing anything else once connected
+        self._replay_pending = spool is not None and len(spool) > 0
+        # Number of spooled messages replayed and the message infos of the replay
+        self._replayed = None
+        if spool is not None:
+            self.mqtt_client.on_publish = self._on_publish
+
+        self.published = 0
+        self.conflated = 0
+        self.replayed = 0
+
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, topic, command, payload, **arguments):
+        """ Queue a message, replacing the pending message of a conflated command to the same topic """
+        with self._condition:
+            if command in self._conflated:
+                key = (command, topic)
+
+                if key in self._pending:
+                    self._pending[key] = (topic, command, payload, arguments)
+                    self.conflated += 1
+                    return
+            else:
+                key = next(self._counter)
+
+            self._pending[key] = (topic, command, payload, arguments)
+            self._condition.notify()
+
+    def set_online(self, online):
+        """ Track the connection to the broker, replaying the spool when connected again """
+        with self._condition:
+            self._online = online
+
+            if online and self._spool is not None and len(self._spool) > 0:
+                self._replay_pending = True
+
+            self._condition.notify()
+
+    def flush(self):
+        """ Publish all the pending messages from the calling thread """
+        self._replay()
+
+        while self._publish_batch():
+            pass
+
+    def stop(self):
+        """ Publish the pending messages and stop the thread """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        self._thread.join()
+        self.flush()
+
+        if self._spool is not None:
+            self._spool.close()
+
+    def _ready(self):
+        # Held back messages wait for the connection, unless they can be spooled
+        if self._online and self._replay_pending:
+            return True
+        return bool(self._pending) and (self._online or self._spool is not None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._ready() and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+            # Give newer messages the chance to replace the pending ones
+            time.sleep(self._linger)
+
+            self._replay()
+
+            while self._publish_batch():
+                pass
+
+    def _replay(self):
+        with self._condition:
+            if not (self._online and self._replay_pending):
+                return
+            self._replay_pending = False
+
+        messages = self._spool.messages()
+
+        # Only the latest message of a conflated command to a topic is replayed
+        latest = OrderedDict()
+        for index, (topic, command, payload, qos, retain) in enumerate(messages):
+            key = (command, topic) if command in self._conflated else index
+            latest[key] = (topic, payload, qos, retain)
+
+        self._logger.info(
+            f'Replaying {len(latest)} of {len(messages)} spooled messages')
+
+        infos = []
+        for topic, payload, qos, retain in latest.values():
+            info = self.mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+
+            if info.rc == mqtt.MQTT_ERR_NO_CONN:
+                # Disconnected again, the whole spool is replayed on the next connection
+                self._logger.warning('Connection lost while replaying the spool')
+                with self._condition:
+                    self._replay_pending = True
+                    # The client may have reconnected before the failure, then the spool is replayed again now
+                    if not self.mqtt_client.is_connected():
+                        self._online = False
+                return
+
+            infos.append(info)
+
+        self.replayed += len(infos)
+
+        with self._condition:
+            self._replayed = (len(messages), infos)
+
+        self._discard_replayed()
+
+    def _on_publish(self, client, userdata, mid):
+        self._discard_replayed()
+
+    def _discard_replayed(self):
+        # The replayed messages are discarded from the spool once all are acknowledged
+        with self._condition:
+            if self._replayed is None:
+                return
+
+            count, infos = self._replayed
+            if not all(info.is_published() for info in infos):
+                return
+
+            self._replayed = None
+
+        self._spool.discard(count)
+
+    def _publish_batch(self):
+        # Take a batch of messages, newer messages are queued for the next batch
+        with self._condition:
+            if not self._online and self._spool is None:
+                return False
+
+            online = self._online
+            batch = [self._pending.popitem(last=False)[1]
+                     for _ in range(min(self._batch_size, len(self._pending)))]
+
+        if not online:
+            # Connection specific messages are sent again when announcing after reconnecting
+            self._spool.append([(topic, command, payload, arguments.get("qos", 0), arguments.get("retain", False))
+                                for topic, command, payload, arguments in batch
+                                if self._spool.accepts(command)])
+            return len(batch) > 0
+
+        unsent = []
+        for topic, command, payload, arguments in batch:
+            try:
+                info = self.mqtt_client.publish(topic, payload, **arguments)
+            except Exception:
+                self._logger.exception(f'Publishing to topic {topic} failed')
+                continue
+
+            # paho keeps messages with QoS 1 and 2 for the next connection, but drops QoS 0
+            if info.rc == mqtt.MQTT_ERR_NO_CONN and arguments.get("qos", 0) == 0:
+                unsent.append((topic, command, payload, arguments))
+
+        self.published += len(batch) - len(unsent)
+
+        if unsent:
+            # Lost the connection before the disconnect was noticed, the messages are held back
+            with self._condition:
+                # Unless the client already reconnected, then the messages are sent again now
+                if not self.mqtt_client.is_connected():
+                    self._online = False
+                for message in reversed(unsent):
+                    key = next(self._counter)
+                    self._pending[key] = message
+                    self._pending.move_to_end(key, last=False)
+            return False
+
+        return len(batch) > 0
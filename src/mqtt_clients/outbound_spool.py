@@ -0,0 +1,123 @@
+# Disk-backed spool of the messages published while disconnected from the broker
+import base64
+import json
+import logging
+import os
+import threading
+
+# Commands tied to the connection, sent again when announcing after reconnecting or by the leader,
+# so a spooled copy from an earlier connection or run would only be stale
+VOLATILE_COMMANDS = ('ta_heartbeat', 'ta_presence', 'queue_snapshot',
+                     'request_sync', 'sync_claim', 'sync_state')
+
+
+class OutboundSpool:
+    """ Append-only file of the messages waiting for the connection to the broker
+
+    Every message is a line of JSON appended to the file, and every batch of
+    messages is synced to disk once, so the messages survive a crash or restart
+    of the client. The messages are replayed in order once connected, and
+    discarded from the front of the spool when the broker has acknowledged them.
+    A line cut short by a crash is skipped when loading.
+    """
+
+    def __init__(self, path, logger, volatile=VOLATILE_COMMANDS):
+        self._logger: logging.Logger = logger
+        self.path = path
+        self._volatile = frozenset(volatile)
+        self._lock = threading.Lock()
+
+        # Spooled messages as (topic, command, payload, qos, retain)
+        self._messages, damaged = self._load()
+        if damaged:
+            # Later lines must not be appended to a line cut short
+            self._rewrite()
+        self._file = open(self.path, 'ab')
+
+        # Counters of the messages
+        self.spooled = 0
+        self.syncs = 0
+
+        if self._messages:
+            self._logger.info(
+                f'Loaded {len(self._messages)} spooled messages from {self.path}')
+
+    def __len__(self):
+        return len(self._messages)
+
+    def accepts(self, command):
+        """ Test if the messages of a command are spooled, volatile ones are dropped """
+        return command not in self._volatile
+
+    def append(self, batch):
+        """ Append a batch of (topic, command, payload, qos, retain) and sync it to disk """
+        if not batch:
+            return
+
+        lines = b''.join(self._encode(message) for message in batch)
+
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._messages.extend(batch)
+
+        self.spooled += len(batch)
+        self.syncs += 1
+
+    def messages(self):
+        """ Get the spooled messages, oldest first """
+        with self._lock:
+            return list(self._messages)
+
+    def discard(self, count):
+        """ Discard the oldest messages, once acknowledged by the broker """
+        with self._lock:
+            del self._messages[:count]
+
+            self._file.close()
+            self._rewrite()
+            self._file = open(self.path, 'ab')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _rewrite(self):
+        # The remaining messages are written to a new file, which replaces the spool at once
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(b''.join(self._encode(message)
+                                for message in self._messages))
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary, self.path)
+
+    def _encode(self, message):
+        topic, command, payload, qos, retain = message
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        return json.dumps({"topic": topic, "command": command, "qos": qos, "retain": retain,
+                           "payload": base64.b64encode(payload).decode('ascii')}).encode('utf-8') + b'\n'
+
+    def _load(self):
+        messages = []
+        damaged = False
+
+        if not os.path.exists(self.path):
+            return messages, damaged
+
+        with open(self.path, 'rb') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    messages.append((record["topic"], record["command"], base64.b64decode(record["payload"]),
+                                     record["qos"], record["retain"]))
+                except (ValueError, KeyError):
+                    damaged = True
+                    self._logger.warning(
+                        f'Skipping a damaged message in the spool {self.path}')
+
+        return messages, damaged
@@ -0,0 +1,46 @@
+# Delays between the attempts to reconnect to the MQTT broker
+import logging
+import random
+import time
+import paho.mqtt.client as mqtt
+
+
+class ReconnectBackoff:
+    """ Exponential backoff with full jitter between reconnect attempts
+
+    The cap of the delay doubles with every failed attempt, from min_delay up
+    to max_delay, and the delay is drawn at random below the cap. A lab full
+    of clients dropped by the same Wi-Fi glitch then spreads its reconnects
+    instead of hitting the broker at the same moments.
+    """
+
+    def __init__(self, logger, min_delay=1.0, max_delay=30.0):
+        self._logger: logging.Logger = logger
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.attempts = 0
+        # Monotonic time of the next attempt, for network loops reconnecting by themselves
+        self.next_attempt = 0.0
+
+    def next_delay(self):
+        """ Get the delay before the next attempt, counting the attempt """
+        cap = min(self.max_delay, self.min_delay * 2 ** self.attempts)
+        self.attempts += 1
+        return random.uniform(self.min_delay, max(self.min_delay, cap))
+
+    def reset(self):
+        """ Start over from the shortest delay once connected """
+        self.attempts = 0
+        self.next_attempt = 0.0
+
+    def schedule(self, mqtt_client: mqtt.Client):
+        """ Set the delay the network loop of the paho client waits before reconnecting
+
+        paho doubles its delay between a minimum and a maximum without jitter,
+        so both are set to the next jittered delay before every wait.
+        """
+        delay = self.next_delay()
+        self._logger.info(f'Reconnecting to the MQTT broker in {delay:.1f} s')
+        mqtt_client.reconnect_delay_set(delay, delay)
+        self.next_attempt = time.monotonic() + delay
+        return delay
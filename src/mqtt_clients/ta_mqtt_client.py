@@ -1,6 +1,16 @@
-import json
 import logging
+import uuid
 import paho.mqtt.client as mqtt
+from mqtt_clients.codec import JSON, MessageCodec, encode
+from mqtt_clients.command_dispatcher import CommandDispatcher
+from mqtt_clients.delivery_policy import DeliveryPolicies
+from mqtt_clients.leader_election import LeaderElection
+from mqtt_clients.outbound_publisher import ConflatingPublisher
+from mqtt_clients.outbound_spool import OutboundSpool
+from mqtt_clients.reconnect import ReconnectBackoff
+from mqtt_clients.traffic_log import OUTBOUND
+from mqtt_clients.transport import PahoTransport
+from mqtt_clients.inbound_stage import OVERFLOW_BLOCK, InboundStage
 
 # MQTT broker address
 MQTT_BROKER = 'mqtt20.iik.ntnu.no'
@@ -13,108 +23,224 @@ MQTT_TOPIC_TASKS_LATE = 'ttm4115/project/team10/api/v1/tasks/late'
 MQTT_TOPIC_REQUEST_HELP = 'ttm4115/project/team10/api/v1/request/#'
 MQTT_TOPIC_GROUP_PRESENT = 'ttm4115/project/team10/api/v1/present/#'
 MQTT_TOPIC_GROUP_DONE = 'ttm4115/project/team10/api/v1/done/#'
+# Retained state of the groups, with retained state only
+MQTT_TOPIC_GROUP_STATE = 'ttm4115/project/team10/api/v1/state/#'
 MQTT_TOPIC_PROGRESS = 'ttm4115/project/team10/api/v1/progress/#'
 
-MQTT_TOPIC_QUEUE_NUMBER = 'ttm4115/project/team10/api/v1/queue_number'
+MQTT_TOPIC_QUEUE_SNAPSHOT = 'ttm4115/project/team10/api/v1/queue'
 MQTT_TOPIC_GETTING_HELP = 'ttm4115/project/team10/api/v1/getting_help'
 MQTT_TOPIC_RECEIVED_HELP = 'ttm4115/project/team10/api/v1/received_help'
 
 MQTT_TOPIC_TA_UPDATE = 'ttm4115/project/team10/api/v1/ta_update'
 MQTT_TOPIC_TA = 'ttm4115/project/team10/api/v1/ta'
 
-MQTT_TOPIC_TA_READY_REQUEST = 'ttm4115/project/team10/api/v1/ta_ready/request'
-MQTT_TOPIC_TA_READY_RESPONSE = 'ttm4115/project/team10/api/v1/ta_ready/response'
-MQTT_TOPIC_TA_READY_RESPONSE_ALL = 'ttm4115/project/team10/api/v1/ta_ready/response/all'
+# Retained presence record of every TA, the client id of the TA is appended to the topic.
+# Cleared by the TA when leaving, and by the other TAs when only its Last Will is left
+MQTT_TOPIC_TA_PRESENCE = 'ttm4115/project/team10/api/v1/ta_ready/presence'
+MQTT_TOPIC_TA_PRESENCE_ALL = MQTT_TOPIC_TA_PRESENCE + '/+'
 
 
 class TaMqttClient:
     def set_topics(self):
-        # Set the topics for the specific TA
-        self.MQTT_TOPIC_TA = MQTT_TOPIC_TA + "/" + self.ta_mqtt_endpoint
+        # Set the topics for the specific TA, told apart by its client id as TAs may share a name
+        self.MQTT_TOPIC_TA = MQTT_TOPIC_TA + "/" + self.client_id
+
+        self.register_handlers()
+
+    def register_handlers(self):
+        """ Register the handlers of the commands received on each topic """
+        component = self.component
+        register = self.dispatcher.register
+
+        # Messages from the groups
+        register(MQTT_TOPIC_REQUEST_HELP, "request_help",
+                 component.handle_request_help)
+        # Only the latest presence and status of a group is handled during a storm
+        register(MQTT_TOPIC_GROUP_PRESENT, "group_present",
+                 self.handle_group_present, pass_message=True, coalesce="group_present")
+        register(MQTT_TOPIC_GROUP_DONE, "tasks_done",
+                 component.handle_group_done, coalesce="group_status")
+        register(MQTT_TOPIC_PROGRESS, "report_current_task",
+                 component.handle_group_progress, coalesce="group_status")
+
+        # Messages from the other TAs
+        register(MQTT_TOPIC_TA_UPDATE, "ta_update_tasks",
+                 component.handle_ta_update_tasks)
+        register(MQTT_TOPIC_TA_UPDATE, "ta_update_receiving_help",
+                 component.handle_ta_update_receiving_help)
+        register(MQTT_TOPIC_TA_UPDATE, "ta_update_received_help",
+                 component.handle_ta_update_received_help)
+
+        # Synchronization of the shared state with a joining TA
+        register(MQTT_TOPIC_TA_UPDATE, "request_sync",
+                 component.handle_request_sync)
+        register(MQTT_TOPIC_TA_UPDATE, "sync_claim",
+                 component.handle_sync_claim)
+        register(self.MQTT_TOPIC_TA, "sync_state",
+                 component.handle_sync_state)
+
+        # The retained tasks and states of the groups tell a joining TA what it missed
+        if self.retained_state:
+            register(MQTT_TOPIC_TASKS, "submit_tasks",
+                     self.handle_submitted_tasks, pass_message=True)
+            register(MQTT_TOPIC_GROUP_STATE, "group_state",
+                     self.handle_group_state, pass_message=True, coalesce="group_state")
+
+        # Heartbeats electing the TA publishing on behalf of all the TAs, TAs may share a name
+        register(MQTT_TOPIC_TA_UPDATE, "ta_heartbeat",
+                 self.handle_ta_heartbeat, coalesce="ta_heartbeat", sender=lambda header, body: body['id'])
+
+        # The presence of the other TAs tells which wire formats they can decode
+        register(MQTT_TOPIC_TA_PRESENCE_ALL, "ta_presence",
+                 self.handle_ta_presence, pass_message=True)
+
+        # The retained snapshot tells a joining TA the latest queue version
+        register(MQTT_TOPIC_QUEUE_SNAPSHOT, "queue_snapshot",
+                 component.handle_queue_snapshot)
+
+    def join(self):
+        """ Join the lab session once logged in, deferred until the client is connected """
+        self.set_topics()
+        self.joined = True
+
+        if self.connected:
+            self.announce()
+
+    def announce(self):
+        """ Subscribe to the topics of the TA, request the state and notify the groups of the TA """
+        # Subscribe to the topics
+        self.subscribe_topics()
+
+        # Request the state of the lab session for a late joiner
+        self.request_sync(self.component.synced_versions)
+
+        # Notify the student groups of the TA joining
+        self.publish_presence(online=True)
+
+        # Take part in the election of the leader
+        self.election.start()
 
     def subscribe_topics(self):
-        # Subscribe to the input topics
-        self.mqtt_client.subscribe(MQTT_TOPIC_REQUEST_HELP)
-        self.mqtt_client.subscribe(MQTT_TOPIC_GROUP_PRESENT)
-        self.mqtt_client.subscribe(MQTT_TOPIC_GROUP_DONE)
-        self.mqtt_client.subscribe(MQTT_TOPIC_PROGRESS)
-        self.mqtt_client.subscribe(MQTT_TOPIC_TA_UPDATE)
-        self.mqtt_client.subscribe(self.MQTT_TOPIC_TA)
-        self.mqtt_client.subscribe(MQTT_TOPIC_TA_READY_REQUEST)
+        # Subscribe to the input topics, every topic with registered handlers
+        for topic in self.dispatcher.topics():
+            self.mqtt_client.subscribe(topic)
 
     # MQTT communication methods
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            # A reason code object with MQTT 5
+            reason = mqtt.connack_string(rc) if isinstance(rc, int) else rc
+            self._logger.error(f'MQTT connection refused: {reason}')
+            return
+
         # Log that we are connected if the connection was successful
         self._logger.debug(f'MQTT connected to {client}')
+        self.connected = True
+        self.backoff.reset()
+        self.election.set_connected(True)
+
+        # Subscriptions and presence are deferred until connected, and made again
+        # after reconnecting as the broker does not keep the session
+        if self.joined:
+            self.announce()
+
+        # Publish the held back and spooled messages
+        self.outbound.set_online(True)
+
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        self._logger.debug(f'MQTT disconnected from {client}')
+        self.connected = False
+        self.outbound.set_online(False)
+        self.election.set_connected(False)
+
+        # The network loop reconnects after the delay, unless disconnected on purpose
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            reason = mqtt.error_string(rc) if isinstance(rc, int) else rc
+            self._logger.warning(f'MQTT connection lost: {reason}')
+            self.backoff.schedule(client)
+
+    def on_connect_fail(self, client, userdata):
+        self.backoff.schedule(client)
+
+    def handle_group_present(self, header, body, msg):
+        # Only send in the preferred wire format as long as all the groups can decode it
+        self.codec.peer_supports(header, body.get('codecs'))
+
+        # Left over by groups retaining their presence before the state topic, the state tells it now
+        if msg.retain:
+            return
 
-    def on_message(self, client, userdata, msg):
-        # Get the topic
-        topic = msg.topic
-        # Log the message received
-        self._logger.debug(
-            f'MQTT received message on topic {topic}, with payload {msg.payload}')
-
-        # Unwrap the message
-        try:
-            payload = json.loads(msg.payload.decode('utf-8'))
-        except json.JSONDecodeError:
-            self._logger.error(
-                f'Could not decode JSON from message {msg.payload}')
+        self.component.handle_group_present(header, body)
+
+    def handle_group_state(self, header, body, msg):
+        # The live states repeat the presence and progress messages, only the retained ones are news
+        self.codec.peer_supports(header, body.get('codecs'))
+
+        if msg.retain:
+            self.component.handle_group_state(header, body)
+
+    def handle_submitted_tasks(self, header, body, msg):
+        # The retained tasks may be left over from an earlier lab session
+        if msg.retain:
+            self.component.handle_retained_tasks(header, body)
+        else:
+            self.component.handle_submitted_tasks(header, body)
+
+    def handle_ta_presence(self, header, body, msg):
+        if body['id'] == self.client_id:
             return
 
-        # Get the command
-        command = payload.get('command')
-        header = payload.get('header')
-        body = payload.get('body')
-
-        self._logger.debug(f'Received command {command}')
-
-        # Handle the different topics
-        if command == "request_help":
-            # Handle the request for help
-            self.component.handle_request_help(header, body)
-        elif command == "group_present":
-            # Handle the group present message
-            self.component.handle_group_present(header, body)
-        elif command == "tasks_done":
-            # Handle the group done message
-            self.component.handle_group_done(header, body)
-        elif command == "report_current_task":
-            # Handle the progress message
-            self.component.handle_group_progress(header, body)
-        elif command == "ta_update_tasks":
-            # Handle the ta update message
-            self.component.handle_ta_update_tasks(header, body)
-        elif command == "ta_update_receiving_help":
-            # Handle the ta update message
-            self.component.handle_ta_update_receiving_help(header, body)
-        elif command == "ta_update_received_help":
-            # Handle the ta update message
-            self.component.handle_ta_update_received_help(header, body)
-        elif command == "request_update_of_tables":
-            # Handle the ta request for table updates
-            self.component.handle_request_update_of_tables(header, body)
-        elif command == "ta_update_tables":
-            # Handle the ta update message
-            self.component.handle_ta_update_tables(header, body)
-
-    def publish_message(self, topic, message):
+        if body['online']:
+            self.codec.peer_supports(body['id'], body.get('codecs'))
+            self.election.peer_seen(body['id'])
+        else:
+            self.codec.peer_left(body['id'])
+            self.election.peer_left(body['id'])
+
+            # The Last Will of a TA that lost its connection, kept by the broker since
+            if msg.retain:
+                self.clear_presence(body['id'])
+
+    def handle_ta_heartbeat(self, header, body):
+        self.election.peer_seen(body['id'], body.get('leader', False))
+
+    def is_leader(self):
+        """ Test if the TA is the one publishing on behalf of all the TAs """
+        return self.election.is_leader()
+
+    def has_leader(self):
+        """ Test if the TA knows of a leader, none while disconnected or still listening """
+        return self.election.leader() is not None
+
+    def publish_message(self, topic, message, retain=False):
         """Publish a message to the MQTT broker.
 
+        The QoS, retain flag and expiry are taken from the delivery policy of the command.
+
         Args:
             topic (str): The topic to publish to.
             message (str): The message to publish.
+            retain (bool): Whether the broker should retain the message, regardless of the policy.
         """
-        payload = json.dumps(message)
-        self._logger.debug(f'Publishing message to topic {topic}: {payload}')
-        self.mqtt_client.publish(topic, payload, qos=2)
+        self._logger.debug(f'Publishing message to topic {topic}: {message}')
+        arguments = self.delivery_policies.publish_arguments(message['command'], retain)
+        payload = self.codec.encode(message, retained=arguments["retain"])
+        self.publish_payload(topic, message['command'], payload, arguments)
+
+    def publish_payload(self, topic, command, payload, arguments):
+        """ Publish an encoded message with the publish arguments of its delivery policy """
+        if self.recorder is not None:
+            self.recorder.record(OUTBOUND, topic, payload, arguments["qos"], arguments["retain"])
+
+        self.outbound.publish(topic, command, payload, **arguments)
 
     # MQTT message creation logic
     def create_payload(self, command, header, body):
         """ Create a payload for the MQTT message """
         return {"command": command, "header": header, "body": body}
 
-    def __init__(self, component, logger):
+    def __init__(self, component, logger, codec=JSON, retained_state=False, delivery_policies=None,
+                 spool_path=None, transport=None, recorder=None, inbound_overflow=OVERFLOW_BLOCK):
         self.component = component
         self._logger: logging.Logger = logger
 
@@ -123,46 +249,138 @@ class TaMqttClient:
         # create a new MQTT client
         self._logger.debug(
             f'Connecting to MQTT broker {MQTT_BROKER} at port {MQTT_PORT}')
-        self.mqtt_client = mqtt.Client()
-        # callback methods
-        self.mqtt_client.on_connect = self.on_connect
-        self.mqtt_client.on_message = self.on_message
-
         # Setting the name of the ta to none (will be set when logging in)
         self.ta_mqtt_endpoint = None
         self.ta_name = None
 
-        # Connect to the broker
-        self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT)
+        # The client id identifies the presence record of the TA
+        self.client_id = f"ta_{uuid.uuid4().hex}"
+        self.MQTT_TOPIC_TA_PRESENCE = MQTT_TOPIC_TA_PRESENCE + "/" + self.client_id
+        # The broker given by the transport, by default the broker of the course over TCP
+        self.transport = transport or PahoTransport(MQTT_BROKER, MQTT_PORT)
+        # QoS, retain flag and expiry of every command, the expiry needs MQTT 5
+        self.delivery_policies = delivery_policies or DeliveryPolicies()
+        self.mqtt_client = self.transport.create_client(self.client_id, protocol=self.delivery_policies.protocol)
+
+        # Wire format of the messages, negotiated with the groups and the other TAs
+        self.codec = MessageCodec(preferred=codec)
+        # The encoded messages carrying the tasks of the lab session, by (task set hash, command, header, codec)
+        self._task_payloads = {}
+
+        # Messages published while disconnected are kept on disk and replayed once connected
+        self.spool = OutboundSpool(spool_path, logger) if spool_path else None
+
+        # Published messages are batched, superseded messages not sent yet are dropped,
+        # and held back until connected
+        self.outbound = ConflatingPublisher(
+            self.mqtt_client, logger, spool=self.spool, online=False)
+
+        # Jittered delays between the attempts to reconnect after losing the connection
+        self.backoff = ReconnectBackoff(logger)
+
+        # Publish the tasks as a retained message, so groups and TAs joining
+        # later learn them from the broker when subscribing
+        self.retained_state = retained_state
+
+        # The broker marks the TA as offline if the connection is lost,
+        # in JSON as it is set once for all the clients receiving it
+        self.mqtt_client.will_set(self.MQTT_TOPIC_TA_PRESENCE, encode(
+            self.create_presence_payload(online=False), JSON), qos=1, retain=True)
+
+        # callback methods
+        self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_disconnect = self.on_disconnect
+        self.mqtt_client.on_connect_fail = self.on_connect_fail
+
+        # The TA publishing the queue and the tasks for late groups, on behalf of all the TAs
+        self.election = LeaderElection(
+            self.client_id, self.publish_heartbeat, logger, on_change=component.handle_leader_changed)
+
+        # Received messages are handled by their own thread, so the network loop
+        # keeps up with the broker during message storms
+        self.inbound = InboundStage(logger, overflow=inbound_overflow)
+
+        # Log of the received and published traffic, for replaying the session
+        self.recorder = recorder
+
+        # Received messages are dispatched per topic and command
+        self.dispatcher = CommandDispatcher(
+            self.mqtt_client, self.codec, logger, inbound=self.inbound, recorder=recorder)
 
-    def request_update_of_tables(self):
-        # Request the tables to be updated
-        self._logger.info('Requesting update of tables')
+        # Tracking the connection, the TA joins when both connected and logged in
+        self.connected = False
+        self.joined = False
+
+        # Connect to the broker without blocking, the connection is made by the network loop
+        self.transport.connect(self.mqtt_client)
+
+    def request_sync(self, versions):
+        # Request the changes of the shared state since the version received from every TA
+        self._logger.info(f'Requesting the state since versions {versions}')
 
         payload = self.create_payload(
-            command="request_update_of_tables", header=self.ta_name, body="")
+            command="request_sync", header=self.ta_name, body={"id": self.client_id, "versions": dict(versions)})
 
         self.publish_message(MQTT_TOPIC_TA_UPDATE, payload)
 
-    def notify_student_groups_of_ta(self):
+    def claim_sync(self, requester):
+        # Tell the other TAs who is answering the TA requesting the state, by their client ids
         payload = self.create_payload(
-            command="ta_present_all", header=self.ta_name, body={})
+            command="sync_claim", header=self.ta_name, body={"id": self.client_id, "requester": requester})
 
-        # Report that TA is ready
-        self.publish_message(MQTT_TOPIC_TA_READY_RESPONSE_ALL, payload)
+        self.publish_message(MQTT_TOPIC_TA_UPDATE, payload)
 
-    def report_queue_number(self, group, queue_number):
-        # Wrap the queue number in a list
-        message = {"queue_number": f"{queue_number}"}
+    def create_presence_payload(self, online):
+        body = {"id": self.client_id, "ta": self.ta_name, "online": online,
+                # The wire formats the TA can decode
+                "codecs": self.codec.supported()}
 
-        mqtt_topic_endpoint = group.lower().replace(" ", "_")
+        return self.create_payload(command="ta_presence", header=self.ta_name, body=body)
 
+    def publish_presence(self, online, retain=True):
+        # Retained, so groups joining later learn which TAs are present when subscribing
+        self.publish_message(self.MQTT_TOPIC_TA_PRESENCE,
+                             self.create_presence_payload(online), retain=retain)
+
+    def clear_presence(self, client_id):
+        # An empty retained message removes the presence record of the TA from the broker
+        self.publish_payload(MQTT_TOPIC_TA_PRESENCE + "/" + client_id, "ta_presence", b"",
+                             self.delivery_policies.publish_arguments("ta_presence", retain=True))
+
+    def publish_heartbeat(self, leader):
         payload = self.create_payload(
-            command="queue_number", header=self.ta_name, body=message)
+            command="ta_heartbeat", header=self.ta_name, body={"id": self.client_id, "leader": leader})
 
-        # Send the queue number to the group
-        self.publish_message(MQTT_TOPIC_QUEUE_NUMBER +
-                             "/" + mqtt_topic_endpoint, payload)
+        self.publish_message(MQTT_TOPIC_TA_UPDATE, payload)
+
+    def leave(self):
+        """ Mark the TA as offline and disconnect cleanly (the Last Will is only sent on connection loss) """
+        self.election.stop()
+
+        # The TAs and groups present learn that the TA left, and the record is removed
+        # so the presence topics do not fill up with a record for every session
+        if self.joined and self.connected:
+            self.publish_presence(online=False, retain=False)
+            self.clear_presence(self.client_id)
+
+        # Publish the pending messages before disconnecting
+        self.outbound.stop()
+        self.inbound.stop()
+
+        self.mqtt_client.disconnect()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def publish_queue_snapshot(self, version, groups):
+        # The groups are listed in queue order, each group finds its own queue number
+        message = {"version": version, "queue": groups}
+
+        payload = self.create_payload(
+            command="queue_snapshot", header=self.ta_name, body=message)
+
+        # Broadcast the queue once, retained for groups subscribing later
+        self.publish_message(MQTT_TOPIC_QUEUE_SNAPSHOT, payload, retain=True)
 
     def notify_other_tas_getting_help(self, body):
         payload = self.create_payload(
@@ -196,10 +414,11 @@ class TaMqttClient:
         self.publish_message(MQTT_TOPIC_RECEIVED_HELP +
                              "/" + mqtt_topic_endpoint, payload)
 
-    def notify_other_tas_got_help(self, row):
+    def notify_other_tas_got_help(self, request_id, group):
 
         body = {
-            "row": row
+            "id": request_id,
+            "group": group
         }
 
         payload = self.create_payload(
@@ -207,48 +426,45 @@ class TaMqttClient:
 
         self.publish_message(MQTT_TOPIC_TA_UPDATE, payload)
 
-    def report_ta_present(self, group):
-        # Wrap the group name in a list
-        message = {"ta": self.ta_name}
+    def publish_task_set(self, topic, command, task_set, retain=False):
+        """ Publish the tasks, encoded once and reused for every message of the same command """
+        self._logger.debug(
+            f'Publishing {command} with tasks {task_set.hash} to topic {topic}')
+        arguments = self.delivery_policies.publish_arguments(command, retain)
+        wire_format = self.codec.current(retained=arguments["retain"])
+        key = (task_set.hash, command, self.ta_name, wire_format)
+        payload = self._task_payloads.get(key)
 
-        mqtt_topic_endpoint = group.lower().replace(" ", "_")
+        if payload is None:
+            # Only the messages of the current tasks are kept
+            if any(cached[0] != task_set.hash for cached in self._task_payloads):
+                self._task_payloads.clear()
 
-        payload = self.create_payload(
-            command="ta_present", header=self.ta_name, body=message)
+            payload = self._task_payloads[key] = encode(
+                {"command": command, "header": self.ta_name, "body": task_set.tasks()}, wire_format)
 
-        # Send the group name to the group
-        self.publish_message(MQTT_TOPIC_TA_READY_RESPONSE +
-                             "/" + mqtt_topic_endpoint, payload)
+        self.publish_payload(topic, command, payload, arguments)
 
-    def send_tasks_to_group(self, header, body):
+    def send_tasks_to_group(self, header, task_set):
         mqtt_topic_endpoint = header.lower().replace(" ", "_")
 
-        payload = self.create_payload(
-            command="submit_tasks_late", header=self.ta_name, body=body)
-
         # Send the tasks to the group
-        self.publish_message(MQTT_TOPIC_TASKS_LATE + "/" +
-                             mqtt_topic_endpoint, payload)
-
-    def submit_tasks_to_groups(self, body):
-        payload = self.create_payload(
-            command="submit_tasks", header=self.ta_name, body=body)
+        self.publish_task_set(MQTT_TOPIC_TASKS_LATE + "/" +
+                              mqtt_topic_endpoint, "submit_tasks_late", task_set)
 
+    def submit_tasks_to_groups(self, task_set):
         # Publish the tasks to the MQTT broker
-        self.publish_message(MQTT_TOPIC_TASKS, payload)
-
-    def submit_tasks_to_tas(self, body):
-        payload = self.create_payload(
-            command="ta_update_tasks", header=self.ta_name, body=body)
+        self.publish_task_set(MQTT_TOPIC_TASKS, "submit_tasks", task_set,
+                              retain=self.retained_state)
 
+    def submit_tasks_to_tas(self, task_set):
         # Send the tasks to the other TAs
-        self.publish_message(MQTT_TOPIC_TA_UPDATE, payload)
+        self.publish_task_set(MQTT_TOPIC_TA_UPDATE,
+                              "ta_update_tasks", task_set)
 
-    def send_tables_to_ta(self, header, body):
+    def send_sync_state(self, requester, body):
         payload = self.create_payload(
-            command="ta_update_tables", header=self.ta_name, body=body)
-
-        ta_endpoint = header.lower().replace(" ", "_")
+            command="sync_state", header=self.ta_name, body=body)
 
-        # Send the tasks to the TA that requested the update
-        self.publish_message(MQTT_TOPIC_TA + "/" + ta_endpoint, payload)
+        # Send the state to the TA that requested it, on the topic of its client id
+        self.publish_message(MQTT_TOPIC_TA + "/" + requester, payload)
@@ -0,0 +1,156 @@
+# Network loop of a paho MQTT client driven by the Tk event loop
+import logging
+import threading
+import time
+import tkinter
+import paho.mqtt.client as mqtt
+
+# The network loop modes supported by the clients
+NETWORK_LOOP_THREAD = 'thread'
+NETWORK_LOOP_TK = 'tk'
+
+
+class TkNetworkLoop:
+    """ Runs the network loop of a paho client in the Tk main loop
+
+    The socket of the client is registered as a Tk file handler, so reads and
+    writes are handled by the same thread as the GUI, without locks or context
+    switches. Keepalive and retries are handled by loop_misc from Tk's after,
+    reconnecting after the delays of the backoff if one is given. Connecting
+    blocks until the broker answers or the socket times out, so it is run in a
+    thread of its own, and the socket it opens is registered by the next poll.
+    """
+
+    def __init__(self, mqtt_client: mqtt.Client, logger, poll_interval=10, misc_interval=1000, backoff=None):
+        self._logger: logging.Logger = logger
+        self.mqtt_client = mqtt_client
+        self._backoff = backoff
+
+        # Interval for flushing writes queued from other threads (milliseconds)
+        self._poll_interval = poll_interval
+        # Interval for the keepalive and reconnect handling (milliseconds)
+        self._misc_interval = misc_interval
+
+        self._root = None
+        self._main_thread = None
+        self._sock = None
+        self._running = False
+        # Thread connecting to the broker, and the socket it opened or closed for the main thread
+        self._connecting = None
+        self._opened = None
+        self._closed = None
+
+    def start(self, root):
+        """ Start the network loop in the main loop of the given Tk root (e.g. app.topLevel) """
+        self._root = root
+        self._main_thread = threading.current_thread()
+        self._running = True
+
+        self.mqtt_client.on_socket_open = self._on_socket_open
+        self.mqtt_client.on_socket_close = self._on_socket_close
+        self.mqtt_client.on_socket_register_write = self._on_socket_register_write
+        self.mqtt_client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        # The client may already be connected before the loop is started
+        if self.mqtt_client.socket() is not None:
+            self._on_socket_open(self.mqtt_client, None,
+                                 self.mqtt_client.socket())
+
+        self._root.after(self._poll_interval, self._poll)
+        # Connect right away if the connection was deferred with connect_async
+        self._root.after(0, self._misc)
+
+    def stop(self):
+        self._running = False
+
+        # Flush pending writes, such as a clean disconnect
+        while self._sock is not None and self.mqtt_client.want_write():
+            if self.mqtt_client.loop_write() != mqtt.MQTT_ERR_SUCCESS:
+                break
+
+        if self._sock is not None:
+            self._root.tk.deletefilehandler(self._sock)
+            self._sock = None
+
+    def _on_socket_open(self, client, userdata, sock):
+        if threading.current_thread() is not self._main_thread:
+            # Opened by the connecting thread, registered by the next poll
+            self._opened = sock
+            return
+
+        self._logger.debug('Registering MQTT socket with Tk')
+        self._sock = sock
+        self._watch(sock, write=client.want_write())
+
+    def _on_socket_close(self, client, userdata, sock):
+        if threading.current_thread() is not self._main_thread:
+            # Closed by the connecting thread, unregistered by the next poll
+            if sock is self._sock:
+                self._closed = sock
+                self._sock = None
+            return
+
+        self._logger.debug('Unregistering MQTT socket from Tk')
+        self._root.tk.deletefilehandler(sock)
+        self._sock = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        # Tk file handlers can only be changed from the main thread,
+        # writes queued from other threads are flushed by the next poll
+        if threading.current_thread() is self._main_thread:
+            self._watch(sock, write=True)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        if threading.current_thread() is self._main_thread and self._sock is not None:
+            self._watch(sock, write=False)
+
+    def _watch(self, sock, write):
+        mask = tkinter.READABLE | tkinter.WRITABLE if write else tkinter.READABLE
+        self._root.tk.createfilehandler(sock, mask, self._on_socket_event)
+
+    def _on_socket_event(self, sock, mask):
+        if mask & tkinter.READABLE:
+            self.mqtt_client.loop_read()
+        if mask & tkinter.WRITABLE and self._sock is not None:
+            self.mqtt_client.loop_write()
+
+    def _poll(self):
+        if not self._running:
+            return
+
+        # Take over the sockets of the connecting thread
+        if self._closed is not None:
+            sock, self._closed = self._closed, None
+            self._root.tk.deletefilehandler(sock)
+        if self._opened is not None:
+            sock, self._opened = self._opened, None
+            self._on_socket_open(self.mqtt_client, None, sock)
+
+        if self._sock is not None and self.mqtt_client.want_write():
+            self.mqtt_client.loop_write()
+
+        self._root.after(self._poll_interval, self._poll)
+
+    def _misc(self):
+        if not self._running:
+            return
+
+        # The client has no socket until the connect in progress finished
+        if self._connecting is None or not self._connecting.is_alive():
+            if self.mqtt_client.loop_misc() == mqtt.MQTT_ERR_NO_CONN and self._reconnect_due():
+                self._connecting = threading.Thread(target=self._reconnect, daemon=True)
+                self._connecting.start()
+
+        self._root.after(self._misc_interval, self._misc)
+
+    def _reconnect(self):
+        # Run by the connecting thread, the Tk main loop keeps running meanwhile
+        try:
+            self.mqtt_client.reconnect()
+        except OSError as e:
+            self._logger.warning(f'Could not reconnect to MQTT broker: {e}')
+            if self._backoff is not None:
+                self._backoff.schedule(self.mqtt_client)
+
+    def _reconnect_due(self):
+        return self._backoff is None or time.monotonic() >= self._backoff.next_attempt
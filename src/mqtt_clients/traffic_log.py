@@ -0,0 +1,82 @@
+# Log of the MQTT traffic of a client, for replaying a lab session
+import logging
+import struct
+import threading
+import time
+
+# Directions of the logged messages
+INBOUND = 0
+OUTBOUND = 1
+
+# Every record is a header followed by the topic and the payload
+_HEADER = struct.Struct('<dBBHI')
+_MAGIC = b'MQTL1\n'
+
+
+class TrafficRecorder:
+    """ Appends the messages received and published by a client to a log file
+
+    A record is the wall clock time, the direction, the QoS and retain flag, the
+    topic and the raw payload, packed in a binary header of 16 bytes. The file is
+    only appended to, and flushed at most once a second while recording.
+    """
+
+    def __init__(self, path, logger, flush_interval=1.0):
+        self._logger: logging.Logger = logger
+        self.path = path
+        self._lock = threading.Lock()
+        self._flush_interval = flush_interval
+        self._flushed = time.monotonic()
+
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_MAGIC)
+
+        self.records = 0
+
+    def record(self, direction, topic, payload, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        topic = topic.encode('utf-8')
+        flags = qos | (4 if retain else 0)
+        record = _HEADER.pack(time.time(), direction, flags,
+                              len(topic), len(payload)) + topic + payload
+
+        with self._lock:
+            if self._file.closed:
+                return
+
+            self._file.write(record)
+            self.records += 1
+
+            if time.monotonic() - self._flushed >= self._flush_interval:
+                self._file.flush()
+                self._flushed = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                self._logger.info(
+                    f'Recorded {self.records} messages to {self.path}')
+
+
+def read_traffic(path):
+    """ Read the records of a log as (time, direction, topic, payload, qos, retain), a cut off record ends the log """
+    with open(path, 'rb') as file:
+        if file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f'{path} is not a traffic log')
+
+        while True:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+
+            at, direction, flags, topic_length, payload_length = _HEADER.unpack(header)
+            topic = file.read(topic_length)
+            payload = file.read(payload_length)
+            if len(topic) < topic_length or len(payload) < payload_length:
+                return
+
+            yield at, direction, topic.decode('utf-8'), payload, flags & 3, bool(flags & 4)
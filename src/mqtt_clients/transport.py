@@ -0,0 +1,17 @@
+# Transports connecting the MQTT clients of the TA and the groups to a broker
+import paho.mqtt.client as mqtt
+
+
+class PahoTransport:
+    """ Connects the clients to an MQTT broker over TCP with paho """
+
+    def __init__(self, host, port=1883):
+        self.host = host
+        self.port = port
+
+    def create_client(self, client_id="", protocol=mqtt.MQTTv311):
+        return mqtt.Client(client_id=client_id, protocol=protocol)
+
+    def connect(self, client):
+        """ Connect without blocking, the connection is made by the network loop """
+        client.connect_async(self.host, self.port)
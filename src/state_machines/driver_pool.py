@@ -0,0 +1,57 @@
+# Pool of stmpy drivers sharing the state machines of many groups
+import hashlib
+import logging
+from state_machines.timer_service import TimedDriver
+
+
+def shard_of(stm_id, shards):
+    """ Index of the driver of a machine, the same in every process
+
+    CRC32 spreads names differing in one character, as team_1 and team_2, badly
+    over a few drivers, so the names are hashed with BLAKE2.
+    """
+    digest = hashlib.blake2b(stm_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % shards
+
+
+class DriverPool:
+    """ Drivers in threads of their own, each running the machines whose name hashes to it
+
+    The pool is used like a single stmpy driver: machines are added and messages
+    sent by the name of the machine, and go to the driver of that name, so the
+    events of one machine stay in order while the machines of different drivers
+    run side by side. All drivers share the timer service.
+
+    The transitions only run in parallel where they wait, e.g. on I/O, as the
+    threads share the interpreter.
+    """
+
+    def __init__(self, timers, logger, size=4):
+        self._logger: logging.Logger = logger
+        self.timers = timers
+        self.drivers = [TimedDriver(timers) for _ in range(size)]
+
+    def driver_of(self, stm_id):
+        return self.drivers[shard_of(stm_id, len(self.drivers))]
+
+    def start(self, max_transitions=None, keep_active=False):
+        for driver in self.drivers:
+            driver.start(max_transitions=max_transitions, keep_active=keep_active)
+
+    def add_machine(self, machine):
+        self.driver_of(machine.id).add_machine(machine)
+
+    def send(self, message_id, stm_id, args=[], kwargs={}):
+        self.driver_of(stm_id).send(message_id, stm_id, args=args, kwargs=kwargs)
+
+    @property
+    def pending(self):
+        return sum(driver.pending for driver in self.drivers)
+
+    def stats(self):
+        """ Queue depth, handled events and seconds waited in the queue of every driver """
+        return [driver.stats() for driver in self.drivers]
+
+    def stop(self):
+        for driver in self.drivers:
+            driver.stop()
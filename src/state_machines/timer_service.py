@@ -0,0 +1,360 @@
+# Clocks and the timer service driving the timers of the state machines
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+import stmpy
+from state_machines.timing_wheel import TimingWheel
+
+
+class SystemClock:
+    """ The real time, in seconds """
+
+    simulated = False
+
+    def now(self):
+        return time.monotonic()
+
+
+class SimulatedClock:
+    """ A virtual time in seconds, only moving forward when advanced
+
+    The timer service jumps a simulated clock straight to the next deadline once
+    the state machines are idle, so a lab session of hours runs in seconds.
+    """
+
+    simulated = True
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self):
+        with self._lock:
+            return self._now
+
+    def advance_to(self, at):
+        with self._lock:
+            self._now = max(self._now, at)
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += seconds
+
+
+class HeapScheduler:
+    """ Timers in a heap on the deadline
+
+    Starting a timer is O(log n). A stopped timer is only marked, and dropped
+    once it reaches the top of the heap.
+    """
+
+    def __init__(self):
+        # Timers as [deadline, sequence, key, callback]
+        self._heap = []
+        self._timers = {}
+        self._sequence = itertools.count()
+
+    def start(self, now):
+        pass
+
+    def __len__(self):
+        return len(self._timers)
+
+    def add(self, key, deadline, callback):
+        self.cancel(key)
+        timer = [deadline, next(self._sequence), key, callback]
+        self._timers[key] = timer
+        heapq.heappush(self._heap, timer)
+
+    def cancel(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer[3] = None
+
+    def deadline(self, key):
+        timer = self._timers.get(key)
+        if timer is None:
+            return None
+        return timer[0]
+
+    def next_deadline(self):
+        while self._heap and self._heap[0][3] is None:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def expire(self, now):
+        expired = []
+        while self.next_deadline() is not None and self._heap[0][0] <= now:
+            timer = heapq.heappop(self._heap)
+            del self._timers[timer[2]]
+            expired.append(timer[3])
+        return expired
+
+
+class TimerService:
+    """ Deadlines of the timers of state machines and other callbacks, run by one thread
+
+    The drivers of the state machines hand their timers to the service, so the
+    timers follow the injected clock and are all kept by one scheduler, a timing
+    wheel by default. The thread of the service is the only tick source, sleeping
+    until the next deadline of the scheduler.
+
+    With a simulated clock the service moves the time to the earliest deadline as
+    soon as no registered driver has events left, after the drivers have been
+    quiet for `settle` seconds of real time. Messages still on their way through
+    the broker do not hold the time back, so scenarios with MQTT traffic should
+    use a small settle time.
+    """
+
+    def __init__(self, clock, logger, scheduler=None, jump=True, settle=0.0):
+        self._logger: logging.Logger = logger
+        self.clock = clock
+        self._jump = jump and clock.simulated
+        self._settle = settle
+
+        self._scheduler = scheduler if scheduler is not None else TimingWheel()
+        self._scheduler.start(clock.now())
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        # Deadline the thread sleeps until, None while it waits for a timer
+        self._waiting_until = None
+
+        # Drivers whose events must be handled before a simulated clock moves on
+        self._drivers = []
+
+        self.fired = 0
+        self.jumps = 0
+
+        self._active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def now(self):
+        return self.clock.now()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._scheduler)
+
+    def call_later(self, delay, callback, key=None):
+        """ Run the callback after delay seconds on the thread of the service, restarting the timer with the same key """
+        with self._condition:
+            if key is None:
+                key = next(self._sequence)
+
+            deadline = self.clock.now() + delay
+            self._scheduler.add(key, deadline, callback)
+
+            # Wake the thread if the timer expires before it would wake up
+            if self._waiting_until is None or deadline < self._waiting_until:
+                self._condition.notify()
+
+            return key
+
+    def cancel(self, key):
+        with self._condition:
+            self._scheduler.cancel(key)
+
+    def remaining(self, key):
+        """ Seconds until the timer expires, or None if it is not running """
+        with self._condition:
+            deadline = self._scheduler.deadline(key)
+            if deadline is None:
+                return None
+            return deadline - self.clock.now()
+
+    def advance(self, seconds):
+        """ Move a simulated clock forward, running the timers that expire """
+        self.clock.advance(seconds)
+        self.wake()
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify()
+
+    def add_driver(self, driver):
+        with self._condition:
+            self._drivers.append(driver)
+
+    def remove_driver(self, driver):
+        with self._condition:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._active = False
+            self._condition.notify()
+
+    def _idle(self):
+        # Number of events the drivers have received, or None while they have events left
+        received = 0
+        for driver in self._drivers:
+            if driver.pending:
+                return None
+            received += driver.received
+        return received
+
+    def _wait(self, deadline, timeout=None):
+        self._waiting_until = deadline
+        self._condition.wait(timeout)
+        self._waiting_until = None
+
+    def _run(self):
+        settled = None
+        with self._condition:
+            while self._active:
+                expired = self._scheduler.expire(self.clock.now())
+                if expired:
+                    settled = None
+                    # The callbacks may start and stop timers, or wait for locks of their own
+                    self._condition.release()
+                    try:
+                        for callback in expired:
+                            self.fired += 1
+                            try:
+                                callback()
+                            except Exception:
+                                self._logger.exception('Timer callback failed')
+                    finally:
+                        self._condition.acquire()
+                    continue
+
+                deadline = self._scheduler.next_deadline()
+                if deadline is None:
+                    self._wait(None)
+                elif not self._jump:
+                    self._wait(deadline, max(0, deadline - self.clock.now()))
+                else:
+                    # A jump to a deadline expiring no timer keeps the drivers settled
+                    received = self._idle()
+                    if received is None:
+                        # The drivers notify the service once their queues are empty
+                        settled = None
+                        self._wait(None)
+                    elif self._settle and settled != received:
+                        settled = received
+                        self._wait(None, self._settle)
+                    else:
+                        self.clock.advance_to(deadline)
+                        self.jumps += 1
+
+
+class TimedDriver(stmpy.Driver):
+    """ An stmpy driver whose timers are run by a timer service
+
+    stmpy keeps the timers of a driver in a sorted list and checks them between
+    events with the real time. Here starting, stopping and reading a timer goes
+    to the service, which sends the timer event to the machine once it expires.
+    The driver counts the events it has not handled yet, so the service knows
+    when the machines are idle, and the time events wait in the queue.
+
+    stmpy keeps the machines of all drivers in one table that every new driver
+    clears, so the driver keeps a table of its own machines instead, and many
+    drivers can run in one process.
+    """
+
+    def __init__(self, timers, latency_samples=4096):
+        super().__init__()
+        self.timers = timers
+        self._machines = {}
+        self._pending_lock = threading.Lock()
+        # Events added and not handled yet, and all events added
+        self.pending = 0
+        self.received = 0
+
+        # Seconds the latest events waited in the queue before their transition
+        self.handled = 0
+        self.latencies = deque(maxlen=latency_samples)
+        self.max_latency = 0.0
+
+        timers.add_driver(self)
+
+    def add_machine(self, machine):
+        """ Add the state machine to this driver """
+        machine._driver = self
+        machine._reset()
+        if machine.id is not None:
+            self._machines[machine.id] = machine
+            self._add_event(None, [], {}, machine)
+
+    def send(self, message_id, stm_id, args=[], kwargs={}):
+        """ Send a message to a state machine of this driver """
+        stm = self._machines.get(stm_id)
+        if stm is None:
+            self._logger.warning(f'Machine with name {stm_id} cannot be found. Ignoring message {message_id}.')
+            return
+        self._add_event(message_id, args, kwargs, stm)
+
+    def _terminate_stm(self, stm_id):
+        self._machines.pop(stm_id, None)
+        if not self._keep_active and not self._machines:
+            self._active = False
+            self._wake_queue()
+
+    def stats(self):
+        """ Queue depth and handled events, with the seconds events waited in the queue """
+        latencies = sorted(self.latencies)
+        return {
+            "machines": len(self._machines),
+            "depth": self.pending,
+            "handled": self.handled,
+            "p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            "max": self.max_latency,
+        }
+
+    def _start_timer(self, name, timeout, stm):
+        self.timers.call_later(int(timeout) / 1000, lambda: self._add_event(name, [], {}, stm),
+                               key=(stm.id, name))
+
+    def _stop_timer(self, name, stm, log=True):
+        self.timers.cancel((stm.id, name))
+
+    def _get_timer(self, name, stm):
+        remaining = self.timers.remaining((stm.id, name))
+        if remaining is None:
+            return None
+        return remaining * 1000
+
+    def _check_timers(self):
+        # Block on the event queue until the next event, the timers are sent as events
+        self._next_timeout = None
+
+    def _add_event(self, event_id, args, kwargs, stm, front=False):
+        with self._pending_lock:
+            self.pending += 1
+            self.received += 1
+
+        event = {'id': event_id, 'args': args, 'kwargs': kwargs, 'stm': stm, 'queued': time.monotonic()}
+        if front:
+            self._event_queue.queue.appendleft(event)
+        else:
+            self._event_queue.put(event)
+
+    def _execute_transition(self, stm, event_id, args, kwargs, event):
+        latency = time.monotonic() - event['queued']
+        self.handled += 1
+        self.latencies.append(latency)
+        self.max_latency = max(self.max_latency, latency)
+
+        try:
+            super()._execute_transition(stm, event_id, args, kwargs, event)
+        finally:
+            # Deferred events are put back in the queue by the machine without
+            # being added again, and count as handled when deferred
+            with self._pending_lock:
+                self.pending = max(0, self.pending - 1)
+                idle = self.pending == 0
+            if idle:
+                self.timers.wake()
+
+    def stop(self):
+        super().stop()
+        self.timers.remove_driver(self)
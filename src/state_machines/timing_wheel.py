@@ -0,0 +1,154 @@
+# Hierarchical timing wheel keeping the deadlines of the timer service
+import math
+
+# Slots of every wheel, as a power of two
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+_ALL_SLOTS = (1 << SLOTS) - 1
+
+# Rounding error in ticks allowed when converting seconds to ticks, so the time
+# of a tick converts back to the same tick
+_EPSILON = 1e-6
+
+
+class TimingWheel:
+    """ Timers in wheels of slots, a tick of resolution seconds apart
+
+    The first wheel has a slot for each of the next 64 ticks, every next wheel a
+    slot for 64 slots of the wheel below. A timer goes in the slot of its deadline
+    in the lowest wheel reaching it, so starting and stopping a timer is O(1).
+    When the first wheel turns over the slot of the next wheel is emptied into the
+    wheels below. Timers further ahead than the wheels reach wait in the last
+    wheel, with 4 wheels of 10 ms that is 46 hours.
+
+    Every wheel keeps a bit mask of the slots with timers, so turning the wheels
+    skips straight to the next slot with timers instead of visiting every tick.
+
+    The wheel is not thread safe, the timer service holds its lock.
+    """
+
+    def __init__(self, resolution=0.01, levels=4):
+        self.resolution = resolution
+        self._levels = levels
+        self._range = SLOTS ** levels
+
+        # Slots of every wheel as dicts of the timers by key, and a mask of the slots with timers
+        self._wheels = [[{} for _ in range(SLOTS)] for _ in range(levels)]
+        self._occupied = [0] * levels
+        # Timers by key as [deadline tick, key, callback, level, slot]
+        self._timers = {}
+
+        # Last tick whose timers have expired
+        self.tick = 0
+
+    def start(self, now):
+        self.tick = self._ticks(now, math.floor)
+
+    def _ticks(self, seconds, rounding):
+        ticks = seconds / self.resolution
+        nearest = round(ticks)
+        if abs(ticks - nearest) < _EPSILON:
+            return nearest
+        return rounding(ticks)
+
+    def __len__(self):
+        return len(self._timers)
+
+    def add(self, key, deadline, callback):
+        """ Add a timer expiring at the first tick at or after deadline seconds """
+        self.cancel(key)
+        timer = [max(self._ticks(deadline, math.ceil), self.tick + 1), key, callback, 0, 0]
+        self._timers[key] = timer
+        self._place(timer)
+
+    def _place(self, timer):
+        # The lowest wheel reaching the deadline, the last wheel for timers further ahead
+        ticks = max(0, min(timer[0] - self.tick, self._range - 1))
+        level = (ticks.bit_length() - 1) // SLOT_BITS if ticks else 0
+        slot = ((self.tick + ticks) >> (SLOT_BITS * level)) & SLOT_MASK
+
+        timer[3] = level
+        timer[4] = slot
+        self._wheels[level][slot][timer[1]] = timer
+        self._occupied[level] |= 1 << slot
+
+    def cancel(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            slot = self._wheels[timer[3]][timer[4]]
+            del slot[key]
+            if not slot:
+                self._occupied[timer[3]] &= ~(1 << timer[4])
+
+    def deadline(self, key):
+        """ Seconds of the clock the timer expires at, or None if it is not running """
+        timer = self._timers.get(key)
+        if timer is None:
+            return None
+        return timer[0] * self.resolution
+
+    def _next_slot(self, level):
+        # First tick of the next slot of the wheel with timers, after the slot of the last tick
+        shift = SLOT_BITS * level
+        first = (self.tick >> shift) + 1
+        rotation = first & SLOT_MASK
+        occupied = self._occupied[level]
+        occupied = ((occupied >> rotation) | (occupied << (SLOTS - rotation))) & _ALL_SLOTS
+        return (first + (occupied & -occupied).bit_length() - 1) << shift
+
+    def _next_tick(self):
+        # The next tick with a timer of the first wheel or with a slot of a wheel
+        # above to empty, or None without timers
+        ticks = [self._next_slot(level) for level in range(self._levels) if self._occupied[level]]
+        return min(ticks) if ticks else None
+
+    def next_deadline(self):
+        """ Seconds of the clock before which no timer expires
+
+        The tick of the next timer in the first wheel, or else of the next slot of
+        a wheel above to empty into the wheels below, which may expire nothing.
+        """
+        tick = self._next_tick()
+        if tick is None:
+            return None
+        return tick * self.resolution
+
+    def expire(self, now):
+        """ Turn the wheels up to the clock, and return the callbacks of the expired timers """
+        target = self._ticks(now, math.floor)
+        expired = []
+
+        while self.tick < target:
+            # Skip the ticks without a timer to expire or a slot to empty
+            tick = self.tick + 1
+            if tick < target:
+                tick = self._next_tick()
+                tick = target if tick is None else min(tick, target)
+            self.tick = tick
+
+            # Empty the slots of the wheels turning over into the wheels below
+            for level in range(1, self._levels):
+                if tick & ((1 << (SLOT_BITS * level)) - 1):
+                    break
+                index = (tick >> (SLOT_BITS * level)) & SLOT_MASK
+                slot = self._wheels[level][index]
+                if slot:
+                    timers = list(slot.values())
+                    slot.clear()
+                    self._occupied[level] &= ~(1 << index)
+                    for timer in timers:
+                        self._place(timer)
+
+            index = tick & SLOT_MASK
+            slot = self._wheels[0][index]
+            if slot:
+                timers = [timer for timer in slot.values() if timer[0] <= tick]
+                for timer in timers:
+                    del slot[timer[1]]
+                    del self._timers[timer[1]]
+                    expired.append(timer[2])
+                if not slot:
+                    self._occupied[0] &= ~(1 << index)
+
+        return expired
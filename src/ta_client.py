@@ -1,8 +1,14 @@
+import argparse
 import logging
 from components.ta_component import TaClientComponent
+from mqtt_clients.client_options import add_client_arguments, client_options
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    add_client_arguments(parser, network_loop=True)
+    args = parser.parse_args()
+
     # logging.DEBUG: Most fine-grained logging, printing everything
     # logging.INFO:  Only the most important informational log items
     # logging.WARN:  Show only warnings and errors.
@@ -18,4 +24,4 @@ if __name__ == '__main__':
     logger.addHandler(ch)
 
     # Create a new instance of the TA client component
-    client = TaClientComponent(logger)
+    client = TaClientComponent(logger, **client_options(args, logger))
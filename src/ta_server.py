@@ -0,0 +1,46 @@
+import argparse
+import logging
+import time
+from components.ta_engine import TaEngine
+from mqtt_clients.client_options import add_client_arguments, client_options
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run the TA engine headless, without the GUI")
+    parser.add_argument("--name", required=True, help="name of the TA")
+    parser.add_argument("--task", action="append", default=[], metavar="DESCRIPTION=DURATION",
+                        help="task to submit when the first group is present, can be repeated")
+    add_client_arguments(parser)
+    args = parser.parse_args()
+
+    debug_level = logging.INFO
+    logger = logging.getLogger(__name__)
+    logger.setLevel(debug_level)
+    ch = logging.StreamHandler()
+    ch.setLevel(debug_level)
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)-12s - %(levelname)-8s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+    # Create a new instance of the TA engine without any GUI
+    engine = TaEngine(logger, **client_options(args, logger))
+
+    for task in args.task:
+        description, duration = task.rsplit("=", 1)
+        engine.add_task(description, duration)
+
+    def submit_when_groups_present(event, data):
+        # Submit the tasks given on the command line as soon as a group is present
+        if event == "group_status" and args.task and not engine.tasks_submitted:
+            engine.submit_tasks()
+
+    engine.add_listener(submit_when_groups_present)
+    engine.login(args.name)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        engine.stop()
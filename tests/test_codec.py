@@ -0,0 +1,47 @@
+import pytest
+from mqtt_clients.codec import CBOR, JSON, MSGPACK, CodecError, MessageCodec, available_codecs, decode, encode
+
+message = {"command": "report_current_task", "header": "team_1", "body": {"group": "Team 1", "current_task": "2"}}
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_round_trip(codec):
+    assert decode(encode(message, codec)) == message
+
+
+def test_json_has_no_marker():
+    assert encode(message, JSON).startswith(b'{')
+
+
+def test_undecodable_payloads():
+    with pytest.raises(CodecError):
+        decode(b'')
+    with pytest.raises(CodecError):
+        decode(b'not json')
+
+
+@pytest.mark.skipif(MSGPACK not in available_codecs(), reason="msgpack is not installed")
+def test_preferred_format_needs_every_peer():
+    codec = MessageCodec(MSGPACK)
+    assert codec.current() == JSON
+
+    codec.peer_supports("alice", [JSON, MSGPACK])
+    assert codec.current() == MSGPACK
+    # Retained messages reach clients joining later
+    assert codec.current(retained=True) == JSON
+
+    codec.peer_supports("bob", None)
+    assert codec.current() == JSON
+
+    codec.peer_left("bob")
+    assert codec.current() == MSGPACK
+
+
+def test_unavailable_format():
+    with pytest.raises(CodecError):
+        MessageCodec("xml")
+
+
+@pytest.mark.skipif(CBOR not in available_codecs(), reason="cbor2 is not installed")
+def test_cbor_is_smaller_than_json():
+    assert len(encode(message, CBOR)) < len(encode(message, JSON))
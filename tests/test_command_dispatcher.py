@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from mqtt_clients.codec import MessageCodec, encode
+from mqtt_clients.command_dispatcher import CommandDispatcher
+from mqtt_clients.inbound_stage import InboundStage
+
+logger = logging.getLogger(__name__)
+
+
+class FakeClient:
+    """ Keeps the message callbacks of the topic filters """
+
+    def __init__(self):
+        self.on_message = None
+        self.callbacks = {}
+
+    def message_callback_add(self, sub, callback):
+        self.callbacks[sub] = callback
+
+    def receive(self, topic_filter, command, header, body, topic=None, retain=False):
+        payload = encode({"command": command, "header": header, "body": body})
+        message = SimpleNamespace(topic=topic or topic_filter, payload=payload, qos=1, retain=retain)
+        self.callbacks[topic_filter](self, None, message)
+
+
+def test_handlers_are_called_per_topic_and_command():
+    client = FakeClient()
+    dispatcher = CommandDispatcher(client, MessageCodec(), logger)
+    calls = []
+    dispatcher.register("progress", "report_current_task", lambda header, body: calls.append((header, body)))
+    dispatcher.register("presence/+", "ta_presence", lambda header, body, msg: calls.append(msg.retain),
+                        pass_message=True)
+
+    client.receive("progress", "report_current_task", "team_1", {"current_task": "2"})
+    client.receive("presence/+", "ta_presence", "Alice", {}, topic="presence/alice", retain=True)
+    client.receive("progress", "tasks_done", "team_1", {})
+
+    assert calls == [("team_1", {"current_task": "2"}), True]
+    assert dispatcher.unknown_commands["tasks_done"] == 1
+    assert dispatcher.topics() == ["progress", "presence/+"]
+
+
+def test_empty_payloads_are_dropped():
+    client = FakeClient()
+    dispatcher = CommandDispatcher(client, MessageCodec(), logger)
+    calls = []
+    dispatcher.register("state/#", "group_state", lambda header, body: calls.append(body))
+
+    client.callbacks["state/#"](client, None, SimpleNamespace(topic="state/a", payload=b"", qos=1, retain=True))
+
+    assert calls == []
+
+
+def test_messages_are_coalesced_per_sender():
+    client = FakeClient()
+    inbound = InboundStage(logger)
+    dispatcher = CommandDispatcher(client, MessageCodec(), logger, inbound=inbound)
+    calls = []
+    dispatcher.register("ta_update", "ta_heartbeat", lambda header, body: calls.append(body),
+                        coalesce="ta_heartbeat", sender=lambda header, body: body["id"])
+
+    # Hold the stage until all the heartbeats are queued
+    gate = threading.Event()
+    inbound.submit(None, gate.wait)
+    client.receive("ta_update", "ta_heartbeat", "Alice", {"id": "a", "leader": False})
+    client.receive("ta_update", "ta_heartbeat", "Alice", {"id": "b", "leader": False})
+    client.receive("ta_update", "ta_heartbeat", "Alice", {"id": "a", "leader": True})
+    gate.set()
+
+    while inbound.handled < 3:
+        time.sleep(0.01)
+    inbound.stop()
+
+    # TAs sharing a name are kept apart, the latest heartbeat of a TA replaces the pending one
+    assert calls == [{"id": "a", "leader": True}, {"id": "b", "leader": False}]
+    assert inbound.coalesced == 1
@@ -0,0 +1,27 @@
+import paho.mqtt.client as mqtt
+import pytest
+from mqtt_clients.delivery_policy import BANDWIDTH_SAVER, LOW_LATENCY, RELIABLE, DeliveryPolicies
+
+
+def test_overrides_replace_single_fields_of_the_profile():
+    policies = DeliveryPolicies(LOW_LATENCY, {"default": {"retain": True}, "queue_snapshot": {"qos": 1},
+                                              "new_command": {"qos": 0}})
+
+    assert policies.policy("queue_snapshot").qos == 1
+    assert policies.policy("new_command").retain is True
+    assert policies.policy("request_help").qos == 1
+
+
+def test_expiry_connects_with_mqtt_5():
+    assert DeliveryPolicies(RELIABLE).protocol == mqtt.MQTTv311
+    assert DeliveryPolicies(RELIABLE, {"sync_state": {"expiry": 10}}).protocol == mqtt.MQTTv5
+
+    policies = DeliveryPolicies(BANDWIDTH_SAVER)
+    assert policies.protocol == mqtt.MQTTv5
+    assert policies.publish_arguments("queue_snapshot")["properties"].MessageExpiryInterval == 30
+    assert "properties" not in policies.publish_arguments("request_help")
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        DeliveryPolicies("fastest")
@@ -0,0 +1,73 @@
+from models.help_queue import HelpQueue
+
+
+def push(queue, group, timestamp, request_id=None):
+    return queue.push(group, f"Help {group}", "10:00:00", timestamp, request_id)
+
+
+def test_requests_are_ordered_on_timestamp():
+    queue = HelpQueue()
+    push(queue, "Team 2", 2.0)
+    push(queue, "Team 3", 3.0)
+    push(queue, "Team 1", 1.0)
+
+    assert [request.group for request in queue.ordered()] == ["Team 1", "Team 2", "Team 3"]
+    assert queue.peek().group == "Team 1"
+    assert queue.position("Team 3") == 3
+    assert queue.position("Team 4") is None
+
+
+def test_equal_timestamps_keep_the_order_of_arrival():
+    queue = HelpQueue()
+    push(queue, "Team 1", 1.0)
+    push(queue, "Team 2", 1.0)
+
+    assert [request.group for request in queue.ordered()] == ["Team 1", "Team 2"]
+
+
+def test_push_repositions_a_queued_group():
+    queue = HelpQueue()
+    push(queue, "Team 1", 1.0, "a")
+    push(queue, "Team 2", 2.0, "b")
+    push(queue, "Team 1", 3.0, "c")
+
+    assert len(queue) == 2
+    assert [request.group for request in queue.ordered()] == ["Team 2", "Team 1"]
+    assert queue.get_request("a") is None
+    assert queue.get_request("c").group == "Team 1"
+
+
+def test_remove_by_group_and_by_id():
+    queue = HelpQueue()
+    push(queue, "Team 1", 1.0, "a")
+    push(queue, "Team 2", 2.0, "b")
+
+    assert queue.remove_request("a").group == "Team 1"
+    assert queue.remove_request("a") is None
+    assert queue.remove("Team 2").request_id == "b"
+    assert queue.remove("Team 2") is None
+    assert len(queue) == 0 and queue.peek() is None
+
+
+def test_ordered_returns_a_copy():
+    queue = HelpQueue()
+    push(queue, "Team 1", 1.0)
+
+    queue.ordered().clear()
+
+    assert len(queue.ordered()) == 1
+
+
+def test_removed_entries_are_dropped_from_the_heap():
+    queue = HelpQueue()
+    for number in range(100):
+        push(queue, "Team 1", float(number))
+    push(queue, "Team 2", 0.5)
+
+    assert len(queue) == 2
+    assert len(queue._heap) < 100
+    assert queue.peek().group == "Team 2"
+
+    queue.remove("Team 2")
+    assert queue.peek().group == "Team 1"
+    assert queue.position("Team 1") == 1
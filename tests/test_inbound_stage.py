@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+import pytest
+from mqtt_clients.inbound_stage import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_GROW, InboundStage
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def held():
+    """ Start a stage whose thread is held by a first message until the gate is set """
+    gate = threading.Event()
+    stages = []
+
+    def start(**kwargs):
+        stage = InboundStage(logger, **kwargs)
+        stage.submit(None, gate.wait)
+        while stage.depth():
+            time.sleep(0.001)
+        stages.append(stage)
+        return stage
+
+    yield start, gate
+
+    gate.set()
+    for stage in stages:
+        stage.stop()
+
+
+def drain(stage, gate):
+    gate.set()
+    while stage.depth() or stage.handled + stage.coalesced + stage.dropped < stage.received:
+        time.sleep(0.001)
+
+
+def test_keyed_messages_replace_the_pending_one_in_place(held):
+    start, gate = held
+    stage = start()
+    handled = []
+    stage.submit(("status", "team_1"), handled.append, "team_1 task 1")
+    stage.submit(None, handled.append, "help")
+    stage.submit(("status", "team_1"), handled.append, "team_1 task 2")
+
+    drain(stage, gate)
+
+    assert handled == ["team_1 task 2", "help"]
+    assert stage.coalesced == 1
+
+
+def test_block_waits_for_room_and_loses_nothing(held):
+    start, gate = held
+    stage = start(max_messages=2)
+    handled = []
+    stage.submit(("status", "team_1"), handled.append, "team_1 done")
+    stage.submit(("status", "team_2"), handled.append, "team_2 task 2")
+
+    submitter = threading.Thread(target=stage.submit, args=(("status", "team_3"), handled.append, "team_3 done"))
+    submitter.start()
+    submitter.join(0.1)
+    assert submitter.is_alive()
+
+    # A newer message of a pending key still replaces it without waiting
+    stage.submit(("status", "team_2"), handled.append, "team_2 done")
+
+    drain(stage, gate)
+    submitter.join(1.0)
+    while stage.handled < 4:
+        time.sleep(0.001)
+
+    assert handled == ["team_1 done", "team_2 done", "team_3 done"]
+    assert stage.dropped == 0
+
+
+def test_grow_queues_past_the_bound(held):
+    start, gate = held
+    stage = start(max_messages=2, overflow=OVERFLOW_GROW)
+    handled = []
+    for number in range(4):
+        stage.submit(None, handled.append, number)
+
+    drain(stage, gate)
+
+    assert handled == [0, 1, 2, 3]
+    assert stage.overflowed == 2
+    assert stage.max_depth == 4
+
+
+@pytest.mark.parametrize("overflow, expected", [(OVERFLOW_DROP_OLDEST, [1, 2]), (OVERFLOW_DROP_NEWEST, [0, 1])])
+def test_dropping_policies(held, overflow, expected):
+    start, gate = held
+    stage = start(max_messages=2, overflow=overflow)
+    handled = []
+    for number in range(3):
+        stage.submit(None, handled.append, number)
+
+    drain(stage, gate)
+
+    assert handled == expected
+    assert stage.dropped == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        InboundStage(logger, overflow="drop-all")
@@ -0,0 +1,91 @@
+import logging
+from mqtt_clients.leader_election import LeaderElection
+from state_machines.timer_service import SimulatedClock
+
+logger = logging.getLogger(__name__)
+
+
+def election(client_id, clock, changes=None):
+    heartbeats = []
+    on_change = None if changes is None else changes.append
+    elected = LeaderElection(client_id, heartbeats.append, logger, on_change=on_change,
+                             interval=1.0, timeout=3.0, clock=clock.now)
+    # Only the first heartbeat is sent by the thread, the tests call beat() instead
+    elected.start()
+    elected.stop()
+    heartbeats.clear()
+    return elected, heartbeats
+
+
+def test_no_leader_while_listening():
+    clock = SimulatedClock()
+    elected, heartbeats = election("b", clock)
+
+    elected.beat()
+    assert elected.leader() is None
+    assert heartbeats == [False]
+
+    clock.advance(3.5)
+    elected.beat()
+    assert elected.is_leader()
+
+
+def test_lowest_live_id_leads():
+    clock = SimulatedClock()
+    changes = []
+    elected, _ = election("b", clock, changes)
+    clock.advance(3.5)
+
+    elected.peer_seen("a")
+    elected.beat()
+    assert elected.leader() == "a"
+
+    # a stops sending heartbeats
+    clock.advance(3.5)
+    elected.beat()
+    assert elected.is_leader()
+    assert changes == ["a", "b"]
+
+
+def test_leader_is_sticky():
+    clock = SimulatedClock()
+    elected, heartbeats = election("b", clock)
+    clock.advance(3.5)
+    elected.beat()
+    assert elected.is_leader()
+
+    # A TA with a lower id joining later does not take over
+    elected.peer_seen("a", leading=False)
+    elected.beat()
+    assert elected.is_leader()
+    assert heartbeats[-1] is True
+
+
+def test_lowest_claimer_wins():
+    clock = SimulatedClock()
+    elected, _ = election("b", clock)
+    clock.advance(3.5)
+    elected.beat()
+
+    elected.peer_seen("a", leading=True)
+    assert elected.leader() == "a"
+
+
+def test_no_leader_while_disconnected():
+    clock = SimulatedClock()
+    changes = []
+    elected, heartbeats = election("a", clock, changes)
+    clock.advance(3.5)
+    elected.beat()
+
+    elected.set_connected(False)
+    elected.beat()
+    assert elected.leader() is None
+    assert heartbeats == [False]
+
+    # Listen again after reconnecting
+    elected.set_connected(True)
+    assert elected.leader() is None
+    clock.advance(3.5)
+    elected.beat()
+    assert changes == ["a", None, "a"]
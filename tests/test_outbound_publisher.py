@@ -0,0 +1,108 @@
+import logging
+import time
+from mqtt_clients.loopback import LoopbackTransport
+from mqtt_clients.outbound_publisher import ConflatingPublisher
+from mqtt_clients.outbound_spool import OutboundSpool
+
+logger = logging.getLogger(__name__)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def connected_client(transport):
+    client = transport.create_client()
+    transport.connect(client)
+    client.loop_start()
+    assert wait_for(client.is_connected)
+    return client
+
+
+def subscriber(transport, topic):
+    received = []
+    client = connected_client(transport)
+    client.on_message = lambda client, userdata, msg: received.append(msg.payload)
+    client.subscribe(topic, qos=1)
+    return client, received
+
+
+def test_pending_messages_of_a_conflated_command_are_replaced():
+    transport = LoopbackTransport(logger=logger)
+    listener, received = subscriber(transport, "queue")
+    client = connected_client(transport)
+    publisher = ConflatingPublisher(client, logger, linger=0.2)
+
+    for number in range(5):
+        publisher.publish("queue", "queue_snapshot", f"{number}".encode(), qos=1)
+    publisher.publish("queue", "request_help", b"help", qos=1)
+
+    assert wait_for(lambda: len(received) == 2)
+    assert received == [b"4", b"help"]
+    assert publisher.conflated == 4
+
+    publisher.stop()
+    client.loop_stop()
+    listener.loop_stop()
+
+
+def test_spool_keeps_messages_across_a_restart(tmp_path):
+    path = str(tmp_path / "group.spool")
+    spool = OutboundSpool(path, logger)
+    spool.append([("progress", "report_current_task", b"1", 1, False),
+                  ("presence", "ta_heartbeat", b"beat", 0, False)])
+    spool.close()
+
+    spool = OutboundSpool(path, logger)
+    assert spool.messages() == [("progress", "report_current_task", b"1", 1, False),
+                                ("presence", "ta_heartbeat", b"beat", 0, False)]
+    assert not spool.accepts("ta_heartbeat")
+    assert not spool.accepts("queue_snapshot")
+    assert spool.accepts("request_help")
+
+    spool.discard(1)
+    spool.close()
+    assert len(OutboundSpool(path, logger)) == 1
+
+
+def test_damaged_line_is_skipped(tmp_path):
+    path = tmp_path / "group.spool"
+    spool = OutboundSpool(str(path), logger)
+    spool.append([("progress", "report_current_task", b"1", 1, False)])
+    spool.close()
+    with open(path, "ab") as file:
+        file.write(b'{"topic": "progr')
+
+    assert len(OutboundSpool(str(path), logger)) == 1
+
+
+def test_messages_published_offline_are_spooled_and_replayed(tmp_path):
+    transport = LoopbackTransport(logger=logger)
+    listener, received = subscriber(transport, "#")
+    client = transport.create_client()
+    spool = OutboundSpool(str(tmp_path / "group.spool"), logger)
+    publisher = ConflatingPublisher(client, logger, spool=spool, online=False, linger=0.2)
+
+    publisher.publish("progress", "report_current_task", b"1", qos=1)
+    publisher.publish("progress", "report_current_task", b"2", qos=1)
+    publisher.publish("help", "request_help", b"help", qos=1)
+    publisher.publish("ta_update", "ta_heartbeat", b"beat", qos=0)
+    assert wait_for(lambda: len(spool) == 2)
+
+    transport.connect(client)
+    client.loop_start()
+    assert wait_for(client.is_connected)
+    publisher.set_online(True)
+
+    assert wait_for(lambda: len(received) == 2)
+    assert sorted(received) == [b"2", b"help"]
+    assert wait_for(lambda: len(spool) == 0)
+
+    publisher.stop()
+    client.loop_stop()
+    listener.loop_stop()
@@ -0,0 +1,73 @@
+from models.shared_state import (CHANGE_GETTING_HELP, CHANGE_GROUP_STATUS, CHANGE_RECEIVED_HELP,
+                                 CHANGE_REQUEST_HELP, CHANGE_TASKS, SharedState)
+
+
+def request(request_id, group, timestamp=1.0):
+    return {"id": request_id, "group": group, "description": "Help", "time": "10:00:00", "timestamp": timestamp}
+
+
+def session():
+    state = SharedState()
+    state.apply(CHANGE_GROUP_STATUS, {"group": "Team 1", "status": "Waiting for TAs to assign tasks..."})
+    state.apply(CHANGE_TASKS, {"tasks": [["Task one", "10"]]})
+    state.apply(CHANGE_REQUEST_HELP, request("a", "Team 1"))
+    return state
+
+
+def test_replay_of_changes_since_a_version():
+    state = session()
+    version, snapshot, changes = state.changes_since(None)
+    copy = SharedState.replay(version, snapshot, changes)
+
+    state.apply(CHANGE_GETTING_HELP, {"id": "a", "group": "Team 1", "description": "Help",
+                                      "time": "10:00:00", "ta": "Alice", "at": 2.0})
+
+    # Only the newer change is sent for a known version
+    version, snapshot, changes = state.changes_since(copy.version)
+    assert snapshot is None and len(changes) == 1
+
+    copy = SharedState.replay(version, copy.create_snapshot(), changes)
+    assert copy.create_snapshot() == state.create_snapshot()
+    assert copy.getting_help_rows() == [["Team 1", "Help", "10:00:00", "Alice"]]
+
+
+def test_unknown_version_gets_the_snapshot():
+    state = SharedState(max_changes=2)
+    for number in range(5):
+        state.apply(CHANGE_GROUP_STATUS, {"group": f"Team {number}", "status": "Done"})
+
+    version, snapshot, changes = state.changes_since(1)
+    copy = SharedState.replay(version, snapshot, changes)
+
+    assert snapshot is not None
+    assert copy.group_registry.rows() == state.group_registry.rows()
+
+
+def test_merge_adds_what_is_only_known_by_the_other_state():
+    state = session()
+    other = SharedState()
+    other.apply(CHANGE_GROUP_STATUS, {"group": "Team 2", "status": "Done"})
+    other.apply(CHANGE_REQUEST_HELP, request("b", "Team 2", timestamp=0.5))
+    other.apply(CHANGE_GROUP_STATUS, {"group": "Team 1", "status": "Done"})
+    version = state.version
+
+    state.merge(other)
+
+    assert state.version == version + 1
+    # Known entries are kept
+    assert state.group_registry.get("Team 1").status == "Task 1 in progress"
+    assert [entry.group for entry in state.help_queue.ordered()] == ["Team 2", "Team 1"]
+
+
+def test_finished_requests_are_not_requeued():
+    state = session()
+    state.apply(CHANGE_RECEIVED_HELP, {"id": "a", "group": "Team 1"})
+    state.apply(CHANGE_REQUEST_HELP, request("a", "Team 1"))
+
+    assert len(state.help_queue) == 0
+    assert state.finished == {"a": "Team 1"}
+
+    # A newer request of the group replaces the finished one
+    state.apply(CHANGE_REQUEST_HELP, request("b", "Team 1", timestamp=2.0))
+    assert state.finished == {}
+    assert state.help_queue.get_request("b").group == "Team 1"
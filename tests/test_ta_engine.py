@@ -0,0 +1,89 @@
+import logging
+import time
+import pytest
+from components.ta_engine import TaEngine
+from mqtt_clients.loopback import LoopbackTransport
+
+logger = logging.getLogger(__name__)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def transport():
+    return LoopbackTransport(logger=logger)
+
+
+@pytest.fixture
+def engines(transport):
+    started = []
+
+    def start(name):
+        engine = TaEngine(logger, transport=transport)
+        engine.login(name)
+        started.append(engine)
+        assert wait_for(lambda: engine.ta_mqtt_client.connected)
+        return engine
+
+    yield start
+
+    for engine in started:
+        engine.stop()
+
+
+def test_late_ta_gets_the_state(engines):
+    alice = engines("Alice")
+    alice.add_task("Task one", "10")
+    alice.handle_group_present(None, {"group": "Team 1"})
+    alice.submit_tasks()
+    alice.handle_request_help(None, {"group": "Team 1", "description": "Help", "time": "10:00:00",
+                                     "id": "request-1"})
+
+    bob = engines("Bob")
+
+    assert wait_for(lambda: bob.tasks_submitted and len(bob.help_queue) == 1)
+    assert bob.group_status_rows() == [["Team 1", "Task 1 in progress"]]
+    assert bob.help_queue_entries()[0][0] == "request-1"
+
+
+def test_late_ta_sharing_a_name_gets_the_state(engines):
+    first = engines("Alice")
+    first.add_task("Task one", "10")
+    first.handle_group_present(None, {"group": "Team 1"})
+    first.submit_tasks()
+
+    second = engines("Alice")
+
+    assert wait_for(lambda: second.tasks_submitted)
+    assert second.synced_versions == {first.ta_mqtt_client.client_id: first.state.version}
+
+
+def test_rejoining_group_keeps_its_status(engines):
+    alice = engines("Alice")
+    alice.add_task("Task one", "10")
+    alice.handle_group_present(None, {"group": "Team 1"})
+    alice.submit_tasks()
+    alice.handle_group_progress(None, {"group": "Team 1", "current_task": "2"})
+
+    # The group reconnects without the tasks
+    alice.handle_group_present(None, {"group": "Team 1"})
+
+    assert alice.group_status_rows() == [["Team 1", "Task 2 in progress"]]
+
+
+def test_requests_are_queued_in_the_order_they_arrive(engines):
+    alice = engines("Alice")
+    # The clock of the second group is behind, its request still comes last
+    alice.handle_request_help(None, {"group": "Team 1", "description": "Help", "time": "10:00:00",
+                                     "timestamp": 2000.0, "id": "request-1"})
+    alice.handle_request_help(None, {"group": "Team 2", "description": "Help", "time": "09:59:00",
+                                     "timestamp": 1000.0, "id": "request-2"})
+
+    assert [request_id for request_id, _ in alice.help_queue_entries()] == ["request-1", "request-2"]
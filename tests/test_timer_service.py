@@ -0,0 +1,85 @@
+import logging
+import random
+import time
+import pytest
+from state_machines.timer_service import HeapScheduler, SimulatedClock, TimerService
+from state_machines.timing_wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+SCHEDULERS = [TimingWheel, HeapScheduler]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_wheel_expires_the_same_timers_as_the_heap():
+    generator = random.Random(4115)
+    wheel, heap = TimingWheel(), HeapScheduler()
+    for scheduler in (wheel, heap):
+        scheduler.start(0.0)
+
+    for key in range(2000):
+        # Deadlines on ticks, from the first wheel to beyond the second
+        deadline = generator.randrange(1, 500000) * 0.01
+        wheel.add(key, deadline, key)
+        heap.add(key, deadline, key)
+        if generator.random() < 0.2:
+            wheel.cancel(key)
+            heap.cancel(key)
+
+    assert len(wheel) == len(heap)
+
+    now = 0.0
+    while len(heap):
+        now += generator.uniform(0, 200)
+        assert sorted(wheel.expire(now)) == sorted(heap.expire(now))
+        if len(heap):
+            # The wheel may wake up earlier to empty a slot of a wheel above, never later
+            assert wheel.next_deadline() <= heap.next_deadline() + 1e-9
+
+    assert len(wheel) == 0
+
+
+@pytest.mark.parametrize("scheduler", SCHEDULERS)
+def test_simulated_clock_jumps_to_the_timers(scheduler):
+    clock = SimulatedClock()
+    timers = TimerService(clock, logger, scheduler=scheduler())
+    fired = []
+
+    timers.call_later(3600, lambda: fired.append(("hour", clock.now())))
+    timers.call_later(5, lambda: fired.append(("late", clock.now())))
+    timers.call_later(1, lambda: fired.append(("first", clock.now())))
+
+    assert wait_for(lambda: len(fired) == 3)
+    timers.stop()
+
+    assert [name for name, _ in fired] == ["first", "late", "hour"]
+    assert fired[-1][1] == pytest.approx(3600)
+    assert timers.jumps >= 3
+
+
+@pytest.mark.parametrize("scheduler", SCHEDULERS)
+def test_restart_and_cancel_by_key(scheduler):
+    clock = SimulatedClock()
+    timers = TimerService(clock, logger, scheduler=scheduler(), jump=False)
+    fired = []
+
+    timers.call_later(1, lambda: fired.append("stopped"), key="light")
+    timers.call_later(2, lambda: fired.append("restarted"), key="light")
+    timers.call_later(1, lambda: fired.append("cancelled"), key="help")
+    timers.cancel("help")
+    assert timers.remaining("light") == pytest.approx(2)
+    assert timers.remaining("help") is None
+
+    timers.advance(2.5)
+    assert wait_for(lambda: fired)
+    timers.stop()
+
+    assert fired == ["restarted"]
@@ -0,0 +1,105 @@
+import logging
+import threading
+from components.ui_dispatcher import UiDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class FakeApp:
+    """ Runs the scheduled drain only when the test asks for the next frame """
+
+    def __init__(self):
+        self.scheduled = None
+
+    def after(self, interval, function):
+        self.scheduled = function
+
+    def frame(self):
+        function, self.scheduled = self.scheduled, None
+        function()
+
+
+def started(max_updates=1000):
+    dispatcher = UiDispatcher(logger, max_updates=max_updates)
+    app = FakeApp()
+    dispatcher.start(app)
+    return dispatcher, app
+
+
+def test_updates_of_a_widget_are_collapsed_to_the_latest():
+    dispatcher, app = started()
+    shown = []
+    dispatcher.post("label", shown.append, "first")
+    dispatcher.post(None, shown.append, "other")
+    dispatcher.post("label", shown.append, "latest")
+
+    app.frame()
+
+    # The collapsed update runs in the place of the first post
+    assert shown == ["latest", "other"]
+
+
+def test_rows_appended_in_one_frame_keep_their_order():
+    dispatcher, app = started()
+    table = []
+
+    def render(row, value):
+        # As the group status table: a new row is appended, a known one overwritten
+        if row >= len(table):
+            table.append(value)
+        else:
+            table[row] = value
+
+    dispatcher.post(("group_status", 0), render, 0, "team 1")
+    dispatcher.post(("group_status", 1), render, 1, "team 2")
+    dispatcher.post(("group_status", 0), render, 0, "team 1 updated")
+
+    app.frame()
+
+    assert table == ["team 1 updated", "team 2"]
+
+
+def test_main_thread_grows_past_the_bound():
+    dispatcher, app = started(max_updates=2)
+    shown = []
+    for number in range(3):
+        dispatcher.post(None, shown.append, number)
+
+    app.frame()
+
+    assert shown == [0, 1, 2]
+    assert dispatcher.overflowed == 1
+
+
+def test_other_threads_wait_for_the_next_frame():
+    dispatcher, app = started(max_updates=1)
+    shown = []
+    dispatcher.post(None, shown.append, "first")
+
+    poster = threading.Thread(target=dispatcher.post, args=(None, shown.append, "second"))
+    poster.start()
+    poster.join(0.1)
+    assert poster.is_alive()
+
+    app.frame()
+    poster.join(1.0)
+    app.frame()
+
+    assert shown == ["first", "second"]
+    assert dispatcher.overflowed == 0
+
+
+def test_stop_releases_waiting_threads_and_ignores_updates():
+    dispatcher, app = started(max_updates=1)
+    shown = []
+    dispatcher.post(None, shown.append, "first")
+
+    poster = threading.Thread(target=dispatcher.post, args=(None, shown.append, "second"))
+    poster.start()
+    dispatcher.stop()
+    poster.join(1.0)
+
+    assert not poster.is_alive()
+    dispatcher.post(None, shown.append, "third")
+    app.frame()
+    assert shown == []